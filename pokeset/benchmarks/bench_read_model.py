@@ -0,0 +1,85 @@
+# bench_read_model.py
+# Compares building the dashboard's rows from full Pokemon model instances
+# (with prefetched locations) against the read model in readmodel.py, for
+# profiles of a few sizes. Runs against a fresh test database; set
+# DJANGO_SETTINGS_MODULE to use a different database than settings.py's.
+
+import argparse
+import tracemalloc
+
+from common import best_of, report, report_speedup, setup_django, setup_test_database
+
+setup_django()
+
+from django.contrib.auth.models import User
+
+from pokedex import effectiveness, models, readmodel
+
+
+def create_profile(user, size):
+    profile = models.Profile.objects.create(name="bench %d" % size, user=user)
+    routes = models.Location.objects.bulk_create(
+        [models.Location(name="Route %d" % number, profile=profile) for number in range(25)])
+    types = [code for (code, label) in models.Type.choices]
+    models.Pokemon.objects.bulk_create(
+        [models.Pokemon(name="Pokemon %05d" % number, type_one=types[number % len(types)],
+                        type_two=types[(number * 7 + 1) % len(types)] if number % 3 else "",
+                        image_url="https://example.com/%d.png" % number, profile=profile)
+         for number in range(size)], batch_size=1000)
+    pokemon_ids = models.Pokemon.objects.filter(profile=profile).values_list("id", flat=True)
+    models.Findable.objects.bulk_create(
+        [models.Findable(pokemon_id=pokemon_id, location=routes[(pokemon_id + offset) % len(routes)])
+         for pokemon_id in pokemon_ids for offset in (0, 5)], batch_size=1000)
+    return profile
+
+
+# The dashboard's rows the way they were built before the read model.
+def model_rows(profile):
+    pokemon = models.Pokemon.objects.filter(profile=profile).order_by("name").prefetch_related("can_find_in")
+    pokemon = effectiveness.chart_for(profile).apply(pokemon)
+    return [(each.id, each.name, [location.name for location in each.can_find_in.all()], each.offensive_2) for each in pokemon]
+
+
+def read_model_rows(profile):
+    pokemon = readmodel.pokemon_rows(models.Pokemon.objects.filter(profile=profile).order_by("name"))
+    pokemon = effectiveness.chart_for(profile).apply(pokemon)
+    return [(each.id, each.name, each.locations, each.offensive_2) for each in pokemon]
+
+
+def peak_memory(func):
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000], help="Profile sizes to measure.")
+    parser.add_argument("--repeat", type=int, default=5, help="Rounds per measurement (the best is reported).")
+    args = parser.parse_args()
+
+    teardown = setup_test_database()
+    try:
+        user = User.objects.create_user("bench", "bench@example.com", "bench")
+        for size in args.sizes:
+            profile = create_profile(user, size)
+            assert model_rows(profile) == read_model_rows(profile)
+
+            print("Profile of %d Pokemon:" % size)
+            number = max(1, 1000 // size)
+            models_time = best_of(lambda: model_rows(profile), number=number, repeat=args.repeat)
+            read_model_time = best_of(lambda: read_model_rows(profile), number=number, repeat=args.repeat)
+            report("  model instances", models_time)
+            report("  read model", read_model_time)
+            report_speedup("  speed-up", models_time, read_model_time)
+            print("  %-43s %9.1f MB" % ("peak memory, model instances", peak_memory(lambda: model_rows(profile)) / 2**20))
+            print("  %-43s %9.1f MB" % ("peak memory, read model", peak_memory(lambda: read_model_rows(profile)) / 2**20))
+    finally:
+        teardown()
+
+
+if __name__ == "__main__":
+    main()
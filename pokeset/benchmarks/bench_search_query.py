@@ -0,0 +1,122 @@
+# bench_search_query.py
+# Compares answering a dashboard search (in the language of query.py) by
+# loading a profile's Pokemon and filtering them in Python, as the browser
+# used to, against the single SQL query the search compiles to, for
+# profiles of a few sizes. Runs against a fresh test database; set
+# DJANGO_SETTINGS_MODULE to use a different database than settings.py's.
+
+import argparse
+
+from common import best_of, report, report_speedup, setup_django, setup_test_database
+
+setup_django()
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from pokedex import dashboard, effectiveness, models, query
+
+SEARCHES = (
+    "type:FIR",
+    "loc:route* weak:WAT",
+    "type:FIR loc:route* learns:surf ability:levitate weak:WAT -type:BUG",
+)
+
+
+def create_profile(user, size):
+    profile = models.Profile.objects.create(name="bench %d" % size, user=user)
+    routes = models.Location.objects.bulk_create(
+        [models.Location(name="%s %d" % ("Route" if number % 2 else "Cave", number), profile=profile) for number in range(50)])
+    moves = models.Move.objects.bulk_create(
+        [models.Move(name="Surf" if number == 0 else "Move %d" % number, type="WAT", profile=profile) for number in range(100)])
+    abilities = models.Ability.objects.bulk_create(
+        [models.Ability(name="Levitate" if number == 0 else "Ability %d" % number, profile=profile) for number in range(50)])
+    types = [code for (code, label) in models.Type.choices]
+    models.Pokemon.objects.bulk_create(
+        [models.Pokemon(name="Pokemon %05d" % number, type_one=types[number % len(types)],
+                        type_two=types[(number * 7 + 1) % len(types)] if number % 3 else "", profile=profile)
+         for number in range(size)], batch_size=1000)
+    # bulk_create() skips save(), which sets the weakness bitmasks.
+    effectiveness.update_masks(profile)
+    pokemon_ids = models.Pokemon.objects.filter(profile=profile).values_list("id", flat=True)
+    models.Findable.objects.bulk_create(
+        [models.Findable(pokemon_id=pokemon_id, location=routes[(pokemon_id * 3 + offset) % len(routes)])
+         for pokemon_id in pokemon_ids for offset in (0, 7)], batch_size=1000)
+    models.Learnable.objects.bulk_create(
+        [models.Learnable(pokemon_id=pokemon_id, move=moves[(pokemon_id * 13 + offset) % len(moves)])
+         for pokemon_id in pokemon_ids for offset in range(4)], batch_size=1000)
+    models.Capable.objects.bulk_create(
+        [models.Capable(pokemon_id=pokemon_id, ability=abilities[pokemon_id % len(abilities)])
+         for pokemon_id in pokemon_ids], batch_size=1000)
+    return profile
+
+
+# A search answered in Python, over every Pokemon of the profile.
+def python_search(profile, text):
+    pokemon = models.Pokemon.objects.filter(profile=profile).prefetch_related("can_find_in", "can_learn", "abilities")
+    pokemon = effectiveness.chart_for(profile).apply(pokemon)
+    terms = query.parse(text)
+    return sorted(each.id for each in pokemon if all(matches(each, term) for term in terms))
+
+
+def matches(pokemon, term):
+    def name_matches(name, value):
+        if value.endswith("*"):
+            return name.lower().startswith(value.rstrip("*").lower())
+        return name.lower() == value.lower()
+
+    def one(value):
+        if term.key == "type":
+            return bool({pokemon.type_one, pokemon.type_two} & set(dashboard.matching_types(value.rstrip("*"))))
+        if term.key == "loc":
+            return any(name_matches(location.name, value) for location in pokemon.can_find_in.all())
+        if term.key == "learns":
+            return any(name_matches(move.name, value) for move in pokemon.can_learn.all())
+        if term.key == "ability":
+            return any(name_matches(ability.name, value) for ability in pokemon.abilities.all())
+        if term.key == "weak":
+            return bool(set(pokemon.offensive_4 + pokemon.offensive_2) & set(dashboard.matching_types(value.rstrip("*"))))
+        raise ValueError("Not supported here: %s" % term.key)
+
+    return any(one(value) for value in term.values) != term.negated
+
+
+def sql_search(profile, text):
+    pokemon = models.Pokemon.objects.filter(profile=profile).filter(query.compile_search(text))
+    return sorted(pokemon.values_list("id", flat=True))
+
+
+def count_queries(func):
+    with CaptureQueriesContext(connection) as queries:
+        func()
+    return len(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000], help="Profile sizes to measure.")
+    parser.add_argument("--repeat", type=int, default=3, help="Rounds per measurement (the best is reported).")
+    args = parser.parse_args()
+
+    teardown = setup_test_database()
+    try:
+        user = User.objects.create_user("bench", "bench@example.com", "bench")
+        for size in args.sizes:
+            profile = create_profile(user, size)
+            print("Profile of %d Pokemon:" % size)
+            for text in SEARCHES:
+                matching = sql_search(profile, text)
+                assert python_search(profile, text) == matching
+                print("  %s  (%d matching)" % (text, len(matching)))
+                python_time = best_of(lambda: python_search(profile, text), number=1, repeat=args.repeat)
+                sql_time = best_of(lambda: sql_search(profile, text), number=1, repeat=args.repeat)
+                report("    in Python (%d queries)" % count_queries(lambda: python_search(profile, text)), python_time)
+                report("    compiled (%d query)" % count_queries(lambda: sql_search(profile, text)), sql_time)
+                report_speedup("    speed-up", python_time, sql_time)
+    finally:
+        teardown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+# bench_startup.py
+# Measures what a fresh worker pays before it can serve anything: the time
+# to django.setup(), the time until its first request has been served, and
+# its peak RSS. Every run starts a new Python process, exactly like a new
+# manage.py, WSGI or ASGI worker would.
+#
+# Pass --max-first-request-ms and/or --max-rss-mb to fail (exit code 1)
+# when a worker goes over budget, e.g. in CI.
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+from common import BASE_DIR
+
+# Run inside each fresh process. Prints one JSON line of measurements.
+WORKER = r"""
+import json, os, resource, sys, time
+
+start = time.perf_counter()
+sys.path.insert(0, {base_dir!r})
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "pokeset.settings")
+
+import django
+django.setup()
+setup_done = time.perf_counter()
+
+entry_point = {entry_point!r}
+path = {path!r}
+if entry_point == "manage":
+    # What every manage.py command pays: setup, then loading the URLconf.
+    from django.urls import get_resolver
+    get_resolver().url_patterns
+    status = None
+elif entry_point == "wsgi":
+    from io import BytesIO
+    from pokeset.wsgi import application
+    result = {{}}
+    environ = {{
+        "REQUEST_METHOD": "GET", "PATH_INFO": path, "QUERY_STRING": "",
+        "SERVER_NAME": "localhost", "SERVER_PORT": "80", "HTTP_HOST": "localhost",
+        "wsgi.input": BytesIO(), "wsgi.errors": sys.stderr, "wsgi.url_scheme": "http",
+        "wsgi.version": (1, 0), "wsgi.multithread": False, "wsgi.multiprocess": True, "wsgi.run_once": False,
+    }}
+    body = b"".join(application(environ, lambda status, headers: result.setdefault("status", status)))
+    status = int(result["status"].split()[0])
+else:
+    import asyncio
+    from pokeset.asgi import application
+    messages = []
+    requested = []
+    async def receive():
+        # Send the (empty) request once, then wait like an idle client.
+        if requested:
+            await asyncio.Event().wait()
+        requested.append(True)
+        return {{"type": "http.request", "body": b"", "more_body": False}}
+    async def send(message):
+        messages.append(message)
+    scope = {{
+        "type": "http", "asgi": {{"version": "3.0"}}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"",
+        "headers": [(b"host", b"localhost")], "server": ("localhost", 80), "client": ("127.0.0.1", 1234),
+    }}
+    asyncio.run(application(scope, receive, send))
+    status = next(message["status"] for message in messages if message["type"] == "http.response.start")
+served = time.perf_counter()
+
+# ru_maxrss is in kilobytes on Linux, but in bytes on macOS.
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+rss_mb = rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+print(json.dumps({{
+    "setup_ms": (setup_done - start) * 1000,
+    "first_request_ms": (served - start) * 1000,
+    "rss_mb": rss_mb,
+    "status": status,
+}}))
+"""
+
+
+def measure(entry_point, path):
+    code = WORKER.format(base_dir=str(BASE_DIR), entry_point=entry_point, path=path)
+    process = subprocess.run([sys.executable, "-c", code], cwd=BASE_DIR, capture_output=True, text=True)
+    if process.returncode != 0:
+        raise SystemExit("The %s worker failed:\n%s" % (entry_point, process.stderr))
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5, help="Fresh processes per entry point.")
+    parser.add_argument("--path", default="/", help="Path of the first request.")
+    parser.add_argument("--max-first-request-ms", type=float, help="Fail if a worker's median time to its first request is higher.")
+    parser.add_argument("--max-rss-mb", type=float, help="Fail if a worker's median peak RSS is higher.")
+    args = parser.parse_args()
+
+    over_budget = False
+    print("%-8s %14s %20s %10s" % ("worker", "setup (ms)", "first request (ms)", "RSS (MB)"))
+    for entry_point in ("manage", "wsgi", "asgi"):
+        runs = [measure(entry_point, args.path) for i in range(args.runs)]
+        statuses = {run["status"] for run in runs if run["status"] is not None}
+        if statuses - {200}:
+            raise SystemExit("%s served %s for %s" % (entry_point, sorted(statuses), args.path))
+
+        setup_ms = statistics.median(run["setup_ms"] for run in runs)
+        first_request_ms = statistics.median(run["first_request_ms"] for run in runs)
+        rss_mb = statistics.median(run["rss_mb"] for run in runs)
+        print("%-8s %14.1f %20.1f %10.1f" % (entry_point, setup_ms, first_request_ms, rss_mb))
+
+        if args.max_first_request_ms is not None and first_request_ms > args.max_first_request_ms:
+            print("  %s takes longer than %.0f ms to serve its first request" % (entry_point, args.max_first_request_ms))
+            over_budget = True
+        if args.max_rss_mb is not None and rss_mb > args.max_rss_mb:
+            print("  %s uses more than %.0f MB" % (entry_point, args.max_rss_mb))
+            over_budget = True
+
+    if over_budget:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# bench_type_effectiveness.py
+# Compares the original pandas implementation of get_type_info() against
+# the compiled TypeChart engine, for one Pokemon and for a whole dashboard.
+# Pokeset itself no longer needs pandas; install it to run this benchmark.
+
+import argparse
+import itertools
+
+from common import best_of, report, report_speedup, setup_django
+
+setup_django()
+
+try:
+    import pandas as pd
+except ImportError:
+    raise SystemExit("This benchmark compares against pandas. Install it with: pip install pandas")
+
+from pokedex import effectiveness, models
+from pokedex.effectiveness import SUPER_EFFECTIVE, NOT_VERY_EFFECTIVE, NO_EFFECT
+
+default_chart = effectiveness.builtin_chart(models.Chart.GEN_2_5)
+
+type_chart = pd.DataFrame(default_chart.matrix, index=effectiveness.TYPE_CODES, columns=effectiveness.TYPE_CODES)
+
+
+# get_type_info() as it was before the engine: up to five .loc lookups per
+# type, for all 19 types.
+def legacy_get_type_info(pokemon):
+    pokemon.offensive_4 = []
+    pokemon.offensive_2 = []
+    pokemon.offensive_05 = []
+    pokemon.offensive_025 = []
+    pokemon.offensive_0 = []
+    defending = [pokemon.type_one, pokemon.type_two] if pokemon.type_two else [pokemon.type_one]
+    for (type, label) in models.Type.choices:
+        if abs(type_chart.loc[type, defending].product() - SUPER_EFFECTIVE) < 0.01:
+            pokemon.offensive_2.append(type)
+        elif abs(type_chart.loc[type, defending].product() - SUPER_EFFECTIVE*SUPER_EFFECTIVE) < 0.01:
+            pokemon.offensive_4.append(type)
+        elif abs(type_chart.loc[type, defending].product() - NOT_VERY_EFFECTIVE) < 0.01:
+            pokemon.offensive_05.append(type)
+        elif abs(type_chart.loc[type, defending].product() - NOT_VERY_EFFECTIVE*NOT_VERY_EFFECTIVE) < 0.01:
+            pokemon.offensive_025.append(type)
+        elif abs(type_chart.loc[type, defending].product() - NO_EFFECT) < 0.01:
+            pokemon.offensive_0.append(type)
+
+
+# Unsaved Pokemon cycling through every single and dual type combination.
+def make_pokemon(count):
+    codes = [code for code in effectiveness.TYPE_CODES]
+    combinations = [(one, "") for one in codes] + [(one, two) for (one, two) in itertools.permutations(codes, 2)]
+    return [models.Pokemon(name="Bench", type_one=one, type_two=two)
+            for (one, two) in itertools.islice(itertools.cycle(combinations), count)]
+
+
+def check_results_match(pokemon_list):
+    legacy = make_pokemon(len(pokemon_list))
+    for pokemon in legacy:
+        legacy_get_type_info(pokemon)
+    default_chart.apply(pokemon_list)
+    for (old, new) in zip(legacy, pokemon_list):
+        for (name, value) in effectiveness.BUCKETS:
+            if list(getattr(old, name)) != list(getattr(new, name)):
+                raise AssertionError("%s/%s differs in %s" % (old.type_one, old.type_two, name))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pokemon", type=int, default=300, help="Pokemon on the simulated dashboard.")
+    args = parser.parse_args()
+
+    pokemon_list = make_pokemon(args.pokemon)
+    check_results_match(pokemon_list)
+
+    single = pokemon_list[-1]
+    legacy_one = best_of(lambda: legacy_get_type_info(single), number=5)
+    engine_one = best_of(lambda: default_chart.apply([single]), number=1000)
+    report("pandas, one Pokemon", legacy_one)
+    report("TypeChart, one Pokemon", engine_one)
+    report_speedup("speedup", legacy_one, engine_one)
+
+    legacy_all = best_of(lambda: [legacy_get_type_info(pokemon) for pokemon in pokemon_list], number=1, repeat=3)
+    engine_all = best_of(lambda: default_chart.apply(pokemon_list), number=20)
+    report("pandas, %d Pokemon" % len(pokemon_list), legacy_all)
+    report("TypeChart, %d Pokemon (batch)" % len(pokemon_list), engine_all)
+    report_speedup("speedup", legacy_all, engine_all)
+
+
+if __name__ == "__main__":
+    main()
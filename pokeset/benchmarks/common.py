@@ -0,0 +1,49 @@
+# common.py
+# Helpers shared by the benchmark scripts in this folder. Run a benchmark
+# from the project folder, e.g. "python3 benchmarks/bench_type_effectiveness.py".
+
+import os
+import sys
+import timeit
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+# Makes the project importable and configures Django, so a benchmark can
+# use the models and views like manage.py would.
+def setup_django():
+    if str(BASE_DIR) not in sys.path:
+        sys.path.insert(0, str(BASE_DIR))
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "pokeset.settings")
+    import django
+    django.setup()
+
+
+# Creates an empty test database (like "manage.py test" does), for
+# benchmarks that need data. Returns a function that destroys it again.
+def setup_test_database():
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+    setup_test_environment()
+    old_name = connection.settings_dict["NAME"]
+    connection.creation.create_test_db(verbosity=0)
+
+    def teardown():
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+    return teardown
+
+
+# Best time, in seconds, of a single call to func over several rounds.
+# The minimum is the least noisy estimate of what the code itself costs.
+def best_of(func, number=10, repeat=5):
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+
+def report(label, seconds):
+    print("%-45s %12.3f ms" % (label, seconds * 1000))
+
+
+def report_speedup(label, baseline, candidate):
+    print("%-45s %12.1fx" % (label, baseline / candidate))
@@ -10,4 +10,9 @@ admin.site.register(models.Pokemon)
 admin.site.register(models.Learnable)
 admin.site.register(models.Findable)
 admin.site.register(models.Capable)
-admin.site.register(models.Ability)
\ No newline at end of file
+admin.site.register(models.Ability)
+admin.site.register(models.SpriteLookup)
+admin.site.register(models.UnknownSpecies)
+admin.site.register(models.Species)
+admin.site.register(models.ReferenceMove)
+admin.site.register(models.ReferenceAbility)
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class PokedexConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'pokedex'
+
+    def ready(self):
+        # Connect the signals that keep versions (and so cached pages and
+        # rows) up to date.
+        from . import versions
@@ -0,0 +1,241 @@
+# dashboard.py
+# The dashboard's table of Pokemon, served a page at a time. The table is
+# a DataTable (https://datatables.net) using server-side processing: for
+# every page, search or sort, it asks the dashboard_data view for just the
+# rows it shows, and searching, sorting and paging all happen in SQL.
+# See https://datatables.net/manual/server-side for the protocol.
+# The whole table can also be streamed as plain HTML, see stream_rows().
+
+import operator
+from functools import reduce
+
+from django.core.cache import cache
+from django.db.models import Exists, F, OuterRef, Q
+from django.db.models.lookups import GreaterThan
+from django.templatetags.static import static
+from django.urls import reverse
+from django.utils.html import escape, format_html
+from django.utils.safestring import mark_safe
+
+from . import effectiveness, models, query, readmodel, spritecache
+from .templatetags.poll_extras import typecolor
+
+# The most rows a single request can ask for.
+MAX_PAGE_LENGTH = 100
+
+# The table's columns, in order, and what sorting each column sorts by.
+COLUMNS = ("name", "types", "locations", "weaknesses")
+ORDERING = {
+    "name": ("name",),
+    "types": ("type_one", "type_two"),
+}
+
+
+# The type codes a word of a search could mean, e.g. "fi" -> FIG, FIR.
+def matching_types(word):
+    word = word.lower()
+    return [code for (code, label) in models.Type.choices
+            if code.lower().startswith(word) or label.lower().startswith(word)]
+
+
+# Pokemon with a type matching every word of "text", e.g. "fire flying".
+def type_filter(text):
+    condition = Q()
+    for word in text.split():
+        codes = matching_types(word)
+        condition &= Q(type_one__in=codes) | Q(type_two__in=codes)
+    return condition
+
+
+# Pokemon that can be found in a location whose name starts with "text".
+def location_filter(text):
+    return Q(Exists(models.Findable.objects.filter(pokemon=OuterRef("pk"), location__name__istartswith=text)))
+
+
+# Pokemon taking damage in one of "buckets" from attacks of a type, e.g.
+# bucket_filter("WAT", effectiveness.WEAK) for those weak to Water. A
+# single predicate on the Pokemon's stored bitmasks, rather than working
+# out every Pokemon's weaknesses in Python.
+def bucket_filter(type, buckets):
+    mask = reduce(lambda masks, field: masks.bitor(field),
+                  [F(effectiveness.MASK_FIELDS[name]) for name in buckets])
+    return Q(GreaterThan(mask.bitand(effectiveness.type_bit(type)), 0))
+
+
+# Pokemon weak to a type matching every word of "text", e.g. "water".
+def weakness_filter(text):
+    condition = Q()
+    for word in text.split():
+        codes = matching_types(word)
+        if not codes:
+            return Q(pk__in=[])
+        condition &= reduce(operator.or_, [bucket_filter(code, effectiveness.WEAK) for code in codes])
+    return condition
+
+
+# Narrows "pokemon" down to those matching the searches. Names and
+# locations match by prefix (case-insensitively), so the indexes on them
+# can be used, types by code or name, and weaknesses by attacking type.
+def search(pokemon, name="", type="", location="", weakness=""):
+    if name:
+        pokemon = pokemon.filter(name__istartswith=name)
+    if type:
+        pokemon = pokemon.filter(type_filter(type))
+    if location:
+        pokemon = pokemon.filter(location_filter(location))
+    if weakness:
+        pokemon = pokemon.filter(weakness_filter(weakness))
+    return pokemon
+
+
+def _int(value, default):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+# Answers a DataTables server-side processing request ("params" is the
+# request's GET parameters) for the table of a profile's Pokemon. The
+# table's own search box takes a search in the language of query.py. Takes
+# a fixed number of queries, however big the profile or page is.
+def table_page(profile, params):
+    # Echoed back as a number, as the protocol asks, so it can't carry
+    # anything into the page.
+    draw = _int(params.get("draw"), 0)
+    all_pokemon = models.Pokemon.objects.filter(profile=profile)
+    try:
+        condition = query.compile_search(params.get("search[value]", ""), profile)
+    except query.QueryError as error:
+        return {"draw": draw, "error": str(error)}
+    matching = search(
+        all_pokemon,
+        name=params.get("columns[0][search][value]", "").strip(),
+        type=params.get("columns[1][search][value]", "").strip(),
+        location=params.get("columns[2][search][value]", "").strip(),
+        weakness=params.get("columns[3][search][value]", "").strip(),
+    ).filter(condition)
+
+    ordering = []
+    for index in range(len(COLUMNS)):
+        column = _int(params.get("order[%d][column]" % index), None)
+        if column is None or not 0 <= column < len(COLUMNS):
+            break
+        prefix = "-" if params.get("order[%d][dir]" % index) == "desc" else ""
+        ordering += [prefix + field for field in ORDERING.get(COLUMNS[column], ())]
+    # Always end on a unique field, so pages never overlap.
+    ordering.append("id")
+
+    start = max(_int(params.get("start"), 0), 0)
+    length = _int(params.get("length"), 10)
+    if not 0 < length <= MAX_PAGE_LENGTH:
+        length = MAX_PAGE_LENGTH
+    page = list(matching.order_by(*ordering).values_list("id", "updated_at")[start:start + length])
+
+    return {
+        "draw": draw,
+        "recordsTotal": all_pokemon.count(),
+        "recordsFiltered": matching.count(),
+        "data": rows(profile, page, spritecache.current_atlas(profile.id)),
+    }
+
+
+# How many seconds rendered rows are cached for.
+ROW_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+# The rows of the table for these Pokemon, given as (id, updated_at)
+# pairs, in the same order, as {column: HTML}. Rows are cached under the
+# Pokemon's updated_at (which goes up whenever it, or anything shown in its
+# row, changes, see versions.py) and the profile's type chart, so only the
+# rows of Pokemon that changed since they were last shown are made again;
+# making those takes two queries. As the keys come from the database, rows
+# are never stale, whether the cache (settings.CACHES) is shared by all
+# processes or kept by each. Unless "store" is off, rows that had to be
+# made are cached too.
+def rows(profile, pokemon, atlas=None, store=True):
+    chart_version = profile.type_chart_version or profile.type_chart
+    keys = {pokemon_id: "pokedex:dashboard-row:%d:%s:%s" % (pokemon_id, updated_at.timestamp(), chart_version)
+            for (pokemon_id, updated_at) in pokemon}
+    pokemon_ids = list(keys)
+    cached = cache.get_many(keys.values())
+
+    missing = [pokemon_id for pokemon_id in pokemon_ids if keys[pokemon_id] not in cached]
+    if missing:
+        records = readmodel.pokemon_rows(models.Pokemon.objects.filter(id__in=missing))
+        effectiveness.chart_for(profile).apply(records)
+        made = {keys[record.id]: _render(record) for record in records}
+        if store:
+            cache.set_many(made, ROW_CACHE_TIMEOUT)
+        cached.update(made)
+
+    # Pokemon deleted meanwhile are left out.
+    return [_cells(pokemon_id, cached[keys[pokemon_id]], atlas) for pokemon_id in pokemon_ids if keys[pokemon_id] in cached]
+
+
+# The parts of a Pokemon's row (from a readmodel.PokemonRow with its
+# weaknesses applied) worth caching: all but the sprite, which depends on
+# the profile's current atlas.
+def _render(pokemon):
+    types = typecolor(pokemon.type_one)
+    if pokemon.type_two:
+        types += " " + typecolor(pokemon.type_two)
+
+    return {
+        "name": pokemon.name,
+        "image_url": pokemon.image_url,
+        "types": '<div class="pokemon_types_dashboard">%s</div>' % types,
+        "locations": escape(" ".join(pokemon.locations)),
+        "weaknesses": '<div class="pokemon_types_dashboard">%s</div>' % " ".join(
+            typecolor(type) for type in pokemon.offensive_2 + pokemon.offensive_4),
+    }
+
+
+def _cells(pokemon_id, parts, atlas):
+    image_url = parts["image_url"]
+    cell = atlas.cell(image_url) if atlas is not None else None
+    if cell is not None:
+        sprite = format_html('<span class="atlas_sprite sprite_cell_{}"></span>', cell)
+    elif image_url:
+        sprite = format_html('<img src="{}" loading="lazy">', spritecache.sprite_url(pokemon_id, image_url, 64))
+    else:
+        sprite = format_html('<img src="{}">', static("canvas.png"))
+
+    return {
+        "DT_RowAttr": {"data-href": reverse("detailed", args=[pokemon_id])},
+        "name": format_html('<div id="name_col">{}{}</div>', sprite, parts["name"]),
+        "types": parts["types"],
+        "locations": parts["locations"],
+        "weaknesses": parts["weaknesses"],
+    }
+
+
+# How many Pokemon stream_rows() loads at a time.
+STREAM_CHUNK_SIZE = 500
+
+
+# Every Pokemon of a profile as rows of an HTML table, sorted by name, for
+# rendering a whole table as it is produced. Pokemon are loaded a chunk at
+# a time (continuing after the last name seen, which the (profile, name)
+# index makes cheap), so memory use doesn't grow with the profile. Yields
+# the rows of one chunk at a time. Rows already cached are used, but rows
+# made here aren't cached, so streaming a large profile can't push every
+# other entry out of the cache.
+def stream_rows(profile, atlas=None):
+    pokemon = models.Pokemon.objects.filter(profile=profile).order_by("name", "id")
+    after = Q()
+    while True:
+        chunk = list(pokemon.filter(after).values_list("id", "updated_at", "name")[:STREAM_CHUNK_SIZE])
+        if not chunk:
+            return
+        yield "".join(row_html(cells) for cells in rows(profile, [(pokemon_id, updated_at) for (pokemon_id, updated_at, name) in chunk], atlas, store=False))
+        (last_id, last_updated_at, last_name) = chunk[-1]
+        after = Q(name__gt=last_name) | Q(name=last_name, id__gt=last_id)
+
+
+# A row of the table (as made by rows()) as a <tr>.
+def row_html(cells):
+    return format_html(
+        '<tr onclick="location.href=\'{}\'"><td width="30%">{}</td><td width="20%">{}</td><td>{}</td><td width="30%">{}</td></tr>\n',
+        cells["DT_RowAttr"]["data-href"], mark_safe(cells["name"]), mark_safe(cells["types"]),
+        mark_safe(cells["locations"]), mark_safe(cells["weaknesses"]))
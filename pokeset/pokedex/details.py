@@ -0,0 +1,153 @@
+# details.py
+# The detailed view's precomputed documents (see models.PokemonDetail).
+# A document holds everything the page shows about a Pokemon, so showing
+# it reads one row, rather than querying evolutions, locations, abilities
+# and moves and working out weaknesses on every view.
+#
+# Documents are written through: whenever a Pokemon or its relations
+# change (see versions.py), its document is deleted straight away and made
+# again once the change commits. A missing document, or one made with an
+# older type chart, is made on the spot by document(). The rebuild_details
+# command makes every document again.
+
+from collections import defaultdict, namedtuple
+
+from django.db import connection, transaction
+from django.db.models import Q
+
+from . import effectiveness, models
+
+# Another Pokemon, as the page shows it (its evolutions).
+PokemonRef = namedtuple("PokemonRef", ("id", "name", "image_url"))
+MoveRef = namedtuple("MoveRef", ("name", "type"))
+
+
+# A document as read by the template, e.g. {{ pokemon_data.name }}, with
+# the same names as a Pokemon has where it has them.
+class Detail:
+
+    def __init__(self, document):
+        self.__dict__.update(document)
+        self.evolves_from = PokemonRef(*self.evolves_from) if self.evolves_from else None
+        self.evolves_into = [PokemonRef(*pokemon) for pokemon in self.evolves_into]
+        self.moves = [MoveRef(*move) for move in self.moves]
+
+    def __repr__(self):
+        return "<Detail %d: %s>" % (self.id, self.name)
+
+
+def _chart_version(profile):
+    return profile.type_chart_version or profile.type_chart
+
+
+# The documents of these Pokemon, as {id: (document, chart version,
+# version)}, where the version is that of the Pokemon's profile when they
+# were read. Seven queries, however many Pokemon.
+def build(pokemon_ids):
+    fields = ("id", "name", "description", "image_url", "type_one", "type_two", "profile_id", "profile__version",
+              "evolves_from_id", "evolves_from__name", "evolves_from__image_url")
+    pokemon = list(models.Pokemon.objects.filter(id__in=pokemon_ids).values(*fields))
+    if not pokemon:
+        return {}
+    pokemon_ids = [values["id"] for values in pokemon]
+
+    evolves_into = defaultdict(list)
+    for (pokemon_id, name, image_url, evolves_from_id) in models.Pokemon.objects.filter(
+            evolves_from__in=pokemon_ids).order_by("id").values_list("id", "name", "image_url", "evolves_from_id"):
+        evolves_into[evolves_from_id].append((pokemon_id, name, image_url))
+    locations = defaultdict(list)
+    for (pokemon_id, name) in models.Findable.objects.filter(
+            pokemon__in=pokemon_ids).order_by("id").values_list("pokemon_id", "location__name"):
+        locations[pokemon_id].append(name)
+    abilities = defaultdict(list)
+    for (pokemon_id, name) in models.Capable.objects.filter(
+            pokemon__in=pokemon_ids).order_by("id").values_list("pokemon_id", "ability__name"):
+        abilities[pokemon_id].append(name)
+    moves = defaultdict(list)
+    for (pokemon_id, name, type) in models.Learnable.objects.filter(
+            pokemon__in=pokemon_ids).order_by("id").values_list("pokemon_id", "move__name", "move__type"):
+        moves[pokemon_id].append((name, type))
+
+    profiles = models.Profile.objects.in_bulk({values["profile_id"] for values in pokemon})
+    documents = {}
+    for values in pokemon:
+        profile = profiles[values["profile_id"]]
+        (buckets,) = effectiveness.chart_for(profile).classify([(values["type_one"], values["type_two"])])
+        evolves_from = None
+        if values["evolves_from_id"] is not None:
+            evolves_from = (values["evolves_from_id"], values["evolves_from__name"], values["evolves_from__image_url"])
+        document = {
+            "id": values["id"],
+            "name": values["name"],
+            "description": values["description"],
+            "image_url": values["image_url"],
+            "type_one": values["type_one"],
+            "type_two": values["type_two"],
+            "profile_id": values["profile_id"],
+            "evolves_from": evolves_from,
+            "evolves_into": evolves_into[values["id"]],
+            "locations": locations[values["id"]],
+            "abilities": abilities[values["id"]],
+            "moves": moves[values["id"]],
+        }
+        document.update((name, list(types)) for (name, types) in buckets.items())
+        documents[values["id"]] = (document, _chart_version(profile), values["profile__version"])
+    return documents
+
+
+# Makes and saves the documents of these Pokemon. Returns them as {id:
+# (document, chart version)}.
+#
+# Documents are upserted, so two processes rebuilding the same Pokemon
+# don't both insert it. A document whose profile changed since it was read
+# may be stale, and isn't saved: the change forgot it, and it is made again
+# by that change (or when next read). The profiles are locked until the
+# documents are saved, so a change can't commit in between.
+def rebuild(pokemon_ids):
+    documents = build(pokemon_ids)
+    with transaction.atomic():
+        profile_ids = {document["profile_id"] for (document, chart_version, version) in documents.values()}
+        versions = dict(models.Profile.objects.select_for_update().filter(id__in=profile_ids).values_list("id", "version"))
+        # MySQL upserts on any unique key, and can't be told which.
+        supports_target = connection.features.supports_update_conflicts_with_target
+        models.PokemonDetail.objects.bulk_create(
+            [models.PokemonDetail(pokemon_id=pokemon_id, document=document, chart_version=chart_version)
+             for (pokemon_id, (document, chart_version, version)) in documents.items()
+             if versions.get(document["profile_id"]) == version],
+            update_conflicts=True, unique_fields=["pokemon"] if supports_target else None,
+            update_fields=["document", "chart_version"])
+    return {pokemon_id: (document, chart_version)
+            for (pokemon_id, (document, chart_version, version)) in documents.items()}
+
+
+# Forgets the documents of these Pokemon, so they are made again when next
+# read (or rebuilt, see versions.py).
+def forget(pokemon_ids):
+    pokemon_ids = list(pokemon_ids)
+    if pokemon_ids:
+        models.PokemonDetail.objects.filter(pokemon__in=pokemon_ids).delete()
+
+
+# These Pokemon and the Pokemon they evolve from or into, whose documents
+# show them.
+def with_evolutions(pokemon_ids):
+    pokemon_ids = set(pokemon_ids)
+    related = models.Pokemon.objects.filter(Q(id__in=pokemon_ids) | Q(evolves_from__in=pokemon_ids))
+    for (pokemon_id, evolves_from_id) in related.values_list("id", "evolves_from_id"):
+        pokemon_ids.add(pokemon_id)
+        if evolves_from_id is not None:
+            pokemon_ids.add(evolves_from_id)
+    return pokemon_ids
+
+
+# The Detail of a Pokemon (looked up with select_related("detail"), so this
+# takes no queries while its document is current).
+def document(pokemon):
+    try:
+        detail = pokemon.detail
+    except models.PokemonDetail.DoesNotExist:
+        detail = None
+    if detail is None or detail.chart_version != _chart_version(pokemon.profile):
+        (document, chart_version) = rebuild([pokemon.id])[pokemon.id]
+        return Detail(document)
+    return Detail(detail.document)
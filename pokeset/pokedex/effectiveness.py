@@ -0,0 +1,202 @@
+# effectiveness.py
+# Type effectiveness engine. A type chart is compiled once into an
+# integer-indexed NumPy matrix, and every single/dual type combination is
+# bucketed up front, so looking up a Pokemon's weaknesses and resistances
+# is an index operation rather than a search. Compiled charts are cached
+# per process under their version, see chart_for().
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from . import models, type_charts
+from .type_charts import SUPER_EFFECTIVE, NORMAL_EFFECTIVE, NOT_VERY_EFFECTIVE, NO_EFFECT
+
+# Rows and columns of a compiled chart follow the order of models.Type.
+TYPE_CODES = tuple(code for (code, label) in models.Type.choices)
+TYPE_INDEX = {code: index for (index, code) in enumerate(TYPE_CODES)}
+
+# Index used for a missing second type. Its column is all neutral, so a
+# single-typed Pokemon can be looked up exactly like a dual-typed one.
+NO_TYPE = len(TYPE_CODES)
+
+# The attributes attached to a Pokemon by TypeChart.apply(), and the total
+# damage multiplier each of them collects.
+BUCKETS = (
+    ("offensive_4",   SUPER_EFFECTIVE * SUPER_EFFECTIVE),
+    ("offensive_2",   SUPER_EFFECTIVE),
+    ("offensive_05",  NOT_VERY_EFFECTIVE),
+    ("offensive_025", NOT_VERY_EFFECTIVE * NOT_VERY_EFFECTIVE),
+    ("offensive_0",   NO_EFFECT),
+)
+
+# Multipliers are products of at most two chart entries, so anything this
+# close to a bucket's value belongs to that bucket.
+TOLERANCE = 0.01
+
+
+def type_index(code):
+    # Blank (or unknown) second types map onto the neutral column.
+    return TYPE_INDEX.get(code, NO_TYPE)
+
+
+# A bucket's types can also be stored as a bitmask, with one bit per type
+# (see Pokemon.offensive_2_mask and the like). This is the bit of a type.
+def type_bit(code):
+    return 1 << TYPE_INDEX[code]
+
+
+# The Pokemon field holding each bucket's bitmask.
+MASK_FIELDS = {name: name + "_mask" for (name, multiplier) in BUCKETS}
+
+# The buckets a Pokemon is weak to, resists, or is immune to a type in.
+WEAK = ("offensive_4", "offensive_2")
+RESISTS = ("offensive_05", "offensive_025")
+IMMUNE = ("offensive_0",)
+
+
+class TypeChart:
+
+    def __init__(self, matrix):
+        # matrix[attacking][defending] is the multiplier a move of the
+        # attacking type does against a Pokemon of the defending type.
+        size = len(TYPE_CODES)
+        matrix = np.asarray(matrix, dtype=np.float32)
+        if matrix.shape != (size, size):
+            raise ValueError("A type chart must be %d x %d, not %s." % (size, size, matrix.shape))
+
+        padded = np.ones((size, size + 1), dtype=np.float32)
+        padded[:, :size] = matrix
+
+        # combined[attacking, type_one, type_two] is the total multiplier
+        # against every possible single/dual type combination.
+        combined = padded[:, :, np.newaxis] * padded[:, np.newaxis, :]
+        combined.setflags(write=False)
+        self.matrix = padded[:, :size]
+        self.matrix.setflags(write=False)
+        self.combined = combined
+
+        # Pre-bucket every combination, so classifying a Pokemon is a lookup.
+        codes = np.array(TYPE_CODES, dtype=object)
+        masks = [(name, np.isclose(combined, value, atol=TOLERANCE)) for (name, value) in BUCKETS]
+        bits = np.array([1 << index for index in range(size)], dtype=object)
+        self._table = {}
+        self._masks = {}
+        for one in range(size + 1):
+            for two in range(size + 1):
+                self._table[one, two] = {name: tuple(codes[mask[:, one, two]]) for (name, mask) in masks}
+                self._masks[one, two] = {MASK_FIELDS[name]: int(bits[mask[:, one, two]].sum())
+                                         for (name, mask) in masks}
+
+    # The total multiplier of every attacking type against each of the
+    # given (type_one, type_two) pairs, as a (pairs x types) array.
+    def multipliers(self, pairs):
+        ones, twos = self._indices(pairs)
+        return self.combined[:, ones, twos].T
+
+    # The bucketed weaknesses and resistances of each (type_one, type_two)
+    # pair, as one {bucket name: types} dict per pair.
+    def classify(self, pairs):
+        ones, twos = self._indices(pairs)
+        table = self._table
+        return [table[one, two] for (one, two) in zip(ones.tolist(), twos.tolist())]
+
+    # The bucket bitmasks of each (type_one, type_two) pair, as one {mask
+    # field: mask} dict per pair.
+    def masks(self, pairs):
+        ones, twos = self._indices(pairs)
+        table = self._masks
+        return [table[one, two] for (one, two) in zip(ones.tolist(), twos.tolist())]
+
+    # Attaches the bucket attributes (offensive_4, offensive_2, ...) to each
+    # of the given Pokemon. Accepts a list or a queryset, and evaluates the
+    # queryset only once.
+    def apply(self, pokemon_list):
+        pokemon_list = list(pokemon_list)
+        pairs = [(pokemon.type_one, pokemon.type_two) for pokemon in pokemon_list]
+        for (pokemon, buckets) in zip(pokemon_list, self.classify(pairs)):
+            for (name, types) in buckets.items():
+                setattr(pokemon, name, types)
+        return pokemon_list
+
+    def _indices(self, pairs):
+        pairs = list(pairs)
+        ones = np.fromiter((TYPE_INDEX[one] for (one, two) in pairs), dtype=np.intp, count=len(pairs))
+        twos = np.fromiter((type_index(two) for (one, two) in pairs), dtype=np.intp, count=len(pairs))
+        return ones, twos
+
+
+# Compiles a chart in the {attacking: {defending: multiplier}} format of
+# type_charts.py. Entries for types Pokeset doesn't know are ignored.
+def compile_chart(chart):
+    matrix = np.full((len(TYPE_CODES), len(TYPE_CODES)), NORMAL_EFFECTIVE, dtype=np.float32)
+    for (attacking, matchups) in chart.items():
+        for (defending, multiplier) in matchups.items():
+            if attacking in TYPE_INDEX and defending in TYPE_INDEX:
+                matrix[TYPE_INDEX[attacking], TYPE_INDEX[defending]] = multiplier
+    return TypeChart(matrix)
+
+
+# How many custom charts to keep compiled at once. Built-in charts are
+# always kept.
+CUSTOM_CHART_CACHE_SIZE = 64
+
+_builtin_charts = {}
+_custom_charts = OrderedDict()
+_lock = threading.Lock()
+
+
+# The compiled built-in chart with this code (see models.Chart).
+def builtin_chart(code):
+    chart = _builtin_charts.get(code)
+    if chart is None:
+        with _lock:
+            chart = _builtin_charts.get(code)
+            if chart is None:
+                chart = _builtin_charts[code] = compile_chart(type_charts.BUILTIN_CHARTS[code])
+    return chart
+
+
+# The compiled chart a Profile uses. Each distinct chart is compiled once
+# per process, however many profiles or requests use it.
+def chart_for(profile):
+    if profile.type_chart != models.Chart.CUSTOM:
+        return builtin_chart(profile.type_chart)
+
+    custom_chart = profile.custom_type_chart or {}
+    version = profile.type_chart_version or type_charts.chart_version(profile.type_chart, custom_chart)
+    with _lock:
+        chart = _custom_charts.get(version)
+        if chart is not None:
+            _custom_charts.move_to_end(version)
+            return chart
+    # Compile outside the lock; at worst two threads compile the same chart.
+    chart = compile_chart(custom_chart)
+    with _lock:
+        _custom_charts[version] = chart
+        while len(_custom_charts) > CUSTOM_CHART_CACHE_SIZE:
+            _custom_charts.popitem(last=False)
+    return chart
+
+
+# Sets the bucket bitmasks of the given Pokemon (of this profile) from their
+# types, ready to be saved.
+def set_masks(profile, pokemon_list):
+    pokemon_list = list(pokemon_list)
+    pairs = [(pokemon.type_one, pokemon.type_two) for pokemon in pokemon_list]
+    for (pokemon, masks) in zip(pokemon_list, chart_for(profile).masks(pairs)):
+        for (field, mask) in masks.items():
+            setattr(pokemon, field, mask)
+    return pokemon_list
+
+
+# Works out the stored bucket bitmasks of every Pokemon of a profile again,
+# e.g. once its type chart changes. One update per pair of types in use.
+def update_masks(profile, pokemon=None):
+    if pokemon is None:
+        pokemon = models.Pokemon.objects.all()
+    pokemon = pokemon.filter(profile=profile.id)
+    pairs = list(pokemon.values_list("type_one", "type_two").distinct().order_by())
+    for ((one, two), masks) in zip(pairs, chart_for(profile).masks(pairs)):
+        pokemon.filter(type_one=one, type_two=two).update(**masks)
@@ -2,8 +2,8 @@ from site import USER_BASE
 from django import forms
 from django.contrib.auth.forms import AuthenticationForm, UserCreationForm
 from django.contrib.auth.models import User
-from . import models
-from django.db import IntegrityError
+from . import mirror, models, sprites
+from django.db import IntegrityError, transaction
 from django.core.exceptions import ValidationError
 from django.forms import ModelForm
 
@@ -67,12 +67,17 @@ class NewProfileForm(ModelForm):
 
 	class Meta:
 		model = models.Profile
-		fields = ["user", "name", "description"] 
+		fields = ["user", "name", "description", "type_chart", "custom_type_chart"] 
 		widgets = {
 
 			"description": forms.TextInput(attrs = {
 				"size": "50"
 			}),
+			"custom_type_chart": forms.Textarea(attrs = {
+				"rows": "4",
+				"cols": "50",
+				"placeholder": '{"FIR": {"GRA": 2, "WAT": 0.5}}'
+			}),
 		}
 
 
@@ -84,6 +89,25 @@ class NewPokemonForm(ModelForm):
 		self.fields["profile"].initial = self._profile
 		self.fields["profile"].disabled = True
 
+	# Only has an effect for species in the local mirror of PokeAPI. Off
+	# unless asked for, as it replaces the types the user picked (e.g. in a
+	# randomizer, which changes them).
+	autofill = forms.BooleanField(required=False, initial=False,
+				   label="Replace the types, and add the moves and abilities, with those from the original games")
+
+	def save(self, commit=True):
+		if not commit:
+			return super().save(commit)
+		with transaction.atomic():
+			pokemon = super().save(commit)
+			if self.cleaned_data.get("autofill"):
+				mirror.autofill(pokemon)
+		# Look up (and download) the new Pokemon's sprite in the background,
+		# and put it in its profile's sprite atlas. Species in the local
+		# mirror of PokeAPI are looked up without a request.
+		sprites.queue_lookup(pokemon)
+		return pokemon
+
 	class Meta:
 		model = models.Pokemon
 		fields = ["profile", "name", "description", "type_one", "type_two"]
@@ -121,6 +145,16 @@ class EditPokemonForm(ModelForm):
 			self.fields["can_find_in"].queryset = models.Location.objects.filter(profile=self.instance.profile)
 			self.fields["abilities"].queryset = models.Ability.objects.filter(profile=self.instance.profile)
 
+	def save(self, commit=True):
+		# A renamed Pokemon is (probably) a different species, so drop its
+		# old sprite and look up the new one in the background.
+		renamed = "name" in self.changed_data
+		if renamed:
+			self.instance.image_url = ""
+		pokemon = super().save(commit)
+		if commit and renamed:
+			sprites.queue_lookup(pokemon)
+		return pokemon
 
 	class Meta:
 		model = models.Pokemon
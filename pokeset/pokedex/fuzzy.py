@@ -0,0 +1,158 @@
+# fuzzy.py
+# Typo-tolerant search over the names in a profile (its Pokemon, locations,
+# moves and abilities), for randomizer players who misspell them. Names are
+# broken into trigrams, like PostgreSQL's pg_trgm: "Zubat" has "  z", " zu",
+# "zub", "uba", "bat" and "at ". A search is ranked by how many trigrams it
+# shares with each name (their Jaccard similarity), so "Zubta" still finds
+# "Zubat".
+#
+# Each process keeps an index per profile in memory, made the first time
+# the profile is searched (four queries). The index is kept under the
+# profile's names_version: names added, changed or deleted in this process
+# are put into it as their change commits (see versions.py); a change made
+# by another process shows up as a newer names_version, and the index is
+# made again on the next search.
+
+import heapq
+import re
+import threading
+from collections import OrderedDict, defaultdict
+
+from django.db import transaction
+
+from . import models
+
+# What can be searched for, by the kind of thing named.
+KINDS = {
+    "pokemon": models.Pokemon,
+    "location": models.Location,
+    "move": models.Move,
+    "ability": models.Ability,
+}
+
+# The most results a search gives.
+MAX_RESULTS = 50
+
+# How many profiles' indexes a process keeps at once.
+INDEX_CACHE_SIZE = 32
+
+# Names sharing less of their trigrams with a search than this aren't
+# results. pg_trgm's default.
+SIMILARITY_THRESHOLD = 0.3
+
+WORD = re.compile(r"\w+")
+
+
+# The trigrams of a text, e.g. "Zubat" -> {"  z", " zu", "zub", "uba",
+# "bat", "at "}. Each word is padded so its start and end count double.
+def trigrams(text):
+    found = set()
+    for word in WORD.findall(text.lower()):
+        padded = "  " + word + " "
+        found.update(padded[start:start + 3] for start in range(len(padded) - 2))
+    return found
+
+
+# The names of one profile, by trigram.
+class TrigramIndex:
+
+    def __init__(self, names_version):
+        self.names_version = names_version
+        # (kind, id) -> (name, trigrams)
+        self._names = {}
+        # trigram -> {(kind, id)}
+        self._postings = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._names)
+
+    # Adds, renames or (with no name) removes a named thing.
+    def set(self, kind, object_id, name):
+        key = (kind, object_id)
+        with self._lock:
+            (old_name, old_trigrams) = self._names.pop(key, (None, ()))
+            for trigram in old_trigrams:
+                keys = self._postings[trigram]
+                keys.discard(key)
+                if not keys:
+                    del self._postings[trigram]
+            if name:
+                name_trigrams = frozenset(trigrams(name))
+                self._names[key] = (name, name_trigrams)
+                for trigram in name_trigrams:
+                    self._postings[trigram].add(key)
+
+    # The names most like "text", best first, as (score, kind, id, name).
+    # Only names sharing a trigram with the search are looked at.
+    def search(self, text, limit=10, kinds=None, threshold=SIMILARITY_THRESHOLD):
+        wanted = trigrams(text)
+        if not wanted:
+            return []
+        shared = defaultdict(int)
+        with self._lock:
+            for trigram in wanted:
+                for key in self._postings.get(trigram, ()):
+                    shared[key] += 1
+            scored = []
+            for (key, count) in shared.items():
+                if kinds is not None and key[0] not in kinds:
+                    continue
+                (name, name_trigrams) = self._names[key]
+                score = count / (len(wanted) + len(name_trigrams) - count)
+                if score >= threshold:
+                    scored.append((score, key[0], key[1], name))
+        return heapq.nsmallest(limit, scored, key=lambda result: (-result[0], result[3].lower(), result[1], result[2]))
+
+
+_indexes = OrderedDict()
+_lock = threading.Lock()
+
+
+# The index of a profile, made if this process doesn't have a current one.
+def index_for(profile):
+    with _lock:
+        index = _indexes.get(profile.id)
+        if index is not None and index.names_version == profile.names_version:
+            _indexes.move_to_end(profile.id)
+            return index
+
+    # Made outside the lock; at worst two threads make the same index.
+    index = TrigramIndex(profile.names_version)
+    for (kind, model) in KINDS.items():
+        for (object_id, name) in model.objects.filter(profile=profile.id).values_list("id", "name"):
+            index.set(kind, object_id, name)
+    with _lock:
+        _indexes[profile.id] = index
+        _indexes.move_to_end(profile.id)
+        while len(_indexes) > INDEX_CACHE_SIZE:
+            _indexes.popitem(last=False)
+    return index
+
+
+# Puts a name that was added, changed or (with no name) deleted into this
+# process's index of its profile, once the change commits. Call it after
+# bumping the profile's names_version (see versions.py). If anything else
+# changed the profile's names meanwhile, the index is left to be made again.
+def name_changed(profile_id, kind, object_id, name):
+    with _lock:
+        index = _indexes.get(profile_id)
+    if index is None:
+        return
+    names_version = models.Profile.objects.filter(id=profile_id).values_list("names_version", flat=True).first()
+    if names_version is None:
+        return
+
+    def update():
+        with _lock:
+            if _indexes.get(profile_id) is not index or index.names_version != names_version - 1:
+                return
+            index.set(kind, object_id, name)
+            index.names_version = names_version
+    transaction.on_commit(update)
+
+
+# Forgets every index (for tests).
+def _reset():
+    with _lock:
+        _indexes.clear()
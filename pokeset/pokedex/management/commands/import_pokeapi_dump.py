@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from pokedex import mirror
+
+
+# Imports PokeAPI's data into the local mirror (see mirror.py), e.g. from a
+# checkout of https://github.com/PokeAPI/api-data:
+#   python3 manage.py import_pokeapi_dump path/to/api-data
+# Any previously imported data is replaced.
+class Command(BaseCommand):
+    help = "Imports species, sprites, moves and abilities from an offline PokeAPI dump."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Folder of the dump (or its data/api/v2 folder).")
+
+    def handle(self, *args, **options):
+        try:
+            (species, moves, abilities) = mirror.import_dump(options["path"])
+        except (FileNotFoundError, KeyError, ValueError) as e:
+            raise CommandError("Could not import %s: %s" % (options["path"], e))
+        self.stdout.write("Imported %d species, %d moves and %d abilities." % (species, moves, abilities))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from pokedex import details, models
+
+
+# Makes the detailed view's precomputed documents (see details.py) of every
+# Pokemon again, e.g. after a deploy that changes what they hold:
+#   python3 manage.py rebuild_details
+# or only of some profiles:
+#   python3 manage.py rebuild_details --profile 3 --profile 7
+class Command(BaseCommand):
+    help = "Makes the precomputed details of every Pokemon again."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--profile", type=int, action="append", help="Only rebuild the Pokemon of this profile.")
+        parser.add_argument("--batch-size", type=int, default=500, help="Pokemon to rebuild at a time.")
+
+    def handle(self, *args, **options):
+        pokemon = models.Pokemon.objects.order_by("id")
+        if options["profile"]:
+            pokemon = pokemon.filter(profile__in=options["profile"])
+
+        rebuilt = 0
+        after = 0
+        while True:
+            batch = list(pokemon.filter(id__gt=after).values_list("id", flat=True)[:options["batch_size"]])
+            if not batch:
+                break
+            rebuilt += len(details.rebuild(batch))
+            after = batch[-1]
+        self.stdout.write("Rebuilt the details of %d Pokemon." % rebuilt)
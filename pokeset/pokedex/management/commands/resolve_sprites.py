@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from pokedex import pokeapi, sprites
+
+
+# Background worker that looks up queued Pokemon sprites on PokeAPI.
+# Run it next to the web server:
+#   python3 manage.py resolve_sprites
+# or from a scheduler, to empty the queue once:
+#   python3 manage.py resolve_sprites --once
+class Command(BaseCommand):
+    help = "Looks up the sprites of newly created or renamed Pokemon on PokeAPI."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Work through the queue once, then exit.")
+        parser.add_argument("--interval", type=float, default=5.0, help="Seconds to wait when the queue is empty.")
+        parser.add_argument("--batch-size", type=int, default=50, help="Lookups to take from the queue at a time.")
+        parser.add_argument("--queue-missing", action="store_true", help="First queue every Pokemon without a sprite.")
+        parser.add_argument("--retry-unknown", nargs="*", metavar="NAME",
+                            help="First forget that PokeAPI doesn't know these names (or any name), and look them up again.")
+
+    def handle(self, *args, **options):
+        if options["retry_unknown"] is not None:
+            queued = sprites.retry_unknown(options["retry_unknown"] or None)
+            self.stdout.write("Queued %d Pokemon with a previously unknown name." % queued)
+        if options["queue_missing"]:
+            queued = sprites.queue_missing()
+            self.stdout.write("Queued %d Pokemon without a sprite." % queued)
+
+        while True:
+            resolved = sprites.resolve_queued(limit=options["batch_size"])
+            if resolved:
+                self.stdout.write("Resolved %d sprite(s)." % resolved)
+                if options["verbosity"] >= 2:
+                    self.write_stats()
+            if options["once"]:
+                # Failed lookups stay queued, so stop once a pass makes no progress.
+                if resolved < options["batch_size"]:
+                    self.write_stats()
+                    return
+            elif resolved < options["batch_size"]:
+                time.sleep(options["interval"])
+
+    def write_stats(self):
+        stats = pokeapi.client().stats()
+        self.stdout.write("PokeAPI: %(calls)d calls, %(failures)d failures, %(retries)d retries, "
+                          "%(skipped)d skipped while the circuit was open (circuit %(circuit)s)." % stats)
@@ -0,0 +1,28 @@
+# Generated by Django 4.1 on 2026-10-18 11:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pokedex', '0017_remove_pokemon_evolves_into_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='custom_type_chart',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='type_chart',
+            field=models.CharField(choices=[('GEN1', 'Generation 1'), ('GEN2', 'Generations 2-5'), ('GEN6', 'Generation 6+'), ('CUST', 'Custom')], default='GEN2', max_length=4),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='type_chart_version',
+            field=models.CharField(blank=True, editable=False, max_length=32),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.1 on 2026-10-18 11:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Pokemon without a sprite used to have it looked up when they were viewed;
+# now that lookups happen in the background, queue them instead.
+def queue_missing_sprites(apps, schema_editor):
+    Pokemon = apps.get_model('pokedex', 'Pokemon')
+    SpriteLookup = apps.get_model('pokedex', 'SpriteLookup')
+    missing = Pokemon.objects.filter(image_url='').values_list('id', flat=True)
+    SpriteLookup.objects.bulk_create([SpriteLookup(pokemon_id=pokemon_id) for pokemon_id in missing])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pokedex', '0018_profile_type_chart'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SpriteLookup',
+            fields=[
+                ('pokemon', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='pokedex.pokemon')),
+                ('queued_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.RunPython(queue_missing_sprites, migrations.RunPython.noop),
+    ]
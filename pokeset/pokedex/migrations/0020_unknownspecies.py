@@ -0,0 +1,21 @@
+# Generated by Django 4.1 on 2026-10-18 11:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pokedex', '0019_spritelookup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UnknownSpecies',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=20, unique=True)),
+                ('failed_at', models.DateTimeField()),
+            ],
+        ),
+    ]
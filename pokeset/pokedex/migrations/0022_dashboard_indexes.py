@@ -0,0 +1,29 @@
+# Generated by Django 4.1 on 2026-10-18 12:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pokedex', '0021_pokeapi_mirror'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='location',
+            index=models.Index(fields=['profile', 'name'], name='location_profile_name'),
+        ),
+        migrations.AddIndex(
+            model_name='pokemon',
+            index=models.Index(fields=['profile', 'name'], name='pokemon_profile_name'),
+        ),
+        migrations.AddIndex(
+            model_name='pokemon',
+            index=models.Index(fields=['profile', 'type_one', 'type_two'], name='pokemon_profile_type_one'),
+        ),
+        migrations.AddIndex(
+            model_name='pokemon',
+            index=models.Index(fields=['profile', 'type_two'], name='pokemon_profile_type_two'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.1 on 2026-10-18 13:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pokedex', '0023_profile_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PokemonDetail',
+            fields=[
+                ('pokemon', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='detail', serialize=False, to='pokedex.pokemon')),
+                ('document', models.JSONField()),
+                ('chart_version', models.CharField(max_length=32)),
+            ],
+        ),
+    ]
@@ -0,0 +1,129 @@
+# Generated by Django 4.1 on 2026-10-18 13:40
+
+from django.db import migrations, models
+
+
+# The types, in the order of their bits in a mask, and the built-in type
+# charts, as they were when the masks were added. Frozen here, so this
+# migration doesn't change along with pokedex.effectiveness and
+# pokedex.type_charts.
+TYPES = ('NOR', 'FIG', 'FLY', 'POI', 'GRO', 'ROC', 'BUG', 'GHO', 'STE', 'FIR',
+         'WAT', 'GRA', 'ELE', 'PSY', 'ICE', 'DRA', 'DAR', 'FAI', '???')
+
+# {attacking type: {multiplier: [defending types]}}
+GEN_2_TO_5 = {
+    'NOR': {0: ['GHO'], 0.5: ['ROC', 'STE']},
+    'FIR': {0.5: ['FIR', 'WAT', 'ROC', 'DRA'], 2: ['GRA', 'ICE', 'BUG', 'STE']},
+    'WAT': {0.5: ['WAT', 'GRA', 'DRA'], 2: ['FIR', 'GRO', 'ROC']},
+    'ELE': {0: ['GRO'], 0.5: ['ELE', 'GRA', 'DRA'], 2: ['WAT', 'FLY']},
+    'GRA': {0.5: ['FIR', 'GRA', 'POI', 'FLY', 'BUG', 'DRA', 'STE'], 2: ['WAT', 'GRO', 'ROC']},
+    'ICE': {0.5: ['FIR', 'WAT', 'ICE', 'STE'], 2: ['GRA', 'GRO', 'FLY', 'DRA']},
+    'FIG': {0: ['GHO'], 0.5: ['POI', 'FLY', 'PSY', 'BUG', 'FAI'], 2: ['NOR', 'ICE', 'ROC', 'DAR', 'STE']},
+    'POI': {0: ['STE'], 0.5: ['POI', 'GRO', 'ROC', 'GHO'], 2: ['GRA', 'FAI']},
+    'GRO': {0: ['FLY'], 0.5: ['GRA', 'BUG'], 2: ['FIR', 'ELE', 'POI', 'ROC', 'STE']},
+    'FLY': {0.5: ['ELE', 'ROC', 'STE'], 2: ['GRA', 'FIG', 'BUG']},
+    'PSY': {0: ['DAR'], 0.5: ['PSY', 'STE'], 2: ['FIG', 'POI']},
+    'BUG': {0.5: ['FIR', 'FIG', 'POI', 'FLY', 'GHO', 'STE', 'FAI'], 2: ['GRA', 'PSY', 'DAR']},
+    'ROC': {0.5: ['FIG', 'GRO', 'STE'], 2: ['FIR', 'ICE', 'FLY', 'BUG']},
+    'GHO': {0: ['NOR'], 0.5: ['DAR', 'STE'], 2: ['PSY', 'GHO']},
+    'DRA': {0: ['FAI'], 0.5: ['STE'], 2: ['DRA']},
+    'DAR': {0.5: ['FIG', 'DAR', 'STE', 'FAI'], 2: ['PSY', 'GHO']},
+    'STE': {0.5: ['FIR', 'WAT', 'ELE', 'STE'], 2: ['ICE', 'ROC', 'FAI']},
+    'FAI': {0.5: ['WAT', 'POI', 'STE'], 2: ['FIG', 'DRA', 'DAR']},
+}
+
+# Each mask field, and the total multiplier of the types in it.
+MASKS = (
+    ('offensive_4_mask', 4),
+    ('offensive_2_mask', 2),
+    ('offensive_05_mask', 0.5),
+    ('offensive_025_mask', 0.25),
+    ('offensive_0_mask', 0),
+)
+
+
+# A built-in chart as {attacking type: {defending type: multiplier}}.
+def builtin_chart(code):
+    chart = {attacking: {type: multiplier for (multiplier, types) in matchups.items() for type in types}
+             for (attacking, matchups) in GEN_2_TO_5.items()}
+    if code == 'GEN1':
+        # No Dark, Steel or Fairy types, and a few famous bugs.
+        chart = {attacking: {type: multiplier for (type, multiplier) in matchups.items() if type not in ('DAR', 'STE', 'FAI')}
+                 for (attacking, matchups) in chart.items() if attacking not in ('DAR', 'STE', 'FAI')}
+        chart['BUG']['POI'] = 2
+        chart['POI']['BUG'] = 2
+        chart['GHO']['PSY'] = 0
+        del chart['ICE']['FIR']
+    elif code == 'GEN6':
+        # Steel no longer resists Ghost and Dark.
+        del chart['GHO']['STE']
+        del chart['DAR']['STE']
+    return chart
+
+
+# The masks of a pair of types: for each mask, one bit per attacking type
+# doing its multiplier against the pair.
+def masks(chart, type_one, type_two):
+    found = {field: 0 for (field, value) in MASKS}
+    for (bit, attacking) in enumerate(TYPES):
+        matchups = chart.get(attacking, {})
+        multiplier = matchups.get(type_one, 1) * (matchups.get(type_two, 1) if type_two in TYPES else 1)
+        for (field, value) in MASKS:
+            if abs(multiplier - value) <= 0.01:
+                found[field] |= 1 << bit
+    return found
+
+
+# Work out the bitmasks of every existing Pokemon, a profile at a time. One
+# update per pair of types in use.
+def fill_masks(apps, schema_editor):
+    Pokemon = apps.get_model('pokedex', 'Pokemon')
+    Profile = apps.get_model('pokedex', 'Profile')
+    for profile in Profile.objects.all():
+        if profile.type_chart == 'CUST':
+            chart = profile.custom_type_chart or {}
+        else:
+            chart = builtin_chart(profile.type_chart)
+        pokemon = Pokemon.objects.filter(profile=profile.id)
+        for (type_one, type_two) in pokemon.values_list('type_one', 'type_two').distinct().order_by():
+            pokemon.filter(type_one=type_one, type_two=type_two).update(**masks(chart, type_one, type_two))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pokedex', '0024_pokemon_detail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pokemon',
+            name='offensive_025_mask',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='pokemon',
+            name='offensive_05_mask',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='pokemon',
+            name='offensive_0_mask',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='pokemon',
+            name='offensive_2_mask',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='pokemon',
+            name='offensive_4_mask',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='pokemon',
+            index=models.Index(fields=['profile', 'offensive_4_mask', 'offensive_2_mask', 'offensive_05_mask', 'offensive_025_mask', 'offensive_0_mask'], name='pokemon_profile_masks'),
+        ),
+        migrations.RunPython(fill_masks, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 4.1 on 2026-10-18 14:30
+
+import re
+
+import django.db.models.deletion
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+# The names of the types, and how searchindex.py broke text into terms,
+# when the index was added. Frozen here, so this migration doesn't change
+# along with pokedex.searchindex.
+TYPE_LABELS = {
+    'NOR': 'Normal', 'FIG': 'Fighting', 'FLY': 'Flying', 'POI': 'Poison', 'GRO': 'Ground',
+    'ROC': 'Rock', 'BUG': 'Bug', 'GHO': 'Ghost', 'STE': 'Steel', 'FIR': 'Fire', 'WAT': 'Water',
+    'GRA': 'Grass', 'ELE': 'Electric', 'PSY': 'Psychic', 'ICE': 'Ice', 'DRA': 'Dragon',
+    'DAR': 'Dark', 'FAI': 'Fairy', '???': '???',
+}
+
+MAX_TERM_LENGTH = 20
+
+WORD = re.compile(r'\w+')
+
+
+def terms(name, types, related_names):
+    texts = [name] + related_names
+    for type in types:
+        if type:
+            texts += [type, TYPE_LABELS.get(type, '')]
+    return {word[:MAX_TERM_LENGTH] for text in texts for word in WORD.findall(text.lower())}
+
+
+# Index every existing Pokemon, a batch at a time.
+def index_pokemon(apps, schema_editor):
+    Pokemon = apps.get_model('pokedex', 'Pokemon')
+    SearchTerm = apps.get_model('pokedex', 'SearchTerm')
+    throughs = ((apps.get_model('pokedex', 'Findable'), 'location__name'),
+                (apps.get_model('pokedex', 'Learnable'), 'move__name'),
+                (apps.get_model('pokedex', 'Capable'), 'ability__name'))
+    pokemon_ids = list(Pokemon.objects.order_by('id').values_list('id', flat=True))
+    for start in range(0, len(pokemon_ids), 500):
+        batch = pokemon_ids[start:start + 500]
+        related_names = defaultdict(list)
+        for (through, field) in throughs:
+            for (pokemon_id, name) in through.objects.filter(pokemon__in=batch).values_list('pokemon_id', field):
+                related_names[pokemon_id].append(name)
+        pokemon = Pokemon.objects.filter(id__in=batch).values_list('id', 'profile_id', 'name', 'type_one', 'type_two')
+        SearchTerm.objects.bulk_create(
+            [SearchTerm(profile_id=profile_id, pokemon_id=pokemon_id, term=term)
+             for (pokemon_id, profile_id, name, type_one, type_two) in pokemon
+             for term in terms(name, (type_one, type_two), related_names[pokemon_id])],
+            batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pokedex', '0025_defensive_masks'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=20)),
+                ('pokemon', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='pokedex.pokemon')),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='pokedex.profile')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['profile', 'term'], name='searchterm_profile_term')],
+            },
+        ),
+        migrations.RunPython(index_pokemon, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1 on 2026-10-18 15:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pokedex', '0026_search_terms'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='names_version',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,81 @@
+# Generated by Django 4.1 on 2026-10-18 16:05
+
+import hashlib
+import random
+
+import django.db.models.deletion
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+# The MinHash signatures and buckets of similarity.py, as they were when
+# the buckets were added. Frozen here, so this migration doesn't change
+# along with pokedex.similarity.
+BANDS = 32
+ROWS = 2
+PRIME = (1 << 61) - 1
+_rng = random.Random(25)
+HASHES = [(_rng.randrange(1, PRIME), _rng.randrange(PRIME)) for _ in range(BANDS * ROWS)]
+
+
+def _hash(text, signed=False):
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), 'big', signed=signed)
+
+
+def buckets(features):
+    hashed = [_hash(feature) for feature in features]
+    if not hashed:
+        return []
+    signature = [min((a * x + b) % PRIME for x in hashed) for (a, b) in HASHES]
+    return [_hash('%d:%s' % (band, signature[band * ROWS:(band + 1) * ROWS]), signed=True) for band in range(BANDS)]
+
+
+# Put every existing Pokemon in its buckets, a batch at a time.
+def bucket_pokemon(apps, schema_editor):
+    Pokemon = apps.get_model('pokedex', 'Pokemon')
+    SimilarityBucket = apps.get_model('pokedex', 'SimilarityBucket')
+    throughs = ((apps.get_model('pokedex', 'Learnable'), 'move'),
+                (apps.get_model('pokedex', 'Capable'), 'ability'),
+                (apps.get_model('pokedex', 'Findable'), 'location'))
+    pokemon_ids = list(Pokemon.objects.order_by('id').values_list('id', flat=True))
+    for start in range(0, len(pokemon_ids), 500):
+        batch = pokemon_ids[start:start + 500]
+        features = defaultdict(set)
+        profiles = {}
+        for (pokemon_id, profile_id, type_one, type_two) in Pokemon.objects.filter(id__in=batch).values_list(
+                'id', 'profile_id', 'type_one', 'type_two'):
+            profiles[pokemon_id] = profile_id
+            features[pokemon_id].update('type:' + type for type in (type_one, type_two) if type)
+        for (through, field) in throughs:
+            for (pokemon_id, related_id) in through.objects.filter(pokemon__in=batch).values_list(
+                    'pokemon_id', field + '_id'):
+                features[pokemon_id].add('%s:%d' % (field, related_id))
+        SimilarityBucket.objects.bulk_create(
+            [SimilarityBucket(profile_id=profile_id, pokemon_id=pokemon_id, bucket=bucket)
+             for (pokemon_id, profile_id) in profiles.items()
+             for bucket in buckets(features[pokemon_id])],
+            batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pokedex', '0027_profile_names_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarityBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.BigIntegerField()),
+                ('pokemon', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similarity_buckets', to='pokedex.pokemon')),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='pokedex.profile')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['profile', 'bucket'], name='similarity_profile_bucket')],
+            },
+        ),
+        migrations.RunPython(bucket_pokemon, migrations.RunPython.noop),
+    ]
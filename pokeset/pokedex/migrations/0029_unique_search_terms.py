@@ -0,0 +1,34 @@
+# Generated by Django 4.1 on 2026-10-18 17:20
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+# Overlapping reindexes could write the same term (or bucket) of a Pokemon
+# twice. Keep the first of each.
+def remove_duplicates(apps, schema_editor):
+    for (name, field) in (('SearchTerm', 'term'), ('SimilarityBucket', 'bucket')):
+        model = apps.get_model('pokedex', name)
+        duplicated = model.objects.values('pokemon', field).order_by().annotate(
+            count=Count('id'), keep=Min('id')).filter(count__gt=1)
+        for values in duplicated:
+            model.objects.filter(pokemon=values['pokemon'], **{field: values[field]}).exclude(id=values['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pokedex', '0028_similarity_buckets'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='searchterm',
+            constraint=models.UniqueConstraint(fields=('pokemon', 'term'), name='unique_search_terms'),
+        ),
+        migrations.AddConstraint(
+            model_name='similaritybucket',
+            constraint=models.UniqueConstraint(fields=('pokemon', 'bucket'), name='unique_similarity_buckets'),
+        ),
+    ]
@@ -0,0 +1,188 @@
+# mirror.py
+# A local mirror of PokeAPI's data: species with their sprites, types,
+# moves and abilities. It is imported from an offline dump in the layout
+# of PokeAPI's "api-data" repository (https://github.com/PokeAPI/api-data),
+# e.g. data/api/v2/pokemon/25/index.json, and lets sprite lookups (and
+# anything else that needs reference data) resolve with one indexed query
+# instead of going over the network.
+
+import hashlib
+import json
+from pathlib import Path
+
+from django.db import transaction
+from django.db.models.functions import Lower
+
+from . import models, versions
+
+# PokeAPI's type names, by our type codes. Types we don't have (e.g.
+# "shadow") become "???".
+TYPES_BY_NAME = {label.lower(): code for (code, label) in models.Type.choices}
+
+BATCH_SIZE = 1000
+
+# The longest name a move or ability can have.
+NAME_LENGTH = models.Move._meta.get_field("name").max_length
+
+
+# The name PokeAPI would use for a species, e.g. "Mr. Mime" -> "mr-mime".
+def species_key(name):
+    return "-".join(name.lower().replace(".", " ").replace("'", "").split())
+
+
+def _type_code(type_name):
+    return TYPES_BY_NAME.get(type_name, models.Type.UNKNOWN)
+
+
+# The folder holding the "pokemon" and "move" folders of a dump, which may
+# be the dump itself or its data/api/v2 folder.
+def _api_root(path):
+    path = Path(path)
+    for root in (path, path / "data" / "api" / "v2", path / "api" / "v2"):
+        if (root / "pokemon").is_dir():
+            return root
+    raise FileNotFoundError("No PokeAPI data (a \"pokemon\" folder) in %s." % path)
+
+
+def _read_all(folder):
+    if not folder.is_dir():
+        return
+    for index in sorted(folder.glob("*/index.json")):
+        with open(index, encoding="utf-8") as file:
+            yield json.load(file)
+
+
+# Replaces the mirror with the contents of the dump at "path", in one
+# transaction. Returns (species, moves, abilities) counts.
+def import_dump(path):
+    root = _api_root(path)
+
+    move_types = {}
+    for move in _read_all(root / "move"):
+        move_types[move["name"]] = _type_code(move["type"]["name"])
+
+    species = []
+    for pokemon in _read_all(root / "pokemon"):
+        types = [entry["type"]["name"] for entry in sorted(pokemon["types"], key=lambda entry: entry["slot"])]
+        species.append({
+            "name": pokemon["name"],
+            "sprite_url": (pokemon.get("sprites") or {}).get("front_default") or "",
+            "type_one": _type_code(types[0]) if types else models.Type.UNKNOWN,
+            "type_two": _type_code(types[1]) if len(types) > 1 else "",
+            "moves": sorted({entry["move"]["name"] for entry in pokemon.get("moves", [])}),
+            "abilities": sorted({entry["ability"]["name"] for entry in pokemon.get("abilities", [])}),
+        })
+    # Moves a species learns, but that weren't in the dump's move folder.
+    for entry in species:
+        for move in entry["moves"]:
+            move_types.setdefault(move, models.Type.UNKNOWN)
+    ability_names = sorted({ability for entry in species for ability in entry["abilities"]})
+
+    with transaction.atomic():
+        models.Species.objects.all().delete()
+        models.ReferenceMove.objects.all().delete()
+        models.ReferenceAbility.objects.all().delete()
+
+        moves = models.ReferenceMove.objects.bulk_create(
+            [models.ReferenceMove(name=name, type=type) for (name, type) in sorted(move_types.items())],
+            batch_size=BATCH_SIZE)
+        abilities = models.ReferenceAbility.objects.bulk_create(
+            [models.ReferenceAbility(name=name) for name in ability_names], batch_size=BATCH_SIZE)
+        created = models.Species.objects.bulk_create(
+            [models.Species(name=entry["name"], sprite_url=entry["sprite_url"],
+                            type_one=entry["type_one"], type_two=entry["type_two"]) for entry in species],
+            batch_size=BATCH_SIZE)
+
+        # Not every database returns primary keys from bulk_create(), so
+        # read them back before creating the many-to-many rows.
+        move_ids = dict(models.ReferenceMove.objects.values_list("name", "id"))
+        ability_ids = dict(models.ReferenceAbility.objects.values_list("name", "id"))
+        species_ids = dict(models.Species.objects.values_list("name", "id"))
+        models.Species.moves.through.objects.bulk_create(
+            [models.Species.moves.through(species_id=species_ids[entry["name"]], referencemove_id=move_ids[move])
+             for entry in species for move in entry["moves"]],
+            batch_size=BATCH_SIZE)
+        models.Species.abilities.through.objects.bulk_create(
+            [models.Species.abilities.through(species_id=species_ids[entry["name"]], referenceability_id=ability_ids[ability])
+             for entry in species for ability in entry["abilities"]],
+            batch_size=BATCH_SIZE)
+
+    return (len(created), len(moves), len(abilities))
+
+
+# The mirrored sprite URLs of those of "names" that are in the mirror, as
+# {name: sprite URL} (with "" for species that have no sprite). One query.
+def sprite_urls(names):
+    keys = {species_key(name): name for name in names}
+    found = models.Species.objects.filter(name__in=keys).values_list("name", "sprite_url")
+    return {keys[key]: sprite_url for (key, sprite_url) in found}
+
+
+# The name a mirrored move or ability gets in a profile, e.g.
+# "thunder-shock" -> "Thunder Shock". Names too long for the name fields
+# are cut short and end with a digest of the whole name, so two long names
+# starting alike don't become the same move, e.g.
+# "10000000-volt-thunderbolt" -> "10000000 Volt T~00a7".
+def display_name(name):
+    display = name.replace("-", " ").title()
+    if len(display) <= NAME_LENGTH:
+        return display
+    digest = hashlib.blake2b(name.encode(), digest_size=2).hexdigest()
+    return display[:NAME_LENGTH - len(digest) - 1].rstrip() + "~" + digest
+
+
+# Gives a Pokemon the types, moves and abilities its species has in the
+# original games, if its species is in the mirror. Moves and abilities the
+# profile doesn't have yet are created. Everything is written in bulk, in
+# one transaction, with the same number of queries however many moves the
+# species learns. Returns whether the species was found.
+def autofill(pokemon):
+    species = models.Species.objects.filter(name=species_key(pokemon.name)).first()
+    if species is None:
+        return False
+
+    moves = {display_name(name): type for (name, type) in species.moves.values_list("name", "type")}
+    abilities = {display_name(name) for name in species.abilities.values_list("name", flat=True)}
+
+    with transaction.atomic():
+        pokemon.type_one = species.type_one
+        pokemon.type_two = species.type_two
+        fields = ["type_one", "type_two"]
+        if species.sprite_url:
+            pokemon.image_url = species.sprite_url
+            fields.append("image_url")
+        pokemon.save(update_fields=fields)
+
+        move_ids = _get_or_create_all(models.Move, pokemon.profile,
+            {name: models.Move(name=name, type=type, profile=pokemon.profile) for (name, type) in moves.items()})
+        ability_ids = _get_or_create_all(models.Ability, pokemon.profile,
+            {name: models.Ability(name=name, profile=pokemon.profile) for name in abilities})
+
+        known_moves = set(models.Learnable.objects.filter(pokemon=pokemon).values_list("move_id", flat=True))
+        models.Learnable.objects.bulk_create(
+            [models.Learnable(pokemon=pokemon, move_id=move_id) for move_id in move_ids if move_id not in known_moves],
+            batch_size=BATCH_SIZE)
+        known_abilities = set(models.Capable.objects.filter(pokemon=pokemon).values_list("ability_id", flat=True))
+        models.Capable.objects.bulk_create(
+            [models.Capable(pokemon=pokemon, ability_id=ability_id) for ability_id in ability_ids if ability_id not in known_abilities],
+            batch_size=BATCH_SIZE)
+        # bulk_create() sends no signals.
+        versions.pokemon_changed([pokemon.id])
+    return True
+
+
+# The ids of the profile's rows of "model" with the names in "new_objects"
+# ({name: unsaved object}), creating the ones that don't exist yet. Names
+# are compared case-insensitively, like most database collations would.
+# Rows another autofill creates meanwhile are skipped, and read back.
+def _get_or_create_all(model, profile, new_objects):
+    lowered = {name.lower(): name for name in new_objects}
+    existing = model.objects.filter(profile=profile).annotate(lower_name=Lower("name")).filter(lower_name__in=lowered)
+    found = dict(existing.values_list("lower_name", "id"))
+    model.objects.bulk_create([new_objects[name] for (lower, name) in lowered.items() if lower not in found],
+                              batch_size=BATCH_SIZE, ignore_conflicts=True)
+    if len(found) < len(lowered):
+        found = dict(existing.values_list("lower_name", "id"))
+        # bulk_create() sends no signals.
+        versions.names_changed(profile.id)
+    return list(found.values())
@@ -5,6 +5,9 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
+from django.utils import timezone
+
+from . import type_charts
 
 # All possible types among the Pokemon games.
 class Type(models.TextChoices):
@@ -28,6 +31,13 @@ class Type(models.TextChoices):
     FAIRY       = 'FAI', ('Fairy')
     UNKNOWN     = '???', ('???')
 
+# Type charts a Profile can use. Randomized games often use the chart of an
+# older (or newer) generation, or shuffle the chart completely.
+class Chart(models.TextChoices):
+    GEN_1       = 'GEN1', ('Generation 1')
+    GEN_2_5     = 'GEN2', ('Generations 2-5')
+    GEN_6       = 'GEN6', ('Generation 6+')
+    CUSTOM      = 'CUST', ('Custom')
 
 # SelfValidate is an abstract base class that we use whenever a model
 # needs additional validation. Validation should be implemented in "clean()".
@@ -42,6 +52,31 @@ class SelfValidate(models.Model):
         self.clean()
         super().save(*args, **kwargs)
 
+# Profiles belong to a user, and most other things belong to a profile.
+# "for_user()" keeps only what belongs to a user, checking ownership in the
+# same query that loads the rows (and, for things in a profile, their
+# profile too), e.g.:
+#   get_object_or_404(Pokemon.objects.for_user(req.user), id=pokemon_id)
+# is a single query that finds nothing unless the Pokemon is the user's.
+class ProfileQuerySet(models.QuerySet):
+
+    def for_user(self, user):
+        return self.filter(user=user)
+
+    # Records that something in these profiles changed (see versions.py),
+    # and if "names" is set, that the names of their Pokemon, locations,
+    # moves or abilities did.
+    def bump_version(self, names=False):
+        changes = {"version": models.F("version") + 1, "updated_at": timezone.now()}
+        if names:
+            changes["names_version"] = models.F("names_version") + 1
+        return self.update(**changes)
+
+class InProfileQuerySet(models.QuerySet):
+
+    def for_user(self, user):
+        return self.filter(profile__user=user).select_related("profile")
+
 # Users can have multiple Profiles: We want users to be able to 
 # maintain a Pokedex for different games or save files.
 class Profile(models.Model):
@@ -49,12 +84,55 @@ class Profile(models.Model):
     user            = models.ForeignKey(User, on_delete=models.CASCADE)
     description     = models.CharField(max_length=200, blank=True)
 
+    objects         = ProfileQuerySet.as_manager()
+
+    # Goes up whenever anything in the profile (its Pokemon, and their
+    # moves, locations and abilities) changes, see versions.py. Pages
+    # showing the profile are cached by browsers under it.
+    version         = models.PositiveBigIntegerField(default=0, editable=False)
+    updated_at      = models.DateTimeField(auto_now=True)
+    # Goes up whenever a name in the profile is added, changed or deleted.
+    # The fuzzy search index is kept under it, see fuzzy.py.
+    names_version   = models.PositiveBigIntegerField(default=0, editable=False)
+
+    # Which type chart weaknesses and resistances are worked out with. A
+    # custom chart is stored in the same format as the built-in ones (see
+    # type_charts.py). The version identifies the chart's contents, and is
+    # what compiled charts are cached under.
+    type_chart          = models.CharField(max_length=4, choices=Chart.choices, default=Chart.GEN_2_5)
+    custom_type_chart   = models.JSONField(blank=True, null=True)
+    type_chart_version  = models.CharField(max_length=32, blank=True, editable=False)
+
     # We want a user's profiles to be unique, but not
     # EVERY profile across the table to be unique (i.e users Bob and Jane 
     # should both be able to make a profile named "AwesomeProfile", but not
     # two profiles named that). We repeat this in most models.
+    # A user's profiles are listed (and searched, see
+    # readmodel.search_profiles) in name order.
     class Meta:
         constraints = [models.UniqueConstraint(name="unique_profiles", fields=["name", "user"])]
+        indexes = [models.Index(name="profile_user_name", fields=["user", "name"])]
+
+    def clean(self):
+        if self.type_chart == Chart.CUSTOM:
+            if not self.custom_type_chart:
+                raise ValidationError('A custom type chart is required.')
+            type_charts.validate_chart(self.custom_type_chart, Type.values)
+
+    def save(self, *args, **kwargs):
+        from . import effectiveness
+
+        self.type_chart_version = type_charts.chart_version(self.type_chart, self.custom_type_chart)
+        adding = self._state.adding
+        chart_changed = not adding and not Profile.objects.filter(
+            id=self.id, type_chart_version=self.type_chart_version).exists()
+        super().save(*args, **kwargs)
+        # Editing a profile (e.g. its type chart) changes all of its pages.
+        if not adding:
+            Profile.objects.filter(id=self.id).bump_version()
+            self.version += 1
+        if chart_changed:
+            effectiveness.update_masks(self)
 
     def __str__(self):
         return self.name
@@ -64,8 +142,12 @@ class Location(models.Model):
     name            = models.CharField(max_length=20)
     profile         = models.ForeignKey(Profile, on_delete=models.CASCADE)
 
+    objects         = InProfileQuerySet.as_manager()
+
+    # Locations are searched by name within a profile.
     class Meta:
         constraints = [models.UniqueConstraint(name="unique_locations", fields=["name", "profile"])]
+        indexes = [models.Index(name="location_profile_name", fields=["profile", "name"])]
 
 
     def __str__(self):
@@ -78,6 +160,8 @@ class Move(models.Model):
     type            = models.CharField(max_length=3, choices=Type.choices)
     profile         = models.ForeignKey(Profile, on_delete=models.CASCADE)
 
+    objects         = InProfileQuerySet.as_manager()
+
     class Meta:
         constraints = [models.UniqueConstraint(name="unique_moves", fields=["name", "profile"])]
 
@@ -90,6 +174,8 @@ class Ability(models.Model):
     name            = models.CharField(max_length=20)
     profile         = models.ForeignKey(Profile, on_delete=models.CASCADE)
 
+    objects         = InProfileQuerySet.as_manager()
+
     class Meta:
         constraints = [models.UniqueConstraint(name="unique_abilities", fields=["name", "profile"])]
 
@@ -118,8 +204,35 @@ class Pokemon(SelfValidate):
     abilities       = models.ManyToManyField(Ability, through='Capable', blank=True, related_name='can_be_possessed_by')
     profile         = models.ForeignKey(Profile, on_delete=models.CASCADE)
 
+    # When the Pokemon, or its moves, locations or abilities, last changed.
+    updated_at      = models.DateTimeField(auto_now=True)
+
+    # The types the Pokemon takes 4x, 2x, 0.5x, 0.25x and no damage from, as
+    # bitmasks (see effectiveness.type_bit), under its profile's type chart.
+    # Set from the types on save, so "weak to Water" and the like can be
+    # searched for in SQL (see dashboard.bucket_filter).
+    offensive_4_mask    = models.PositiveIntegerField(default=0, editable=False)
+    offensive_2_mask    = models.PositiveIntegerField(default=0, editable=False)
+    offensive_05_mask   = models.PositiveIntegerField(default=0, editable=False)
+    offensive_025_mask  = models.PositiveIntegerField(default=0, editable=False)
+    offensive_0_mask    = models.PositiveIntegerField(default=0, editable=False)
+
+    objects         = InProfileQuerySet.as_manager()
+
+    # The dashboard filters a profile's Pokemon by name, types and
+    # weaknesses, and sorts them by name or type (see dashboard.py). Bitmasks
+    # can't be looked up in an index, but with the masks in one index,
+    # searching them reads just the index, not the table.
     class Meta:
         constraints = [models.UniqueConstraint(name="unique_pokemons", fields=["name", "profile"])]
+        indexes = [
+            models.Index(name="pokemon_profile_name", fields=["profile", "name"]),
+            models.Index(name="pokemon_profile_type_one", fields=["profile", "type_one", "type_two"]),
+            models.Index(name="pokemon_profile_type_two", fields=["profile", "type_two"]),
+            models.Index(name="pokemon_profile_masks", fields=[
+                "profile", "offensive_4_mask", "offensive_2_mask", "offensive_05_mask",
+                "offensive_025_mask", "offensive_0_mask"]),
+        ]
 
     def clean(self):
         # Want to raise multiple errors at a time, rather than just one.
@@ -135,6 +248,21 @@ class Pokemon(SelfValidate):
         if (len(errors) > 0):
             raise ValidationError(errors)
 
+    def save(self, *args, **kwargs):
+        from . import effectiveness
+
+        effectiveness.set_masks(self.profile, [self])
+        # The masks follow the types, so save them along with the types.
+        # updated_at is what dashboard rows are cached under, so it is
+        # always saved.
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            update_fields = set(update_fields) | {"updated_at"}
+            if {"type_one", "type_two"} & update_fields:
+                update_fields |= set(effectiveness.MASK_FIELDS.values())
+            kwargs["update_fields"] = update_fields
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return self.name + ' (' + self.get_type_one_display() + ') (' + self.get_type_two_display() + ')'
 
@@ -172,4 +300,104 @@ class Capable(SelfValidate):
             raise ValidationError('Attempting to associate a Pokemon with an Ability from a different profile.')
     
     def __str__(self):
-        return str(self.pokemon) + ' can possess ' + str(self.ability)
\ No newline at end of file
+        return str(self.pokemon) + ' can possess ' + str(self.ability)
+
+# Everything the detailed view shows about a Pokemon (its evolutions,
+# locations, abilities, moves and weaknesses), worked out ahead of time so
+# the page reads a single row. Made again whenever any of it changes, see
+# details.py.
+class PokemonDetail(models.Model):
+    pokemon         = models.OneToOneField(Pokemon, on_delete=models.CASCADE, primary_key=True, related_name='detail')
+    document        = models.JSONField()
+    # The type chart the weaknesses were worked out with.
+    chart_version   = models.CharField(max_length=32)
+
+    def __str__(self):
+        return 'Details of ' + str(self.pokemon)
+
+# The words a Pokemon can be found by in a free-text search: those of its
+# name, types, locations, moves and abilities, in lowercase. Kept up to date
+# as they change, see searchindex.py. Searches look words up by prefix
+# within a profile, which the index makes a single range scan.
+class SearchTerm(models.Model):
+    profile         = models.ForeignKey(Profile, on_delete=models.CASCADE)
+    pokemon         = models.ForeignKey(Pokemon, on_delete=models.CASCADE, related_name='search_terms')
+    term            = models.CharField(max_length=20)
+
+    class Meta:
+        indexes = [models.Index(name="searchterm_profile_term", fields=["profile", "term"])]
+        constraints = [models.UniqueConstraint(name="unique_search_terms", fields=["pokemon", "term"])]
+
+    def __str__(self):
+        return str(self.pokemon) + ' is found by ' + self.term
+
+# The locality-sensitive hashes of a Pokemon's types, moves, abilities and
+# locations: one bucket per band of its MinHash signature, see
+# similarity.py. Pokemon sharing a bucket are likely alike, and are found
+# through the index without comparing every Pokemon of the profile.
+class SimilarityBucket(models.Model):
+    profile         = models.ForeignKey(Profile, on_delete=models.CASCADE)
+    pokemon         = models.ForeignKey(Pokemon, on_delete=models.CASCADE, related_name='similarity_buckets')
+    bucket          = models.BigIntegerField()
+
+    class Meta:
+        indexes = [models.Index(name="similarity_profile_bucket", fields=["profile", "bucket"])]
+        constraints = [models.UniqueConstraint(name="unique_similarity_buckets", fields=["pokemon", "bucket"])]
+
+    def __str__(self):
+        return str(self.pokemon) + ' is in bucket ' + str(self.bucket)
+
+# Pokemon whose sprite still has to be looked up on PokeAPI. Lookups are
+# queued when a Pokemon is created or renamed, and worked through in the
+# background by the resolve_sprites command (see sprites.py), so that no
+# page ever waits on PokeAPI.
+class SpriteLookup(models.Model):
+    pokemon         = models.OneToOneField(Pokemon, on_delete=models.CASCADE, primary_key=True)
+    queued_at       = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return 'Sprite lookup for ' + str(self.pokemon)
+
+
+# Species names PokeAPI has no sprite for. Randomizer players often record
+# custom or misspelled names; these are remembered (in lowercase) for
+# settings.POKEAPI_NEGATIVE_TTL seconds, so they aren't looked up again and
+# again. See sprites.py.
+class UnknownSpecies(models.Model):
+    name            = models.CharField(max_length=20, unique=True)
+    failed_at       = models.DateTimeField()
+
+    def __str__(self):
+        return self.name
+
+
+# A local mirror of PokeAPI's reference data, imported from an offline dump
+# by the import_pokeapi_dump command (see mirror.py). Unlike everything
+# above, it isn't owned by any profile: it is what the species are like in
+# the unmodified games. Names are PokeAPI's (lowercase, e.g. "mr-mime").
+class ReferenceMove(models.Model):
+    name            = models.CharField(max_length=40, unique=True)
+    type            = models.CharField(max_length=3, choices=Type.choices)
+
+    def __str__(self):
+        return self.name
+
+class ReferenceAbility(models.Model):
+    name            = models.CharField(max_length=40, unique=True)
+
+    def __str__(self):
+        return self.name
+
+class Species(models.Model):
+    name            = models.CharField(max_length=40, unique=True)
+    sprite_url      = models.URLField(max_length=200, blank=True)
+    type_one        = models.CharField(max_length=3, choices=Type.choices)
+    type_two        = models.CharField(max_length=3, choices=Type.choices, blank=True)
+    moves           = models.ManyToManyField(ReferenceMove, blank=True, related_name='learned_by')
+    abilities       = models.ManyToManyField(ReferenceAbility, blank=True, related_name='possessed_by')
+
+    class Meta:
+        verbose_name_plural = 'species'
+
+    def __str__(self):
+        return self.name
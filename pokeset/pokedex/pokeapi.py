@@ -0,0 +1,198 @@
+# pokeapi.py
+# The client every outbound request to PokeAPI goes through. Requests have
+# connect and read timeouts and a small retry budget, and a circuit breaker
+# stops calling PokeAPI for a cool-down period after repeated failures, so
+# a slow or broken PokeAPI can't tie up our workers. The client counts its
+# calls, failures and skips; see Client.stats().
+
+import threading
+import time
+
+import requests
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from requests.adapters import HTTPAdapter
+
+
+# Raised instead of calling PokeAPI while the circuit is open. It is a
+# RequestException, so callers handle it like any other failed request.
+class CircuitOpen(requests.exceptions.RequestException):
+    pass
+
+
+# Counts consecutive failures. After "failure_threshold" of them the circuit
+# opens, and no calls are allowed for "cool_down" seconds. After that, one
+# trial call is let through: if it succeeds the circuit closes again, and if
+# it fails the circuit stays open for another cool-down.
+class CircuitBreaker:
+
+    def __init__(self, failure_threshold, cool_down, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.cool_down = cool_down
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if self.clock() - self.opened_at < self.cool_down:
+            return "open"
+        return "half-open"
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_running or self.failures >= self.failure_threshold:
+                self.opened_at = self.clock()
+            self._trial_running = False
+
+
+class Client:
+
+    def __init__(self, base_url, connect_timeout, read_timeout, retries, backoff,
+                 failure_threshold, cool_down, pool_size):
+        self.base_url = base_url
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = CircuitBreaker(failure_threshold, cool_down)
+
+        # One keep-alive session, shared by every thread making lookups.
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._counters = {"calls": 0, "failures": 0, "retries": 0, "skipped": 0}
+        self._lock = threading.Lock()
+
+    # GETs a path relative to the base URL. Connection errors, timeouts and
+    # 5xx responses are retried (at most "retries" times, with exponential
+    # backoff); if they persist, the last error is raised. Other responses,
+    # including 404s, are returned as they are.
+    def get(self, path, **kwargs):
+        if not self.breaker.allow():
+            self._count("skipped")
+            raise CircuitOpen("PokeAPI failed repeatedly; not calling it until the cool-down is over.")
+
+        # Anything raised counts as a failure (even an error of ours), so a
+        # trial call always ends, and the circuit can't stay half-open with
+        # no trial running.
+        succeeded = False
+        try:
+            response = self._get_with_retries(path, **kwargs)
+            succeeded = True
+        finally:
+            if succeeded:
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure()
+        return response
+
+    def _get_with_retries(self, path, **kwargs):
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                self._count("retries")
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            self._count("calls")
+            try:
+                response = self.session.get(self.base_url + path, timeout=self.timeout, **kwargs)
+                if response.status_code >= 500:
+                    raise requests.exceptions.HTTPError("PokeAPI answered %d." % response.status_code, response=response)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, requests.exceptions.HTTPError) as e:
+                self._count("failures")
+                error = e
+                continue
+            except requests.exceptions.RequestException:
+                # Not worth retrying (e.g. an invalid URL).
+                self._count("failures")
+                raise
+            return response
+        raise error
+
+    # Counters since the client was created, and the state of its circuit.
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+        stats["circuit"] = self.breaker.state
+        return stats
+
+    def _count(self, counter):
+        with self._lock:
+            self._counters[counter] += 1
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+# The client shared by this process, configured by the POKEAPI_* settings.
+def client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = Client(
+                base_url=settings.POKEAPI_URL,
+                connect_timeout=settings.POKEAPI_CONNECT_TIMEOUT,
+                read_timeout=settings.POKEAPI_READ_TIMEOUT,
+                retries=settings.POKEAPI_RETRIES,
+                backoff=settings.POKEAPI_RETRY_BACKOFF,
+                failure_threshold=settings.POKEAPI_FAILURE_THRESHOLD,
+                cool_down=settings.POKEAPI_COOL_DOWN,
+                pool_size=settings.POKEAPI_WORKERS,
+            )
+        return _client
+
+
+_sprite_client = None
+
+
+# The client for downloading sprite images (see spritecache.py). It takes
+# absolute URLs, since sprites aren't served by PokeAPI itself, and has its
+# own circuit breaker, so broken sprite hosting doesn't stop lookups.
+def sprite_client():
+    global _sprite_client
+    with _client_lock:
+        if _sprite_client is None:
+            _sprite_client = Client(
+                base_url="",
+                connect_timeout=settings.POKEAPI_CONNECT_TIMEOUT,
+                read_timeout=settings.POKEAPI_READ_TIMEOUT,
+                retries=settings.POKEAPI_RETRIES,
+                backoff=settings.POKEAPI_RETRY_BACKOFF,
+                failure_threshold=settings.POKEAPI_FAILURE_THRESHOLD,
+                cool_down=settings.POKEAPI_COOL_DOWN,
+                pool_size=settings.POKEAPI_WORKERS,
+            )
+        return _sprite_client
+
+
+# Build new clients when the settings change (e.g. in tests).
+@receiver(setting_changed)
+def _reset_client(setting, **kwargs):
+    global _client, _sprite_client
+    if setting.startswith("POKEAPI_"):
+        with _client_lock:
+            _client = None
+            _sprite_client = None
@@ -0,0 +1,138 @@
+# query.py
+# The dashboard's search language. A search is a list of terms, all of
+# which a Pokemon has to match, e.g.
+#   type:FIR loc:route* learns:surf ability:levitate weak:WAT -type:BUG
+# A term is "key:value", or a bare word (which matches the start of any
+# word of a Pokemon's name, types, locations, moves or abilities). Values match whole names,
+# case-insensitively; "*" at the end matches by prefix instead, and commas
+# separate alternatives ("type:FIR,WAT"). Quotes keep spaces in a value
+# (loc:"route 1"), and "-" in front of a term excludes what it matches.
+#
+# A search is compiled into a single condition on Pokemon, so however many
+# terms it has, it is answered in one query. Locations, moves and abilities
+# are matched with EXISTS subqueries over Findable, Learnable and Capable,
+# which look them up by Pokemon and name through indexes, and weaknesses
+# with the stored bitmasks (see dashboard.bucket_filter). Bare words are
+# looked up in the search index (see searchindex.py).
+
+import operator
+import shlex
+from functools import reduce
+
+from django.db.models import Exists, OuterRef, Q
+
+# (dashboard.py uses this module too, so its names are only looked up once
+# a search is compiled.)
+from . import dashboard, effectiveness, models, searchindex
+
+
+class QueryError(ValueError):
+    pass
+
+
+# A term of a search: its key (None for a bare word), its values, and
+# whether it excludes what it matches.
+class Term:
+    __slots__ = ("key", "values", "negated")
+
+    def __init__(self, key, values, negated=False):
+        self.key = key
+        self.values = values
+        self.negated = negated
+
+    def __repr__(self):
+        return "<Term %s%s:%s>" % ("-" if self.negated else "", self.key, ",".join(self.values))
+
+
+# What a value matches, as a lookup on a name field, e.g. "route*" ->
+# {"name__istartswith": "route"}.
+def _name_lookup(field, value):
+    if value.endswith("*"):
+        return {field + "__istartswith": value.rstrip("*")}
+    return {field + "__iexact": value}
+
+
+def _types(value):
+    codes = dashboard.matching_types(value.rstrip("*"))
+    if not codes:
+        raise QueryError("Unknown type: %s" % value)
+    return codes
+
+
+def _name(value):
+    return Q(**_name_lookup("name", value))
+
+
+def _type(value):
+    codes = _types(value)
+    return Q(type_one__in=codes) | Q(type_two__in=codes)
+
+
+def _related(through, field):
+    def condition(value):
+        return Q(Exists(through.objects.filter(pokemon=OuterRef("pk"), **_name_lookup(field + "__name", value))))
+    return condition
+
+
+def _bucket(buckets):
+    def condition(value):
+        return reduce(operator.or_, [dashboard.bucket_filter(code, buckets) for code in _types(value)])
+    return condition
+
+
+# What each key of a term matches, by value.
+CONDITIONS = {
+    "name": _name,
+    "type": _type,
+    "loc": _related(models.Findable, "location"),
+    "learns": _related(models.Learnable, "move"),
+    "ability": _related(models.Capable, "ability"),
+    "weak": _bucket(effectiveness.WEAK),
+    "resists": _bucket(effectiveness.RESISTS),
+    "immune": _bucket(effectiveness.IMMUNE),
+}
+
+# Other names keys go by.
+ALIASES = {
+    "location": "loc",
+    "move": "learns",
+    "resist": "resists",
+}
+
+
+# The terms of a search. Raises QueryError if it can't be understood.
+def parse(text):
+    try:
+        words = shlex.split(text)
+    except ValueError:
+        raise QueryError("Unmatched quote.")
+
+    terms = []
+    for word in words:
+        negated = word.startswith("-") and len(word) > 1
+        if negated:
+            word = word[1:]
+        (key, colon, value) = word.partition(":")
+        if not colon:
+            (key, value) = (None, word)
+        else:
+            key = ALIASES.get(key.lower(), key.lower())
+            if key not in CONDITIONS:
+                raise QueryError("Unknown search: %s:" % key)
+        values = [each for each in value.split(",") if each.strip("*")]
+        if not values:
+            raise QueryError("Nothing to search for in: %s" % word)
+        terms.append(Term(key, values, negated))
+    return terms
+
+
+# The condition on Pokemon a search compiles to. Raises QueryError if the
+# search can't be understood. Give the profile searched, if there is one,
+# so bare words are looked up in its part of the search index.
+def compile_search(text, profile=None):
+    condition = Q()
+    for term in parse(text):
+        match = CONDITIONS.get(term.key) or (lambda value: searchindex.word_filter(value.rstrip("*"), profile))
+        either = reduce(operator.or_, [match(value) for value in term.values])
+        condition &= ~either if term.negated else either
+    return condition
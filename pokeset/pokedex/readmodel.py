@@ -0,0 +1,93 @@
+# readmodel.py
+# Read-only views of Pokemon and profiles for pages that list many of them.
+# Lists only show a few fields, so rather than build a model instance for
+# every row, the fields are read with values_list() into small slotted
+# records. Records can't be saved; use the models for that.
+
+from collections import defaultdict
+
+from . import effectiveness, models
+
+
+# A Pokemon, as shown in a list. TypeChart.apply() fills in the weakness
+# buckets (offensive_4, offensive_2, ...).
+class PokemonRow:
+    __slots__ = ("id", "name", "image_url", "type_one", "type_two", "locations") + tuple(
+        name for (name, multiplier) in effectiveness.BUCKETS)
+
+    FIELDS = ("id", "name", "image_url", "type_one", "type_two")
+
+    def __init__(self, id, name, image_url, type_one, type_two, locations=()):
+        self.id = id
+        self.name = name
+        self.image_url = image_url
+        self.type_one = type_one
+        self.type_two = type_two
+        # The names of the locations the Pokemon can be found in.
+        self.locations = locations
+
+    def __repr__(self):
+        return "<PokemonRow %d: %s>" % (self.id, self.name)
+
+
+# A profile, as shown in the list of a user's profiles.
+class ProfileRow:
+    __slots__ = ("id", "name", "description", "colour")
+
+    FIELDS = ("id", "name", "description")
+
+    def __init__(self, id, name, description, colour=None):
+        self.id = id
+        self.name = name
+        self.description = description
+        self.colour = colour
+
+    def __repr__(self):
+        return "<ProfileRow %d: %s>" % (self.id, self.name)
+
+
+# The Pokemon of a queryset (which may be filtered, ordered and sliced) as
+# PokemonRows, with their locations. Two queries, however many Pokemon.
+def pokemon_rows(pokemon):
+    rows = [PokemonRow(*values) for values in pokemon.values_list(*PokemonRow.FIELDS)]
+    if rows:
+        locations = defaultdict(list)
+        found = models.Findable.objects.filter(pokemon__in=[row.id for row in rows]).order_by("id")
+        for (pokemon_id, name) in found.values_list("pokemon_id", "location__name"):
+            locations[pokemon_id].append(name)
+        for row in rows:
+            row.locations = locations.get(row.id, [])
+    return rows
+
+
+# The profiles of a queryset as ProfileRows. One query.
+def profile_rows(profiles):
+    return [ProfileRow(*values) for values in profiles.values_list(*ProfileRow.FIELDS)]
+
+
+# The most Pokemon a search across a user's profiles gives.
+SEARCH_LIMIT = 200
+
+
+# The Pokemon named "text" (by prefix, case-insensitively) in any of a
+# user's profiles, as (ProfileRow, [PokemonRow]) pairs ordered by profile
+# name, and whether there were more than "limit" of them. One query,
+# however many profiles. An index can't hold both a profile's user and a
+# Pokemon's name, so the user's profiles are read in name order through
+# the (user, name) index on profiles, and in each of them the Pokemon
+# through (profile, name)'s. Rows come out a profile at a time, in order,
+# so the query stops once it has "limit" of them.
+def search_profiles(user, text, limit=SEARCH_LIMIT):
+    if not text:
+        return ([], False)
+    pokemon = (models.Pokemon.objects.filter(profile__user=user, name__istartswith=text)
+               .order_by("profile__name", "profile_id", "name"))
+    found = list(pokemon.values_list(*["profile__" + field for field in ProfileRow.FIELDS], *PokemonRow.FIELDS)[:limit + 1])
+
+    groups = []
+    for values in found[:limit]:
+        (profile_values, pokemon_values) = (values[:len(ProfileRow.FIELDS)], values[len(ProfileRow.FIELDS):])
+        if not groups or groups[-1][0].id != profile_values[0]:
+            groups.append((ProfileRow(*profile_values), []))
+        groups[-1][1].append(PokemonRow(*pokemon_values))
+    return (groups, len(found) > limit)
@@ -0,0 +1,80 @@
+# searchindex.py
+# The free-text search index (see models.SearchTerm). Every word of a
+# Pokemon's name, types (codes and names), locations, moves and abilities
+# is stored once per Pokemon, so a search word is looked up by prefix in
+# one index, rather than joined across Pokemon, Findable, Learnable and
+# Capable and their names.
+#
+# A Pokemon's words are made again whenever it, or one of its locations,
+# moves or abilities, changes (see versions.py).
+
+import re
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Q
+
+from . import models
+
+TYPE_LABELS = dict(models.Type.choices)
+
+# Words longer than this are stored cut short; searching for a longer word
+# looks for the start of it.
+MAX_TERM_LENGTH = models.SearchTerm._meta.get_field("term").max_length
+
+WORD = re.compile(r"\w+")
+
+
+# The words of a text, in lowercase, e.g. "Route 1" -> ["route", "1"].
+def words(text):
+    return [word[:MAX_TERM_LENGTH] for word in WORD.findall(text.lower())]
+
+
+# The terms a Pokemon is found by, from its name, types and the names of
+# its locations, moves and abilities.
+def terms(name, types, related_names):
+    texts = [name] + related_names
+    for type in types:
+        if type:
+            texts += [type, TYPE_LABELS.get(type, "")]
+    return {word for text in texts for word in words(text)}
+
+
+# Makes the terms of these Pokemon again. Six queries, however many
+# Pokemon.
+def reindex(pokemon_ids):
+    pokemon_ids = list(pokemon_ids)
+    if not pokemon_ids:
+        return
+    related_names = defaultdict(list)
+    for (through, field) in ((models.Findable, "location__name"), (models.Learnable, "move__name"),
+                             (models.Capable, "ability__name")):
+        for (pokemon_id, name) in through.objects.filter(pokemon__in=pokemon_ids).values_list("pokemon_id", field):
+            related_names[pokemon_id].append(name)
+
+    pokemon = models.Pokemon.objects.filter(id__in=pokemon_ids).values_list("id", "profile_id", "name", "type_one", "type_two")
+    new_terms = [models.SearchTerm(profile_id=profile_id, pokemon_id=pokemon_id, term=term)
+                 for (pokemon_id, profile_id, name, type_one, type_two) in pokemon
+                 for term in terms(name, (type_one, type_two), related_names[pokemon_id])]
+    # In one transaction, so a Pokemon is never left without terms. Terms
+    # another reindex of the same Pokemon wrote meanwhile are skipped.
+    with transaction.atomic():
+        models.SearchTerm.objects.filter(pokemon__in=pokemon_ids).delete()
+        models.SearchTerm.objects.bulk_create(new_terms, batch_size=1000, ignore_conflicts=True)
+
+
+# Pokemon with a term starting with every word of "text", e.g. "rock tun"
+# finds those found in "Rock Tunnel". With a profile, each word is a single
+# lookup in the (profile, term) index.
+def word_filter(text, profile=None):
+    if not words(text):
+        return Q(pk__in=[])
+    condition = Q()
+    for word in words(text):
+        # Terms are in lowercase anyway, and on MySQL only a
+        # case-insensitive LIKE can use the index.
+        found = models.SearchTerm.objects.filter(term__istartswith=word)
+        if profile is not None:
+            found = found.filter(profile=profile)
+        condition &= Q(id__in=found.values("pokemon_id"))
+    return condition
@@ -0,0 +1,115 @@
+# similarity.py
+# Finds the Pokemon of a profile most like another: those sharing the most
+# of its types, moves, abilities and locations (by Jaccard similarity of
+# the two sets). Comparing a Pokemon with every other would join all of
+# them, so each Pokemon has a MinHash signature instead, cut into bands
+# (locality-sensitive hashing): Pokemon sharing a band's hash are
+# candidates, and only they are compared. See models.SimilarityBucket.
+#
+# A Pokemon's buckets are made again whenever it, or one of its locations,
+# moves or abilities, changes (see versions.py).
+
+import hashlib
+import random
+from collections import defaultdict, namedtuple
+
+from django.db import transaction
+from django.db.models import Count
+
+from . import models
+
+# The signature is BANDS bands of ROWS hashes each. Pokemon with a Jaccard
+# similarity of s share a band with a chance of 1 - (1 - s^ROWS)^BANDS:
+# about 50% at s = 0.2, and 99% at s = 0.4.
+BANDS = 32
+ROWS = 2
+
+# How many candidates are compared, at most.
+CANDIDATES = 50
+
+# The hash functions of the signature, (a * x + b) mod PRIME for a
+# feature's hash x. Fixed, so signatures made by every process agree.
+PRIME = (1 << 61) - 1
+_rng = random.Random(25)
+HASHES = [(_rng.randrange(1, PRIME), _rng.randrange(PRIME)) for _ in range(BANDS * ROWS)]
+
+# A Pokemon like another, and how alike they are (0 to 1).
+Similar = namedtuple("Similar", ("id", "name", "image_url", "similarity"))
+
+
+def _hash(text, signed=False):
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "big", signed=signed)
+
+
+# The MinHash signature of a set of features: for each hash function, the
+# smallest hash of any feature.
+def signature(features):
+    hashed = [_hash(feature) for feature in features]
+    if not hashed:
+        return []
+    return [min((a * x + b) % PRIME for x in hashed) for (a, b) in HASHES]
+
+
+# The buckets of a signature, one per band. The band is part of the hash,
+# so the buckets of every band can be kept in one index.
+def buckets(signature):
+    return [_hash("%d:%s" % (band, signature[band * ROWS:(band + 1) * ROWS]), signed=True)
+            for band in range(BANDS) if signature]
+
+
+# The features of these Pokemon, e.g. {"type:FIR", "move:12", ...}, by
+# Pokemon. Four queries, however many Pokemon.
+def features(pokemon_ids):
+    found = defaultdict(set)
+    for (pokemon_id, type_one, type_two) in models.Pokemon.objects.filter(id__in=pokemon_ids).values_list(
+            "id", "type_one", "type_two"):
+        found[pokemon_id].update("type:" + type for type in (type_one, type_two) if type)
+    for (through, field) in ((models.Learnable, "move"), (models.Capable, "ability"), (models.Findable, "location")):
+        for (pokemon_id, related_id) in through.objects.filter(pokemon__in=pokemon_ids).values_list(
+                "pokemon_id", field + "_id"):
+            found[pokemon_id].add("%s:%d" % (field, related_id))
+    return found
+
+
+# Makes the buckets of these Pokemon again. Six queries, however many
+# Pokemon.
+def reindex(pokemon_ids):
+    pokemon_ids = list(pokemon_ids)
+    if not pokemon_ids:
+        return
+    found = features(pokemon_ids)
+    pokemon = models.Pokemon.objects.filter(id__in=pokemon_ids).values_list("id", "profile_id")
+    new_buckets = [models.SimilarityBucket(profile_id=profile_id, pokemon_id=pokemon_id, bucket=bucket)
+                   for (pokemon_id, profile_id) in pokemon
+                   for bucket in set(buckets(signature(found[pokemon_id])))]
+    # In one transaction, so a Pokemon is never left without buckets.
+    # Buckets another reindex of the same Pokemon wrote meanwhile are
+    # skipped.
+    with transaction.atomic():
+        models.SimilarityBucket.objects.filter(pokemon__in=pokemon_ids).delete()
+        models.SimilarityBucket.objects.bulk_create(new_buckets, batch_size=1000, ignore_conflicts=True)
+
+
+# The Pokemon of its profile most like this one, most alike first. The
+# candidates sharing the most buckets with it are found in one query, through
+# the (profile, bucket) index, and compared by their features, so it takes
+# the same six queries however big the profile is.
+def most_similar(pokemon, limit=6):
+    mine = models.SimilarityBucket.objects.filter(pokemon=pokemon.id).values("bucket")
+    candidates = list(models.SimilarityBucket.objects.filter(profile=pokemon.profile_id, bucket__in=mine)
+                      .exclude(pokemon=pokemon.id)
+                      .values("pokemon").annotate(shared=Count("id")).order_by("-shared", "pokemon")
+                      .values_list("pokemon", flat=True)[:CANDIDATES])
+    if not candidates:
+        return []
+
+    found = features(candidates + [pokemon.id])
+    scores = {}
+    for candidate in candidates:
+        union = found[candidate] | found[pokemon.id]
+        if union:
+            scores[candidate] = len(found[candidate] & found[pokemon.id]) / len(union)
+    rows = models.Pokemon.objects.filter(id__in=candidates).values_list("id", "name", "image_url")
+    similar = [Similar(id, name, image_url, scores[id]) for (id, name, image_url) in rows if scores.get(id)]
+    similar.sort(key=lambda each: (-each.similarity, each.name))
+    return similar[:limit]
@@ -0,0 +1,283 @@
+# spritecache.py
+# An on-disk cache of Pokemon sprites, so pages load sprites from us (see
+# the get_sprite view) instead of hot-linking full size images from a third
+# party. Each sprite is downloaded once, by the resolve_sprites worker, and
+# resized into small thumbnails.
+#
+# The cache is content-addressed. Under settings.SPRITE_CACHE_DIR:
+#   urls/<digest of the image URL>          the digest of what it served
+#   originals/<ab>/<digest>.png             the downloaded image
+#   thumbnails/<size>/<ab>/<digest>.png     the image, fit within size x size
+# Files are never changed once written, so they can be served with
+# "immutable" cache headers.
+
+import hashlib
+import json
+import os
+import tempfile
+from io import BytesIO
+from pathlib import Path
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.urls import reverse
+
+from . import pokeapi
+
+# Pillow is optional. Without it, thumbnails are the original images.
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+# Raised when a sprite isn't cached and can't be downloaded.
+class SpriteUnavailable(Exception):
+    pass
+
+
+def url_digest(image_url):
+    return hashlib.sha256(image_url.encode()).hexdigest()[:32]
+
+
+# The URL our get_sprite view serves a Pokemon's sprite at, as a thumbnail
+# of the given size.
+def sprite_url(pokemon_id, image_url, size):
+    return reverse("sprite", args=[pokemon_id, url_digest(image_url), size])
+
+
+def _cache_dir():
+    return Path(settings.SPRITE_CACHE_DIR)
+
+
+def _original_path(digest):
+    return _cache_dir() / "originals" / digest[:2] / (digest + ".png")
+
+
+def _thumbnail_path(digest, size):
+    return _cache_dir() / "thumbnails" / str(size) / digest[:2] / (digest + ".png")
+
+
+# Writes a file so that readers see either nothing or all of it, even if
+# several processes write the same file at once.
+def _write_atomic(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    (fd, temporary) = tempfile.mkstemp(dir=path.parent)
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(data)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+# The content digest of the sprite whose URL has this digest, if it has
+# been downloaded.
+def cached_digest(image_url_digest):
+    try:
+        return (_cache_dir() / "urls" / image_url_digest).read_text().strip() or None
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+
+
+def _download(image_url):
+    if urlparse(image_url).hostname not in settings.SPRITE_HOSTS:
+        raise SpriteUnavailable("%s isn't a sprite host." % image_url)
+    try:
+        response = pokeapi.sprite_client().get(image_url)
+    except pokeapi.requests.exceptions.RequestException as e:
+        raise SpriteUnavailable(str(e))
+    if response.status_code != 200:
+        raise SpriteUnavailable("%s answered %d." % (image_url, response.status_code))
+    return response.content
+
+
+# Fits an image within size x size pixels, as a PNG. Pixel art is scaled
+# without smoothing, so sprites stay crisp.
+def _resize(data, size):
+    if Image is None:
+        return data
+    with Image.open(BytesIO(data)) as image:
+        image = image.convert("RGBA")
+        image.thumbnail((size, size), Image.NEAREST)
+        output = BytesIO()
+        image.save(output, format="PNG", optimize=True)
+        return output.getvalue()
+
+
+# The path of the size x size thumbnail of the sprite whose URL has this
+# digest (see url_digest()), and its content digest (usable as an ETag), or
+# None if the sprite hasn't been downloaded.
+def cached_thumbnail(image_url_digest, size):
+    digest = cached_digest(image_url_digest)
+    if digest is None:
+        return None
+    path = _thumbnail_path(digest, size)
+    if not path.exists():
+        try:
+            _write_atomic(path, _resize(_original_path(digest).read_bytes(), size))
+        except (OSError, ValueError) as e:
+            raise SpriteUnavailable(str(e))
+    return (path, digest)
+
+
+# Downloads the sprite at image_url into the cache, if it isn't there yet,
+# and returns its content digest. Raises SpriteUnavailable if it can't be
+# downloaded. Only the resolve_sprites worker calls this (see sprites.py);
+# views only serve what is already cached.
+def download(image_url):
+    key = url_digest(image_url)
+    digest = cached_digest(key)
+    if digest is None:
+        data = _download(image_url)
+        digest = hashlib.sha256(data).hexdigest()[:32]
+        if not _original_path(digest).exists():
+            _write_atomic(_original_path(digest), data)
+        _write_atomic(_cache_dir() / "urls" / key, digest.encode())
+    return digest
+
+
+# Sprite atlases: all of a profile's cached sprites packed into one image,
+# so the dashboard loads one image instead of one per Pokemon. Atlases are
+# stored (and served) like the sprites, by content digest:
+#   atlases/<digest>.png                    the atlas
+#   atlases/profiles/<profile id>.json      the profile's current (and previous) atlas
+# An atlas is a grid of ATLAS_COLUMNS columns of ATLAS_CELL_SIZE pixel
+# cells. Cells keep their place when a profile's sprites change: new
+# sprites are pasted into free cells of a copy of the previous atlas, and
+# the atlas is only repacked once most of its cells are unused.
+ATLAS_CELL_SIZE = 64
+ATLAS_COLUMNS = 16
+
+
+class Atlas:
+
+    def __init__(self, digest, cells):
+        self.digest = digest
+        # The URL digest (see url_digest()) of the sprite in each cell, or
+        # None for free cells.
+        self.cells = cells
+        self.cell_of = {key: cell for (cell, key) in enumerate(cells) if key is not None}
+
+    @property
+    def rows(self):
+        return max(1, -(-len(self.cells) // ATLAS_COLUMNS))
+
+    # The cell holding the sprite at image_url, or None if it isn't in the
+    # atlas.
+    def cell(self, image_url):
+        if not image_url:
+            return None
+        return self.cell_of.get(url_digest(image_url))
+
+    # CSS giving the elements of class "atlas_sprite sprite_cell_<cell>"
+    # the sprite in that cell, at any element size.
+    def css(self, url):
+        rules = [".atlas_sprite { background-image: url(\"%s\"); background-size: %d%% %d%%; }"
+                 % (url, ATLAS_COLUMNS * 100, self.rows * 100)]
+        for cell in sorted(self.cell_of.values()):
+            (row, column) = divmod(cell, ATLAS_COLUMNS)
+            rules.append(".sprite_cell_%d { background-position: %s%% %s%%; }" % (
+                cell, _percent(column, ATLAS_COLUMNS), _percent(row, self.rows)))
+        return "\n".join(rules)
+
+
+def _percent(index, count):
+    return "%g" % (100 * index / (count - 1)) if count > 1 else "0"
+
+
+def atlas_path(digest):
+    return _cache_dir() / "atlases" / (digest + ".png")
+
+
+def _manifest_path(profile_id):
+    return _cache_dir() / "atlases" / "profiles" / ("%d.json" % profile_id)
+
+
+def _read_manifest(profile_id):
+    try:
+        manifest = json.loads(_manifest_path(profile_id).read_text())
+    except (OSError, ValueError):
+        return None
+    if not atlas_path(manifest["atlas"]).exists():
+        return None
+    return Atlas(manifest["atlas"], manifest["cells"])
+
+
+# The atlas last made for this profile by atlas_for(), or None.
+def current_atlas(profile_id):
+    return _read_manifest(profile_id)
+
+
+# The digests of the atlases of this profile that may still be shown: its
+# current atlas, and the one before it (for pages made just before the
+# current one was).
+def atlas_digests(profile_id):
+    try:
+        manifest = json.loads(_manifest_path(profile_id).read_text())
+    except (OSError, ValueError):
+        return set()
+    return {digest for digest in (manifest["atlas"], manifest.get("previous")) if digest}
+
+
+# The atlas of the (already downloaded) sprites at the given URLs, kept
+# for this profile. Sprites that haven't been downloaded yet are left out,
+# and added once they have. Returns None if there are no such sprites, or
+# Pillow isn't installed. Only the resolve_sprites worker makes atlases
+# (see sprites.update_atlases); views read current_atlas().
+def atlas_for(profile_id, image_urls):
+    if Image is None:
+        return None
+    wanted = {url_digest(image_url) for image_url in image_urls if image_url}
+    atlas = _read_manifest(profile_id)
+    if atlas is None or len(wanted & atlas.cell_of.keys()) < len(atlas.cell_of) // 2:
+        # Start over, rather than keep an atlas that is mostly unused.
+        atlas = Atlas(None, [])
+
+    new = {}
+    for key in sorted(wanted - atlas.cell_of.keys()):
+        try:
+            cached = cached_thumbnail(key, ATLAS_CELL_SIZE)
+        except SpriteUnavailable:
+            cached = None
+        if cached is not None:
+            new[key] = cached[0]
+    if not new:
+        return atlas if atlas.digest is not None else None
+
+    # Reuse the cells of sprites the profile no longer shows, then add more.
+    cells = [key if key in wanted else None for key in atlas.cells]
+    free = [cell for (cell, key) in enumerate(cells) if key is None]
+    placed = {}
+    for key in new:
+        cell = free.pop(0) if free else len(cells)
+        if cell == len(cells):
+            cells.append(None)
+        cells[cell] = key
+        placed[cell] = new[key]
+    updated = Atlas(None, cells)
+
+    image = Image.new("RGBA", (ATLAS_COLUMNS * ATLAS_CELL_SIZE, updated.rows * ATLAS_CELL_SIZE))
+    if atlas.digest is not None:
+        with Image.open(atlas_path(atlas.digest)) as previous:
+            image.paste(previous, (0, 0))
+    for (cell, path) in placed.items():
+        (row, column) = divmod(cell, ATLAS_COLUMNS)
+        x = column * ATLAS_CELL_SIZE
+        y = row * ATLAS_CELL_SIZE
+        # Clear what a reused cell held before.
+        image.paste((0, 0, 0, 0), (x, y, x + ATLAS_CELL_SIZE, y + ATLAS_CELL_SIZE))
+        with Image.open(path) as sprite:
+            sprite = sprite.convert("RGBA")
+            image.paste(sprite, (x + (ATLAS_CELL_SIZE - sprite.width) // 2, y + (ATLAS_CELL_SIZE - sprite.height) // 2))
+
+    output = BytesIO()
+    image.save(output, format="PNG", optimize=True)
+    data = output.getvalue()
+    updated.digest = hashlib.sha256(data).hexdigest()[:32]
+    if not atlas_path(updated.digest).exists():
+        _write_atomic(atlas_path(updated.digest), data)
+    _write_atomic(_manifest_path(profile_id), json.dumps(
+        {"atlas": updated.digest, "previous": atlas.digest, "cells": cells}).encode())
+    return updated
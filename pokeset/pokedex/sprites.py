@@ -0,0 +1,249 @@
+# sprites.py
+# Looks up Pokemon sprites on PokeAPI. This never happens while a page is
+# being rendered: saving a new or renamed Pokemon queues a lookup, and the
+# resolve_sprites management command works through the queue in the
+# background, and downloads the sprites it finds into the sprite cache
+# (see spritecache.py). Views only ever read "image_url", and the cache.
+#
+# Lookups are done in bulk: each distinct species name is fetched once
+# (however many profiles it appears in), over a shared keep-alive session
+# by a bounded pool of threads (through the PokeAPI client in pokeapi.py,
+# which handles timeouts, retries and outages), and the results are
+# written back with a single bulk_update(). Names PokeAPI doesn't know are
+# remembered for a while (see models.UnknownSpecies), and not looked up
+# again until then.
+# Species in the local mirror of PokeAPI (see mirror.py) are never looked
+# up at all.
+
+import logging
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from . import mirror, models, pokeapi, spritecache, versions
+
+logger = logging.getLogger(__name__)
+
+
+# Queues a sprite lookup for a Pokemon. Queuing it twice is harmless.
+def queue_lookup(pokemon):
+    models.SpriteLookup.objects.get_or_create(pokemon=pokemon)
+
+
+# Whether the sprite at image_url has been downloaded into the sprite cache.
+def is_downloaded(image_url):
+    return spritecache.cached_digest(spritecache.url_digest(image_url)) is not None
+
+
+# Queues every Pokemon that has no sprite yet, or whose sprite hasn't been
+# downloaded (and isn't already queued), except those with a name PokeAPI
+# is known not to have. Running this regularly retries unknown names once
+# they expire. Returns how many Pokemon were queued.
+def queue_missing():
+    missing = models.Pokemon.objects.filter(spritelookup__isnull=True).values_list("id", "name", "image_url")
+    unknown = known_unknown()
+    lookups = [models.SpriteLookup(pokemon_id=pokemon_id) for (pokemon_id, name, image_url) in missing
+               if not (image_url and is_downloaded(image_url)) and name.lower() not in unknown]
+    models.SpriteLookup.objects.bulk_create(lookups, ignore_conflicts=True)
+    return len(lookups)
+
+
+# The (lowercase) names PokeAPI is known not to have, out of "names", or
+# out of all names if "names" is None.
+def known_unknown(names=None):
+    cutoff = timezone.now() - timedelta(seconds=settings.POKEAPI_NEGATIVE_TTL)
+    unknown = models.UnknownSpecies.objects.filter(failed_at__gt=cutoff)
+    if names is not None:
+        unknown = unknown.filter(name__in=names)
+    return set(unknown.values_list("name", flat=True))
+
+
+# Remembers that PokeAPI doesn't know these (lowercase) names. Names
+# already remembered (e.g. by another worker) are upserted.
+def remember_unknown(names):
+    if names:
+        now = timezone.now()
+        # MySQL upserts on any unique key, and can't be told which.
+        supports_target = connection.features.supports_update_conflicts_with_target
+        models.UnknownSpecies.objects.bulk_create(
+            [models.UnknownSpecies(name=name, failed_at=now) for name in names],
+            update_conflicts=True, unique_fields=["name"] if supports_target else None, update_fields=["failed_at"])
+
+
+# Forgets that PokeAPI doesn't know these names (or any name, if "names"
+# is None), and queues the Pokemon that have them so they are looked up
+# again. Returns how many Pokemon were queued.
+def retry_unknown(names=None):
+    unknown = models.UnknownSpecies.objects.all()
+    if names is not None:
+        unknown = unknown.filter(name__in=[name.lower() for name in names])
+    names = set(unknown.values_list("name", flat=True))
+    unknown.delete()
+
+    missing = models.Pokemon.objects.filter(image_url="", spritelookup__isnull=True).values_list("id", "name")
+    lookups = [models.SpriteLookup(pokemon_id=pokemon_id) for (pokemon_id, name) in missing if name.lower() in names]
+    models.SpriteLookup.objects.bulk_create(lookups, ignore_conflicts=True)
+    return len(lookups)
+
+
+# Raised when PokeAPI answered, but has no sprite for a name.
+class SpriteNotFound(Exception):
+    pass
+
+
+_executor = None
+_in_flight = {}
+_lock = threading.Lock()
+
+
+# The thread pool shared by all lookups in this process, sized by
+# settings.POKEAPI_WORKERS.
+def _pool():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.POKEAPI_WORKERS, thread_name_prefix="sprites")
+        return _executor
+
+
+# Client errors that are worth retrying: the request timed out, or was
+# rate limited. Any other 4xx means PokeAPI won't have the sprite, however
+# often it is asked.
+RETRIED_CLIENT_ERRORS = (408, 429)
+
+
+# The URL of the default front sprite of the species with this name.
+# Raises SpriteNotFound if there is none (or PokeAPI refuses the name), and
+# requests.RequestException if PokeAPI couldn't be reached.
+def fetch_sprite_url(name):
+    response = pokeapi.client().get("pokemon/" + mirror.species_key(name), params={"format": "json"})
+    if 400 <= response.status_code < 500 and response.status_code not in RETRIED_CLIENT_ERRORS:
+        raise SpriteNotFound(name)
+    response.raise_for_status()
+    try:
+        sprite_url = response.json()["sprites"]["front_default"]
+    except (ValueError, KeyError, TypeError):
+        raise SpriteNotFound(name)
+    if not sprite_url:
+        raise SpriteNotFound(name)
+    return sprite_url
+
+
+# A future for the sprite URL of this species. Concurrent callers asking
+# for the same species share a single request.
+def _single_flight(name):
+    executor = _pool()
+    with _lock:
+        future = _in_flight.get(name)
+        if future is None:
+            future = _in_flight[name] = executor.submit(fetch_sprite_url, name)
+            future.add_done_callback(lambda done: _forget(name, done))
+    return future
+
+
+def _forget(name, future):
+    with _lock:
+        if _in_flight.get(name) is future:
+            del _in_flight[name]
+
+
+# Looks up the sprites of many species names at once. Returns
+# {lowercase name: sprite URL}, with "" for species PokeAPI doesn't know.
+# Names that couldn't be looked up (PokeAPI unreachable) are left out.
+def fetch_sprite_urls(names):
+    names = {name.lower() for name in names}
+    # Species in the local mirror of PokeAPI need no request at all.
+    sprite_urls = mirror.sprite_urls(names)
+    remaining = names - sprite_urls.keys()
+    if settings.POKEAPI_OFFLINE:
+        sprite_urls.update((name, "") for name in remaining)
+        return sprite_urls
+
+    unknown = known_unknown(remaining)
+    sprite_urls.update((name, "") for name in unknown)
+
+    futures = {name: _single_flight(name) for name in remaining - unknown}
+    not_found = []
+    for (name, future) in futures.items():
+        try:
+            sprite_urls[name] = future.result()
+        except SpriteNotFound:
+            logger.info("PokeAPI has no sprite for %r.", name)
+            sprite_urls[name] = ""
+            not_found.append(name)
+        except requests.exceptions.RequestException as e:
+            logger.warning("Could not look up the sprite for %r: %s", name, e)
+    remember_unknown(not_found)
+    return sprite_urls
+
+
+# Downloads the sprites at these URLs into the sprite cache, over the
+# shared thread pool. Sprites that can't be downloaded are logged, and
+# served from their original URL meanwhile.
+def download_sprites(image_urls):
+    def download(image_url):
+        try:
+            spritecache.download(image_url)
+        except spritecache.SpriteUnavailable as e:
+            logger.warning("Could not download the sprite at %s: %s", image_url, e)
+    list(_pool().map(download, {image_url for image_url in image_urls if image_url}))
+
+
+# Makes the sprite atlases of these profiles again (see
+# spritecache.atlas_for), from the sprites downloaded so far. Profiles whose
+# sprites are all in their atlas already keep it. One query.
+def update_atlases(profile_ids):
+    image_urls = defaultdict(set)
+    found = models.Pokemon.objects.filter(profile__in=profile_ids).exclude(image_url="").values_list("profile_id", "image_url")
+    for (profile_id, image_url) in found.distinct():
+        image_urls[profile_id].add(image_url)
+    for (profile_id, urls) in image_urls.items():
+        spritecache.atlas_for(profile_id, urls)
+
+
+# Looks up and saves the sprites of the given Pokemon, and downloads them.
+# Returns the Pokemon whose sprite was saved (Pokemon PokeAPI couldn't be
+# reached for, or that were renamed meanwhile, are left out).
+def resolve_many(pokemon_list):
+    pokemon_list = list(pokemon_list)
+    sprite_urls = fetch_sprite_urls(pokemon.name for pokemon in pokemon_list)
+
+    # Skip Pokemon renamed since they were read, so a lookup can't
+    # overwrite the sprite of the new name (which is queued anyway).
+    current_names = dict(models.Pokemon.objects.filter(id__in=[pokemon.id for pokemon in pokemon_list]).values_list("id", "name"))
+    resolved = []
+    for pokemon in pokemon_list:
+        sprite_url = sprite_urls.get(pokemon.name.lower())
+        if sprite_url is not None and current_names.get(pokemon.id) == pokemon.name:
+            pokemon.image_url = sprite_url
+            resolved.append(pokemon)
+
+    # Only touch image_url, so a lookup can't undo other edits made meanwhile.
+    models.Pokemon.objects.bulk_update(resolved, ["image_url"])
+    versions.sprites_changed([pokemon.id for pokemon in resolved])
+    download_sprites(pokemon.image_url for pokemon in resolved)
+    update_atlases({pokemon.profile_id for pokemon in resolved})
+    return resolved
+
+
+# Works through (at most "limit" of) the queued lookups, oldest first.
+# Lookups that failed because PokeAPI couldn't be reached stay queued, at
+# the back of the queue, so they are retried later without holding up
+# newer lookups. Returns how many lookups were completed.
+def resolve_queued(limit=None):
+    lookups = models.SpriteLookup.objects.select_related("pokemon").order_by("queued_at")
+    if limit is not None:
+        lookups = lookups[:limit]
+    pokemon_list = [lookup.pokemon for lookup in lookups]
+
+    resolved = resolve_many(pokemon_list)
+    models.SpriteLookup.objects.filter(pokemon__in=resolved).delete()
+    failed = {pokemon.id for pokemon in pokemon_list} - {pokemon.id for pokemon in resolved}
+    models.SpriteLookup.objects.filter(pokemon__in=failed).update(queued_at=timezone.now())
+    return len(resolved)
@@ -1,6 +1,9 @@
 from django import template
+from django.urls import reverse
 from django.utils.safestring import mark_safe
 
+from .. import spritecache
+
 register = template.Library()
 
 @register.filter
@@ -43,4 +46,17 @@ def typecolor(type):
         text = '<span style="background-color:{color}" class="type_symbol">{text}</span>'.format(color="hotpink", text=type)
     else:
         text = '<span style="display:none" class="type_symbol">{text}</span>'
-    return mark_safe(text)
\ No newline at end of file
+    return mark_safe(text)
+
+# The URL of a Pokemon's sprite in our sprite cache, as a thumbnail of the
+# given size, e.g. {{ pokemon|sprite:64 }}.
+@register.filter
+def sprite(pokemon, size):
+    if not pokemon.image_url:
+        return ""
+    return spritecache.sprite_url(pokemon.id, pokemon.image_url, size)
+
+# The CSS placing each sprite of a sprite atlas (see spritecache.Atlas).
+@register.filter
+def atlas_css(atlas):
+    return mark_safe(atlas.css(reverse("sprite_atlas", args=[atlas.digest])))
@@ -1,4 +1,19 @@
-from django.test import TestCase
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO, StringIO
+import requests
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from selenium import webdriver
 from django.contrib.staticfiles.testing import StaticLiveServerTestCase
 from selenium.webdriver.chrome.service import Service as ChromeService
@@ -10,7 +25,11 @@ from selenium.webdriver.chrome.options import Options as ChromeOptions
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
 from django.contrib.auth.models import User
-from .models import Pokemon, Profile
+from PIL import Image
+from django.core.exceptions import ValidationError
+from .forms import EditPokemonForm, NewPokemonForm
+from .models import Ability, Chart, Findable, Learnable, Location, Move, Pokemon, PokemonDetail, Profile, SearchTerm, SimilarityBucket, Species, SpriteLookup, UnknownSpecies
+from . import dashboard, details, effectiveness, fuzzy, mirror, pokeapi, query, readmodel, searchindex, similarity, spritecache, sprites, versions
 
 # URLs for testing
 LOGIN_URL = '/accounts/login/'
@@ -65,6 +84,1604 @@ class CorrectTemplateTestCase(TestCase):
 
 
 
+class TypeEffectivenessTestCase(TestCase):
+    """
+    Set of test cases that test the compiled type chart
+    """
+
+    def setUp(self):
+        self.chart = effectiveness.builtin_chart(Chart.GEN_2_5)
+
+    def test_dual_type_buckets(self):
+        charizard = Pokemon(name="Charizard", type_one="FIR", type_two="FLY")
+        self.chart.apply([charizard])
+        self.assertEqual(charizard.offensive_4, ("ROC",))
+        self.assertEqual(charizard.offensive_2, ("WAT", "ELE"))
+        self.assertEqual(charizard.offensive_025, ("BUG", "GRA"))
+        self.assertEqual(charizard.offensive_0, ("GRO",))
+
+    def test_single_type_buckets(self):
+        pikachu = Pokemon(name="Pikachu", type_one="ELE")
+        self.chart.apply([pikachu])
+        self.assertEqual(pikachu.offensive_2, ("GRO",))
+        self.assertEqual(pikachu.offensive_05, ("FLY", "STE", "ELE"))
+        self.assertEqual(pikachu.offensive_4, ())
+
+    def test_batch_matches_single_lookups(self):
+        pairs = [("WAT", ""), ("GRA", "POI"), ("GHO", "NOR"), ("???", "")]
+        batch = self.chart.classify(pairs)
+        for (pair, buckets) in zip(pairs, batch):
+            self.assertEqual(buckets, self.chart.classify([pair])[0])
+        self.assertEqual(batch[2]["offensive_0"], ("NOR", "FIG", "GHO"))
+        self.assertEqual(self.chart.multipliers(pairs).shape, (len(pairs), len(effectiveness.TYPE_CODES)))
+
+
+class TypeChartTestCase(TestCase):
+    """
+    Set of test cases that test choosing a type chart per profile
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(USERNAME, EMAIL, PASSWORD)
+
+    def test_generation_charts_differ(self):
+        gengar = Pokemon(name="Gengar", type_one="GHO", type_two="POI")
+        effectiveness.builtin_chart(Chart.GEN_6).apply([gengar])
+        self.assertNotIn("STE", gengar.offensive_05)
+        ekans = Pokemon(name="Ekans", type_one="POI")
+        effectiveness.builtin_chart(Chart.GEN_1).apply([ekans])
+        self.assertEqual(ekans.offensive_2, ("GRO", "BUG", "PSY"))
+
+    def test_profile_uses_its_chart(self):
+        profile = Profile.objects.create(name="gen1", user=self.user, type_chart=Chart.GEN_1)
+        self.assertIs(effectiveness.chart_for(profile), effectiveness.builtin_chart(Chart.GEN_1))
+
+    def test_custom_chart_is_compiled_once_per_version(self):
+        custom = {"FIR": {"WAT": 2.0}, "WAT": {"FIR": 0.5}}
+        first = Profile.objects.create(name="custom1", user=self.user, type_chart=Chart.CUSTOM, custom_type_chart=custom)
+        second = Profile.objects.create(name="custom2", user=self.user, type_chart=Chart.CUSTOM, custom_type_chart=custom)
+        self.assertEqual(first.type_chart_version, second.type_chart_version)
+        self.assertIs(effectiveness.chart_for(first), effectiveness.chart_for(second))
+
+        squirtle = Pokemon(name="Squirtle", type_one="WAT")
+        effectiveness.chart_for(first).apply([squirtle])
+        self.assertEqual(squirtle.offensive_2, ("FIR",))
+
+        first.custom_type_chart = {"FIR": {"WAT": 0}}
+        first.save()
+        self.assertNotEqual(first.type_chart_version, second.type_chart_version)
+        effectiveness.chart_for(first).apply([squirtle])
+        self.assertEqual(squirtle.offensive_0, ("FIR",))
+
+    def test_invalid_custom_chart(self):
+        profile = Profile(name="bad", user=self.user, type_chart=Chart.CUSTOM, custom_type_chart={"FIR": {"XYZ": 3}})
+        with self.assertRaises(ValidationError):
+            profile.full_clean()
+
+
+class StubPokeAPIHandler(BaseHTTPRequestHandler):
+    """
+    Local stand-in for PokeAPI. Serves the sprites in server.species and
+    the images in server.images, and records the species names (or image
+    file names) it was asked for in server.requested
+    """
+
+    def do_GET(self):
+        name = self.path.split("?")[0].rstrip("/").split("/")[-1]
+        self.server.requested.append(name)
+        time.sleep(self.server.delay)
+        if self.server.errors > 0:
+            self.server.errors -= 1
+            body = b"Service Unavailable"
+            self.send_response(503)
+        elif name in self.server.statuses:
+            body = b"Error"
+            self.send_response(self.server.statuses[name])
+        elif name in self.server.species:
+            body = json.dumps({"sprites": {"front_default": self.server.species[name]}}).encode()
+            self.send_response(200)
+        elif name in self.server.images:
+            body = self.server.images[name]
+            self.send_response(200)
+        else:
+            body = b"Not Found"
+            self.send_response(404)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_pokeapi(species):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubPokeAPIHandler)
+    server.species = species
+    server.images = {}
+    # Status codes to answer with, by name.
+    server.statuses = {}
+    server.requested = []
+    # Seconds to wait before answering, and how many requests to fail.
+    server.delay = 0
+    server.errors = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class PokeAPIClientTestCase(TestCase):
+    """
+    Set of test cases that test timeouts, retries and the circuit breaker
+    of the PokeAPI client
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.pokeapi = start_stub_pokeapi({"pikachu": "http://sprites.test/25.png"})
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pokeapi.shutdown()
+        cls.pokeapi.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.pokeapi.requested.clear()
+        self.pokeapi.delay = 0
+        self.pokeapi.errors = 0
+        settings = override_settings(
+            POKEAPI_URL="http://127.0.0.1:%d/api/v2/" % self.pokeapi.server_port,
+            POKEAPI_READ_TIMEOUT=0.2,
+            POKEAPI_RETRIES=1,
+            POKEAPI_RETRY_BACKOFF=0,
+            POKEAPI_FAILURE_THRESHOLD=2,
+            POKEAPI_COOL_DOWN=60,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_server_errors_are_retried(self):
+        self.pokeapi.errors = 1
+        self.assertEqual(sprites.fetch_sprite_url("Pikachu"), "http://sprites.test/25.png")
+        stats = pokeapi.client().stats()
+        self.assertEqual((stats["calls"], stats["failures"], stats["retries"]), (2, 1, 1))
+
+    def test_slow_responses_time_out(self):
+        self.pokeapi.delay = 0.5
+        with self.assertRaises(requests.exceptions.Timeout):
+            sprites.fetch_sprite_url("Pikachu")
+        self.assertEqual(pokeapi.client().stats()["failures"], 2)
+
+    def test_circuit_opens_after_repeated_failures(self):
+        self.pokeapi.errors = 4
+        for attempt in range(2):
+            with self.assertRaises(requests.exceptions.HTTPError):
+                sprites.fetch_sprite_url("Pikachu")
+        with self.assertRaises(pokeapi.CircuitOpen):
+            sprites.fetch_sprite_url("Pikachu")
+        self.assertEqual(len(self.pokeapi.requested), 4)
+        stats = pokeapi.client().stats()
+        self.assertEqual((stats["calls"], stats["failures"], stats["skipped"], stats["circuit"]), (4, 4, 1, "open"))
+
+    def test_circuit_closes_after_a_successful_trial(self):
+        now = [0]
+        breaker = pokeapi.CircuitBreaker(failure_threshold=1, cool_down=10, clock=lambda: now[0])
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+        now[0] = 10
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, "closed")
+        self.assertTrue(breaker.allow())
+
+
+    def test_failed_trials_reopen_the_circuit(self):
+        client = pokeapi.Client("http://127.0.0.1:%d/api/v2/" % self.pokeapi.server_port, 1, 1,
+                                retries=0, backoff=0, failure_threshold=1, cool_down=10, pool_size=1)
+        now = [0]
+        client.breaker.clock = lambda: now[0]
+        client.breaker.record_failure()
+        now[0] = 10
+        # The trial call fails with an error that isn't a failed request.
+        with self.assertRaises(TypeError):
+            client.get("pokemon/pikachu", no_such_argument=True)
+        self.assertEqual(client.breaker.state, "open")
+        now[0] = 20
+        self.assertEqual(client.get("pokemon/pikachu").status_code, 200)
+        self.assertEqual(client.breaker.state, "closed")
+
+# Writes a small PokeAPI dump, in the layout of PokeAPI's api-data
+# repository, to the folder "path".
+def write_pokeapi_dump(path):
+    def write(kind, id, data):
+        folder = os.path.join(path, "data", "api", "v2", kind, str(id))
+        os.makedirs(folder)
+        with open(os.path.join(folder, "index.json"), "w") as file:
+            json.dump(data, file)
+
+    write("move", 84, {"name": "thunder-shock", "type": {"name": "electric"}})
+    write("move", 98, {"name": "quick-attack", "type": {"name": "normal"}})
+    write("move", 52, {"name": "ember", "type": {"name": "fire"}})
+    write("pokemon", 25, {
+        "name": "pikachu",
+        "sprites": {"front_default": "http://mirror.test/25.png"},
+        "types": [{"slot": 1, "type": {"name": "electric"}}],
+        "moves": [{"move": {"name": "thunder-shock"}}, {"move": {"name": "quick-attack"}}],
+        "abilities": [{"ability": {"name": "static"}}, {"ability": {"name": "lightning-rod"}}],
+    })
+    write("pokemon", 6, {
+        "name": "charizard",
+        "sprites": {"front_default": "http://mirror.test/6.png"},
+        "types": [{"slot": 2, "type": {"name": "flying"}}, {"slot": 1, "type": {"name": "fire"}}],
+        "moves": [{"move": {"name": "ember"}}],
+        "abilities": [{"ability": {"name": "blaze"}}],
+    })
+    write("pokemon", 122, {
+        "name": "mr-mime",
+        "sprites": {"front_default": None},
+        "types": [{"slot": 1, "type": {"name": "psychic"}}, {"slot": 2, "type": {"name": "fairy"}}],
+        "moves": [],
+        "abilities": [],
+    })
+
+
+class PokeAPIMirrorTestCase(TestCase):
+    """
+    Set of test cases that test the local mirror of PokeAPI's data
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.pokeapi = start_stub_pokeapi({})
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pokeapi.shutdown()
+        cls.pokeapi.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.pokeapi.requested.clear()
+        settings = override_settings(POKEAPI_URL="http://127.0.0.1:%d/api/v2/" % self.pokeapi.server_port)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        dump = tempfile.TemporaryDirectory()
+        self.addCleanup(dump.cleanup)
+        write_pokeapi_dump(dump.name)
+        output = StringIO()
+        call_command("import_pokeapi_dump", dump.name, stdout=output)
+        self.assertIn("Imported 3 species, 3 moves and 3 abilities.", output.getvalue())
+
+        user = User.objects.create_user(USERNAME, EMAIL, PASSWORD)
+        self.profile = Profile.objects.create(name="test_profile", user=user)
+
+    def test_import(self):
+        charizard = Species.objects.get(name="charizard")
+        self.assertEqual((charizard.type_one, charizard.type_two), ("FIR", "FLY"))
+        pikachu = Species.objects.get(name="pikachu")
+        self.assertEqual(sorted(move.name for move in pikachu.moves.all()), ["quick-attack", "thunder-shock"])
+        self.assertEqual(pikachu.moves.get(name="thunder-shock").type, "ELE")
+        self.assertEqual(sorted(ability.name for ability in pikachu.abilities.all()), ["lightning-rod", "static"])
+
+    def test_sprites_resolve_from_the_mirror(self):
+        pikachu = Pokemon.objects.create(name="Pikachu", type_one="ELE", profile=self.profile)
+        mr_mime = Pokemon.objects.create(name="Mr. Mime", type_one="PSY", profile=self.profile)
+        sprites.queue_lookup(pikachu)
+        sprites.queue_lookup(mr_mime)
+        self.assertEqual(sprites.resolve_queued(), 2)
+        pikachu.refresh_from_db()
+        self.assertEqual(pikachu.image_url, "http://mirror.test/25.png")
+        self.assertEqual(self.pokeapi.requested, [])
+
+    def create_pokemon(self, name, autofill=True):
+        data = {"name": name, "type_one": "NOR", "type_two": ""}
+        if autofill:
+            data["autofill"] = "on"
+        form = NewPokemonForm(data, profile=self.profile)
+        self.assertTrue(form.is_valid(), form.errors)
+        return form.save()
+
+    def test_autofill_from_the_mirror(self):
+        existing = Move.objects.create(name="quick attack", type="NOR", profile=self.profile)
+        pikachu = self.create_pokemon("Pikachu")
+        pikachu.refresh_from_db()
+        self.assertEqual((pikachu.type_one, pikachu.type_two), ("ELE", ""))
+        self.assertEqual(pikachu.image_url, "http://mirror.test/25.png")
+        self.assertEqual(sorted(move.name for move in pikachu.can_learn.all()), ["Thunder Shock", "quick attack"])
+        self.assertEqual(pikachu.can_learn.get(name="Thunder Shock").type, "ELE")
+        self.assertIn(existing, pikachu.can_learn.all())
+        self.assertEqual(sorted(ability.name for ability in pikachu.abilities.all()), ["Lightning Rod", "Static"])
+        # Only to download the sprite (see sprites.download_sprites).
+        self.assertTrue(SpriteLookup.objects.filter(pokemon=pikachu).exists())
+
+    def test_autofilled_names_are_found(self):
+        fuzzy._reset()
+        fuzzy.index_for(self.profile)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_pokemon("Pikachu")
+        profile = Profile.objects.get(id=self.profile.id)
+        found = fuzzy.index_for(profile).search("thundr shock", kinds=["move"])
+        self.assertEqual([name for (score, kind, object_id, name) in found], ["Thunder Shock"])
+
+    def test_long_names_stay_apart(self):
+        self.assertEqual(mirror.display_name("thunder-shock"), "Thunder Shock")
+        first = mirror.display_name("light-that-burns-the-sky")
+        second = mirror.display_name("light-that-burns-the-sea")
+        self.assertNotEqual(first, second)
+        self.assertEqual((len(first), len(second)), (20, 20))
+
+    def test_autofill_is_bulk(self):
+        with CaptureQueriesContext(connection) as small:
+            self.create_pokemon("Charizard")
+        with CaptureQueriesContext(connection) as large:
+            self.create_pokemon("Pikachu")
+        self.assertEqual(len(small), len(large))
+
+    def test_autofill_is_optional(self):
+        self.assertFalse(NewPokemonForm(profile=self.profile)["autofill"].value())
+        pikachu = self.create_pokemon("Pikachu", autofill=False)
+        self.assertEqual(pikachu.type_one, "NOR")
+        self.assertFalse(pikachu.can_learn.exists())
+        self.assertTrue(SpriteLookup.objects.filter(pokemon=pikachu).exists())
+
+    def test_offline_lookups_never_call_pokeapi(self):
+        pokemon = Pokemon.objects.create(name="Fakemon", type_one="ELE", profile=self.profile)
+        sprites.queue_lookup(pokemon)
+        with override_settings(POKEAPI_OFFLINE=True):
+            self.assertEqual(sprites.resolve_queued(), 1)
+        self.assertEqual(self.pokeapi.requested, [])
+
+
+class SpriteLookupTestCase(TestCase):
+    """
+    Set of test cases that test looking up sprites in the background
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.pokeapi = start_stub_pokeapi({"pikachu": "http://sprites.test/25.png", "raichu": "http://sprites.test/26.png"})
+        cls.pokeapi_settings = override_settings(POKEAPI_URL="http://127.0.0.1:%d/api/v2/" % cls.pokeapi.server_port)
+        cls.pokeapi_settings.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pokeapi_settings.disable()
+        cls.pokeapi.shutdown()
+        cls.pokeapi.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.pokeapi.requested.clear()
+        self.user = User.objects.create_user(USERNAME, EMAIL, PASSWORD)
+        self.profile = Profile.objects.create(name="test_profile", user=self.user)
+        self.client.force_login(self.user)
+
+    def create_pokemon(self, name):
+        form = NewPokemonForm({"name": name, "type_one": "ELE", "type_two": ""}, profile=self.profile)
+        self.assertTrue(form.is_valid(), form.errors)
+        return form.save()
+
+    def test_pages_never_wait_on_pokeapi(self):
+        pokemon = self.create_pokemon("Pikachu")
+        self.assertTrue(SpriteLookup.objects.filter(pokemon=pokemon).exists())
+        self.assertEqual(self.client.get("/dashboard/%d" % self.profile.id).status_code, 200)
+        self.assertEqual(self.client.get("/detailed_view/%d/" % pokemon.id).status_code, 200)
+        self.assertEqual(self.client.get("/edit_pokemon/%d/" % pokemon.id).status_code, 200)
+        self.assertEqual(self.pokeapi.requested, [])
+
+    def test_worker_resolves_queued_sprites(self):
+        pokemon = self.create_pokemon("Pikachu")
+        call_command("resolve_sprites", "--once", stdout=StringIO())
+        pokemon.refresh_from_db()
+        self.assertEqual(pokemon.image_url, "http://sprites.test/25.png")
+        self.assertFalse(SpriteLookup.objects.exists())
+
+    def test_refused_names_are_remembered(self):
+        self.pokeapi.statuses["missingno"] = 403
+        self.addCleanup(self.pokeapi.statuses.clear)
+        self.create_pokemon("Missingno")
+        self.assertEqual(sprites.resolve_queued(), 1)
+        self.assertFalse(SpriteLookup.objects.exists())
+        self.assertTrue(UnknownSpecies.objects.filter(name="missingno").exists())
+
+    @override_settings(POKEAPI_RETRIES=0)
+    def test_failed_lookups_go_to_the_back_of_the_queue(self):
+        self.pokeapi.statuses["zapdos"] = 503
+        self.addCleanup(self.pokeapi.statuses.clear)
+        zapdos = self.create_pokemon("Zapdos")
+        raichu = self.create_pokemon("Raichu")
+        self.assertEqual(sprites.resolve_queued(limit=1), 0)
+        self.assertEqual(sprites.resolve_queued(limit=1), 1)
+        raichu.refresh_from_db()
+        self.assertEqual(raichu.image_url, "http://sprites.test/26.png")
+        self.assertEqual(list(SpriteLookup.objects.values_list("pokemon", flat=True)), [zapdos.id])
+
+    def test_renaming_queues_a_new_lookup(self):
+        pokemon = self.create_pokemon("Pikachu")
+        call_command("resolve_sprites", "--once", stdout=StringIO())
+        pokemon.refresh_from_db()
+        form = EditPokemonForm({"name": "Raichu", "type_one": "ELE", "type_two": ""}, instance=pokemon)
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save()
+        pokemon.refresh_from_db()
+        self.assertEqual(pokemon.image_url, "")
+        call_command("resolve_sprites", "--once", stdout=StringIO())
+        pokemon.refresh_from_db()
+        self.assertEqual(pokemon.image_url, "http://sprites.test/26.png")
+
+    def test_duplicate_species_are_fetched_once(self):
+        pokemon_list = [self.create_pokemon("Pikachu")]
+        for index in range(3):
+            profile = Profile.objects.create(name="profile_%d" % index, user=self.user)
+            pokemon_list.append(Pokemon.objects.create(name="PIKACHU", type_one="ELE", profile=profile))
+            sprites.queue_lookup(pokemon_list[-1])
+
+        # Read the queue, check the mirror, check for unknown names, check
+        # for renames, write all sprites, record the change (see
+        # versions.py), update the profiles' sprite atlases, dequeue.
+        with self.assertNumQueries(11):
+            self.assertEqual(sprites.resolve_queued(), 4)
+        self.assertEqual(self.pokeapi.requested, ["pikachu"])
+        for pokemon in pokemon_list:
+            pokemon.refresh_from_db()
+            self.assertEqual(pokemon.image_url, "http://sprites.test/25.png")
+
+    def test_unknown_species_is_dequeued(self):
+        pokemon = self.create_pokemon("Missingno")
+        call_command("resolve_sprites", "--once", stdout=StringIO())
+        pokemon.refresh_from_db()
+        self.assertEqual(pokemon.image_url, "")
+        self.assertFalse(SpriteLookup.objects.exists())
+
+    def test_unknown_species_are_not_looked_up_again(self):
+        self.create_pokemon("Missingno")
+        call_command("resolve_sprites", "--once", stdout=StringIO())
+        other_profile = Profile.objects.create(name="other_profile", user=self.user)
+        pokemon = Pokemon.objects.create(name="MissingNo", type_one="NOR", profile=other_profile)
+        sprites.queue_lookup(pokemon)
+        call_command("resolve_sprites", "--once", stdout=StringIO())
+        self.assertEqual(self.pokeapi.requested, ["missingno"])
+        self.assertFalse(SpriteLookup.objects.exists())
+        self.assertEqual(sprites.queue_missing(), 0)
+
+    def test_unknown_species_expire(self):
+        self.create_pokemon("Missingno")
+        call_command("resolve_sprites", "--once", stdout=StringIO())
+        with override_settings(POKEAPI_NEGATIVE_TTL=0):
+            self.assertEqual(sprites.queue_missing(), 1)
+            call_command("resolve_sprites", "--once", stdout=StringIO())
+        self.assertEqual(self.pokeapi.requested, ["missingno", "missingno"])
+
+    def test_unknown_species_are_remembered_once(self):
+        sprites.remember_unknown({"missingno"})
+        failed_at = UnknownSpecies.objects.get(name="missingno").failed_at
+        sprites.remember_unknown({"missingno", "glitch"})
+        self.assertEqual(sorted(UnknownSpecies.objects.values_list("name", flat=True)), ["glitch", "missingno"])
+        self.assertGreater(UnknownSpecies.objects.get(name="missingno").failed_at, failed_at)
+
+    def test_retrying_unknown_species(self):
+        pokemon = self.create_pokemon("Pikachuu")
+        call_command("resolve_sprites", "--once", stdout=StringIO())
+        # PokeAPI learns about the species later on.
+        self.pokeapi.species["pikachuu"] = "http://sprites.test/pikachuu.png"
+        call_command("resolve_sprites", "--once", "--retry-unknown", "PIKACHUU", stdout=StringIO())
+        del self.pokeapi.species["pikachuu"]
+        pokemon.refresh_from_db()
+        self.assertEqual(pokemon.image_url, "http://sprites.test/pikachuu.png")
+
+
+def make_png(size):
+    output = BytesIO()
+    Image.new("RGBA", (size, size), (255, 203, 5, 255)).save(output, format="PNG")
+    return output.getvalue()
+
+
+class SpriteCacheTestCase(TestCase):
+    """
+    Set of test cases that test serving sprites from the local sprite cache
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.host = start_stub_pokeapi({})
+        cls.host.images["25.png"] = make_png(96)
+        cls.host.species["pikachu"] = "http://127.0.0.1:%d/sprites/25.png" % cls.host.server_port
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.host.shutdown()
+        cls.host.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.host.requested.clear()
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        settings = override_settings(SPRITE_CACHE_DIR=cache_dir.name, SPRITE_HOSTS=["127.0.0.1"], POKEAPI_RETRIES=0,
+                                     POKEAPI_URL="http://127.0.0.1:%d/api/v2/" % self.host.server_port)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.user = User.objects.create_user(USERNAME, EMAIL, PASSWORD)
+        self.profile = Profile.objects.create(name="test_profile", user=self.user)
+        self.pokemon = Pokemon.objects.create(name="Pikachu", type_one="ELE", profile=self.profile,
+            image_url="http://127.0.0.1:%d/sprites/25.png" % self.host.server_port)
+        self.client.force_login(self.user)
+
+    def sprite_url(self, size=64):
+        return "/sprite/%d/%s/%d.png" % (self.pokemon.id, spritecache.url_digest(self.pokemon.image_url), size)
+
+    def test_pages_link_to_cached_sprites(self):
+        page = self.client.get("/dashboard/%d/data" % self.profile.id).content.decode()
+        self.assertIn(self.sprite_url(64), page)
+        self.assertNotIn(self.pokemon.image_url, page)
+        page = self.client.get("/detailed_view/%d/" % self.pokemon.id).content.decode()
+        self.assertIn(self.sprite_url(160), page)
+
+    def test_sprites_are_never_downloaded_by_views(self):
+        response = self.client.get(self.sprite_url())
+        self.assertRedirects(response, self.pokemon.image_url, fetch_redirect_response=False)
+        self.assertNotIn("immutable", response.get("Cache-Control", ""))
+        self.assertEqual(self.host.requested, [])
+
+    def test_sprites_are_only_served_to_their_owner(self):
+        spritecache.download(self.pokemon.image_url)
+        self.client.logout()
+        self.assertRedirects(self.client.get(self.sprite_url()), LOGIN_URL + "?next=" + self.sprite_url(),
+                             fetch_redirect_response=False)
+        User.objects.create_user("other", "other@example.com", PASSWORD)
+        self.client.login(username="other", password=PASSWORD)
+        self.assertEqual(self.client.get(self.sprite_url()).status_code, 404)
+
+    def test_worker_downloads_sprites_once_and_they_are_resized(self):
+        Pokemon.objects.filter(id=self.pokemon.id).update(image_url="")
+        sprites.queue_lookup(self.pokemon)
+        self.assertEqual(sprites.resolve_queued(), 1)
+        self.pokemon.refresh_from_db()
+        response = self.client.get(self.sprite_url())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "image/png")
+        self.assertIn("immutable", response["Cache-Control"])
+        with Image.open(BytesIO(b"".join(response.streaming_content))) as image:
+            self.assertEqual(image.size, (64, 64))
+
+        # Other sizes are made from the copy already downloaded.
+        self.assertEqual(self.client.get(self.sprite_url(160)).status_code, 200)
+        self.assertEqual(self.host.requested, ["pikachu", "25.png"])
+        self.assertEqual(spritecache.current_atlas(self.profile.id).cell(self.pokemon.image_url), 0)
+
+    def test_cached_sprites_are_served_with_one_query(self):
+        spritecache.download(self.pokemon.image_url)
+        etag = self.client.get(self.sprite_url())["ETag"]
+        # The session, the user, and the Pokemon (only its own user sees it).
+        with self.assertNumQueries(3):
+            response = self.client.get(self.sprite_url(), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_identical_images_are_stored_once(self):
+        other = Pokemon.objects.create(name="Raichu", type_one="ELE", profile=self.profile,
+            image_url=self.pokemon.image_url + "?copy")
+        sprites.download_sprites([self.pokemon.image_url, other.image_url])
+        first = self.client.get(self.sprite_url())
+        second = self.client.get("/sprite/%d/%s/64.png" % (other.id, spritecache.url_digest(other.image_url)))
+        self.assertEqual(first["ETag"], second["ETag"])
+
+    def test_unknown_sprites_are_not_served(self):
+        self.assertEqual(self.client.get("/sprite/%d/%s/64.png" % (self.pokemon.id, "0" * 32)).status_code, 404)
+        self.assertEqual(self.client.get(self.sprite_url(65)).status_code, 404)
+
+    def test_other_hosts_are_not_downloaded(self):
+        with override_settings(SPRITE_HOSTS=["raw.githubusercontent.com"]):
+            sprites.download_sprites([self.pokemon.image_url])
+            response = self.client.get(self.sprite_url())
+        self.assertRedirects(response, self.pokemon.image_url, fetch_redirect_response=False)
+        self.assertEqual(self.host.requested, [])
+
+    def test_dashboard_uses_one_atlas(self):
+        # Sprites go into the atlas once they have been downloaded.
+        page = self.client.get("/dashboard/%d" % self.profile.id).content.decode()
+        self.assertNotIn("atlas_sprite", page)
+        spritecache.download(self.pokemon.image_url)
+        # Views never make atlases; the worker does.
+        self.assertIsNone(self.client.get("/dashboard/%d" % self.profile.id).context["atlas"])
+        self.assertIsNone(spritecache.current_atlas(self.profile.id))
+        sprites.update_atlases([self.profile.id])
+
+        response = self.client.get("/dashboard/%d" % self.profile.id)
+        atlas = response.context["atlas"]
+        self.assertContains(response, "/sprite_atlas/%s.png" % atlas.digest)
+        row = self.client.get("/dashboard/%d/data" % self.profile.id).json()["data"][0]
+        self.assertIn('class="atlas_sprite sprite_cell_0"', row["name"])
+        self.assertNotIn(self.sprite_url(), row["name"])
+
+        response = self.client.get("/sprite_atlas/%s.png" % atlas.digest)
+        self.assertIn("immutable", response["Cache-Control"])
+        with Image.open(BytesIO(b"".join(response.streaming_content))) as image:
+            self.assertEqual(image.size, (spritecache.ATLAS_COLUMNS * spritecache.ATLAS_CELL_SIZE, spritecache.ATLAS_CELL_SIZE))
+        self.assertEqual(self.client.get("/sprite_atlas/%s.png" % ("0" * 32)).status_code, 404)
+
+        # Only the owner of the profile gets its atlas.
+        User.objects.create_user("other", "other@example.com", PASSWORD)
+        self.client.login(username="other", password=PASSWORD)
+        self.assertEqual(self.client.get("/sprite_atlas/%s.png" % atlas.digest).status_code, 404)
+        self.client.logout()
+        self.assertEqual(self.client.get("/sprite_atlas/%s.png" % atlas.digest).status_code, 302)
+
+    def test_atlas_is_updated_incrementally(self):
+        self.host.images["26.png"] = make_png(80)
+        spritecache.download(self.pokemon.image_url)
+        first = spritecache.atlas_for(self.profile.id, [self.pokemon.image_url])
+        self.assertEqual(spritecache.atlas_for(self.profile.id, [self.pokemon.image_url]).digest, first.digest)
+
+        other = Pokemon.objects.create(name="Raichu", type_one="ELE", profile=self.profile,
+            image_url="http://127.0.0.1:%d/sprites/26.png" % self.host.server_port)
+        spritecache.download(other.image_url)
+        second = spritecache.atlas_for(self.profile.id, [self.pokemon.image_url, other.image_url])
+        self.assertNotEqual(second.digest, first.digest)
+        # Sprites already in the atlas keep their cell.
+        self.assertEqual(second.cell(self.pokemon.image_url), 0)
+        self.assertEqual(second.cell(other.image_url), 1)
+
+        # A changed sprite takes over the cell of the one it replaced.
+        spritecache.download(self.pokemon.image_url + "?new")
+        third = spritecache.atlas_for(self.profile.id, [other.image_url, self.pokemon.image_url + "?new"])
+        self.assertEqual(third.cell(other.image_url), 1)
+        self.assertEqual(third.cell(self.pokemon.image_url + "?new"), 0)
+        self.assertIsNone(third.cell(self.pokemon.image_url))
+
+
+class DashboardQueryTestCase(TestCase):
+    """
+    Set of test cases that test the dashboard's table loads in a fixed
+    number of queries, however many Pokemon a profile has
+    """
+
+    # Queries for the session, the user, the profile, the ids of a page of
+    # its Pokemon, counting all and matching Pokemon, and (for rows not
+    # cached yet) the Pokemon and their locations.
+    QUERY_BUDGET = 8
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(USERNAME, EMAIL, PASSWORD)
+        self.client.force_login(self.user)
+
+    def create_profile(self, name, count):
+        profile = Profile.objects.create(name=name, user=self.user)
+        routes = Location.objects.bulk_create([Location(name="Route %d" % number, profile=profile) for number in range(10)])
+        Pokemon.objects.bulk_create([Pokemon(name="Pokemon %d" % number, type_one="ELE", type_two="FLY" if number % 2 else "",
+                                             profile=profile) for number in range(count)])
+        Findable.objects.bulk_create([Findable(pokemon_id=pokemon_id, location=routes[pokemon_id % len(routes)])
+                                      for pokemon_id in Pokemon.objects.filter(profile=profile).values_list("id", flat=True)])
+        return profile
+
+    def test_dashboard_query_budget(self):
+        small = self.create_profile("small", 1)
+        large = self.create_profile("large", 3000)
+        with self.assertNumQueries(self.QUERY_BUDGET):
+            self.client.get("/dashboard/%d/data" % small.id, {"length": 100})
+        with self.assertNumQueries(self.QUERY_BUDGET):
+            page = self.client.get("/dashboard/%d/data" % large.id, {"length": 100}).json()
+        self.assertEqual((page["recordsTotal"], len(page["data"])), (3000, 100))
+        self.assertIn("Route", page["data"][0]["locations"])
+
+
+class OwnershipTestCase(TestCase):
+    """
+    Set of test cases that test users can only see and change their own
+    profiles and Pokemon
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(USERNAME, EMAIL, PASSWORD)
+        self.profile = Profile.objects.create(name="test_profile", user=self.user)
+        self.pokemon = Pokemon.objects.create(name="Pikachu", type_one="ELE", profile=self.profile)
+        self.other_user = User.objects.create_user("other" + USERNAME, "other" + EMAIL, PASSWORD)
+        self.other_profile = Profile.objects.create(name="other_profile", user=self.other_user)
+        self.other_pokemon = Pokemon.objects.create(name="Eevee", type_one="NOR", profile=self.other_profile)
+        self.client.force_login(self.user)
+
+    def test_for_user_checks_ownership_in_one_query(self):
+        with self.assertNumQueries(1):
+            pokemon = Pokemon.objects.for_user(self.user).get(id=self.pokemon.id)
+            self.assertEqual(pokemon.profile.user_id, self.user.id)
+        self.assertFalse(Pokemon.objects.for_user(self.user).filter(id=self.other_pokemon.id).exists())
+        self.assertEqual(list(Profile.objects.for_user(self.user)), [self.profile])
+        Move.objects.create(name="Surf", type="WAT", profile=self.other_profile)
+        self.assertFalse(Move.objects.for_user(self.user).exists())
+
+    def test_other_users_pokemon_are_not_found(self):
+        for url in ("/detailed_view/%d/", "/edit_pokemon/%d/", "/delete_pokemon/%d/", "/delete_moves/%d/", "/delete_locations/%d/"):
+            self.assertEqual(self.client.get(url % self.other_pokemon.id).status_code, 404, url)
+        self.assertTrue(Pokemon.objects.filter(id=self.other_pokemon.id).exists())
+
+    def test_other_users_profiles_are_not_found(self):
+        self.assertEqual(self.client.get("/dashboard/%d" % self.other_profile.id).status_code, 404)
+        self.assertEqual(self.client.post("/new_move/%d" % self.other_profile.id,
+                                          {"move_name": "Surf", "move_type": "WAT"}).status_code, 404)
+        self.assertEqual(self.client.get("/delete_profile/%d/" % self.other_profile.id).status_code, 404)
+        self.assertTrue(Profile.objects.filter(id=self.other_profile.id).exists())
+
+    def test_owners_can_delete(self):
+        response = self.client.get("/delete_pokemon/%d/" % self.pokemon.id)
+        self.assertRedirects(response, "/dashboard/%d" % self.profile.id, fetch_redirect_response=False)
+        self.assertFalse(Pokemon.objects.filter(id=self.pokemon.id).exists())
+
+
+class DashboardTableTestCase(TestCase):
+    """
+    Set of test cases that test paging, sorting and searching the
+    dashboard's table on the server
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(USERNAME, EMAIL, PASSWORD)
+        self.profile = Profile.objects.create(name="test_profile", user=self.user)
+        self.client.force_login(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            cave = Location.objects.create(name="Rock Tunnel", profile=self.profile)
+            route = Location.objects.create(name="Route 1", profile=self.profile)
+            for (name, type_one, type_two, location) in (("Pikachu", "ELE", "", route), ("Charizard", "FIR", "FLY", None),
+                                                         ("Geodude", "ROC", "GRO", cave), ("Zubat", "POI", "FLY", cave),
+                                                         ("Pidgey", "NOR", "FLY", route)):
+                pokemon = Pokemon.objects.create(name=name, type_one=type_one, type_two=type_two, profile=self.profile)
+                if location is not None:
+                    Findable.objects.create(pokemon=pokemon, location=location)
+
+    def table(self, **params):
+        params.setdefault("draw", "1")
+        response = self.client.get("/dashboard/%d/data" % self.profile.id, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_pages_are_sorted(self):
+        page = self.table(**{"start": "1", "length": "2", "order[0][column]": "0", "order[0][dir]": "asc"})
+        self.assertEqual((page["draw"], page["recordsTotal"], page["recordsFiltered"]), (1, 5, 5))
+        self.assertEqual([row["DT_RowAttr"]["data-href"] for row in page["data"]],
+                         ["/detailed_view/%d/" % Pokemon.objects.get(name=name).id for name in ("Geodude", "Pidgey")])
+        page = self.table(**{"length": "1", "order[0][column]": "0", "order[0][dir]": "desc"})
+        self.assertIn("Zubat", page["data"][0]["name"])
+
+    def test_columns_are_searched(self):
+        def matching(**params):
+            page = self.table(length="10", **params)
+            return sorted(Pokemon.objects.get(id=row["DT_RowAttr"]["data-href"].split("/")[-2]).name for row in page["data"])
+
+        self.assertEqual(matching(**{"columns[0][search][value]": "pi"}), ["Pidgey", "Pikachu"])
+        self.assertEqual(matching(**{"columns[1][search][value]": "flying"}), ["Charizard", "Pidgey", "Zubat"])
+        self.assertEqual(matching(**{"columns[1][search][value]": "fly fire"}), ["Charizard"])
+        self.assertEqual(matching(**{"columns[2][search][value]": "rock"}), ["Geodude", "Zubat"])
+        self.assertEqual(matching(**{"columns[1][search][value]": "FLY", "columns[2][search][value]": "route"}), ["Pidgey"])
+        self.assertEqual(matching(**{"search[value]": "ro"}), ["Geodude", "Pidgey", "Pikachu", "Zubat"])
+        self.assertEqual(self.table(**{"columns[0][search][value]": "mew"})["recordsFiltered"], 0)
+
+    def test_rows_are_escaped(self):
+        Pokemon.objects.create(name="<b>Missingno</b>", type_one="???", profile=self.profile)
+        row = self.table(**{"columns[0][search][value]": "<b>"})["data"][0]
+        self.assertIn("&lt;b&gt;Missingno", row["name"])
+        self.assertEqual(self.table(draw="<script>")["draw"], 0)
+
+
+class DashboardStreamingTestCase(TestCase):
+    """
+    Set of test cases that test streaming the whole dashboard table with
+    bounded memory
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(USERNAME, EMAIL, PASSWORD)
+        self.client.force_login(self.user)
+
+    def create_profile(self, name, count):
+        profile = Profile.objects.create(name=name, user=self.user)
+        Pokemon.objects.bulk_create([Pokemon(name="Pokemon %05d" % number, type_one="FIR", type_two="FLY" if number % 2 else "",
+                                             profile=profile) for number in range(count)])
+        return profile
+
+    # Streams the profile's whole table, and returns (rows seen, peak bytes
+    # allocated while streaming).
+    def stream(self, profile):
+        tracemalloc.start()
+        try:
+            response = self.client.get("/dashboard/%d" % profile.id, {"all": ""})
+            self.assertTrue(response.streaming)
+            rows = sum(chunk.count(b"<tr onclick") for chunk in response.streaming_content)
+            (current, peak) = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return (rows, peak)
+
+    def test_whole_table_is_streamed_in_order(self):
+        profile = self.create_profile("test_profile", dashboard.STREAM_CHUNK_SIZE + 3)
+        last = Pokemon.objects.get(profile=profile, name="Pokemon %05d" % (dashboard.STREAM_CHUNK_SIZE + 2))
+        Findable.objects.create(pokemon=last, location=Location.objects.create(name="Cinnabar", profile=profile))
+        page = b"".join(self.client.get("/dashboard/%d" % profile.id, {"all": ""}).streaming_content).decode()
+        names = re.findall(r"(Pokemon \d+)</div>", page)
+        self.assertEqual(names, ["Pokemon %05d" % number for number in range(dashboard.STREAM_CHUNK_SIZE + 3)])
+        self.assertIn("<td>Cinnabar</td>", page)
+        self.assertIn("</html>", page)
+
+    def test_streamed_rows_are_not_cached(self):
+        profile = self.create_profile("test_profile", 3)
+        cache.clear()
+        b"".join(self.client.get("/dashboard/%d" % profile.id, {"all": ""}).streaming_content)
+        pokemon = list(Pokemon.objects.filter(profile=profile).values_list("id", "updated_at"))
+        # The rows have to be made (see dashboard.rows).
+        with self.assertNumQueries(2):
+            dashboard.rows(profile, pokemon)
+
+    def test_peak_memory_is_flat(self):
+        (small_rows, small_peak) = self.stream(self.create_profile("small", 2000))
+        (large_rows, large_peak) = self.stream(self.create_profile("large", 10000))
+        self.assertEqual((small_rows, large_rows), (2000, 10000))
+        # Five times the Pokemon mustn't take more memory at once.
+        self.assertLess(large_peak, small_peak * 1.25)
+        self.assertLess(large_peak, 32 * 1024 * 1024)
+
+
+class ReadModelTestCase(TestCase):
+    """
+    Set of test cases that test the read-only records used by list views
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(USERNAME, EMAIL, PASSWORD)
+        self.profile = Profile.objects.create(name="test_profile", user=self.user, description="Red")
+        self.pikachu = Pokemon.objects.create(name="Pikachu", type_one="ELE", profile=self.profile, image_url="http://sprites.test/25.png")
+        self.zubat = Pokemon.objects.create(name="Zubat", type_one="POI", type_two="FLY", profile=self.profile)
+        for name in ("Route 1", "Viridian Forest"):
+            Findable.objects.create(pokemon=self.pikachu, location=Location.objects.create(name=name, profile=self.profile))
+
+    def test_pokemon_rows(self):
+        with self.assertNumQueries(2):
+            rows = readmodel.pokemon_rows(Pokemon.objects.filter(profile=self.profile).order_by("name"))
+        self.assertEqual([(row.id, row.name, row.image_url, row.type_one, row.type_two, row.locations) for row in rows],
+                         [(self.pikachu.id, "Pikachu", "http://sprites.test/25.png", "ELE", "", ["Route 1", "Viridian Forest"]),
+                          (self.zubat.id, "Zubat", "", "POI", "FLY", [])])
+        effectiveness.chart_for(self.profile).apply(rows)
+        self.assertEqual(rows[0].offensive_2, ("GRO",))
+        # Records are slotted, so they can't grow a __dict__.
+        with self.assertRaises(AttributeError):
+            rows[0].description = ""
+
+    def test_profile_rows(self):
+        with self.assertNumQueries(1):
+            rows = readmodel.profile_rows(Profile.objects.for_user(self.user))
+        self.assertEqual([(row.id, row.name, row.description) for row in rows], [(self.profile.id, "test_profile", "Red")])
+        self.client.force_login(self.user)
+        self.assertContains(self.client.get("/profiles/"), 'name = "test_profile"')
+
+
+class DashboardRowCacheTestCase(TestCase):
+    """
+    Set of test cases that test the dashboard's rows are cached, and made
+    again when their Pokemon changes
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(USERNAME, EMAIL, PASSWORD)
+        self.profile = Profile.objects.create(name="test_profile", user=self.user)
+        self.pikachu = Pokemon.objects.create(name="Pikachu", type_one="ELE", profile=self.profile)
+        self.zubat = Pokemon.objects.create(name="Zubat", type_one="POI", type_two="FLY", profile=self.profile)
+        self.route = Location.objects.create(name="Route 1", profile=self.profile)
+
+    # The (id, updated_at) pairs dashboard.rows() takes, as the pages of the
+    # table read them. One query.
+    def pairs(self, *pokemon):
+        found = dict(Pokemon.objects.filter(id__in=[each.id for each in pokemon]).values_list("id", "updated_at"))
+        return [(each.id, found[each.id]) for each in pokemon if each.id in found]
+
+    def rows(self):
+        return {cells["DT_RowAttr"]["data-href"]: cells for cells in dashboard.rows(self.profile, self.pairs(self.pikachu, self.zubat))}
+
+    def pikachu_row(self):
+        return self.rows()["/detailed_view/%d/" % self.pikachu.id]
+
+    def test_unchanged_rows_are_not_made_again(self):
+        self.rows()
+        pairs = self.pairs(self.pikachu, self.zubat)
+        with self.assertNumQueries(0):
+            dashboard.rows(self.profile, pairs)
+
+    def test_saving_a_pokemon_changes_its_row(self):
+        self.rows()
+        self.pikachu.type_two = "FLY"
+        self.pikachu.save()
+        pairs = self.pairs(self.pikachu, self.zubat)
+        with self.assertNumQueries(2):
+            rows = dashboard.rows(self.profile, pairs)
+        self.assertIn("FLY", rows[0]["types"])
+
+    def test_rows_are_never_stale_in_other_processes(self):
+        self.rows()
+        # Another process changes Pikachu; nothing in this process hears of
+        # it, but its updated_at changed.
+        with connection.cursor() as cursor:
+            cursor.execute("UPDATE pokedex_pokemon SET type_two = 'FLY', updated_at = %s WHERE id = %s",
+                           [timezone.now(), self.pikachu.id])
+        self.assertIn("FLY", self.pikachu_row()["types"])
+
+    def test_locations_change_rows(self):
+        self.rows()
+        findable = Findable.objects.create(pokemon=self.pikachu, location=self.route)
+        self.assertEqual(self.pikachu_row()["locations"], "Route 1")
+
+        self.route.name = "Route 2"
+        self.route.save()
+        self.assertEqual(self.pikachu_row()["locations"], "Route 2")
+
+        findable.delete()
+        self.assertEqual(self.pikachu_row()["locations"], "")
+
+        self.pikachu.can_find_in.add(self.route)
+        self.assertEqual(self.pikachu_row()["locations"], "Route 2")
+        self.route.can_find.clear()
+        self.assertEqual(self.pikachu_row()["locations"], "")
+
+    def test_changing_the_type_chart_changes_rows(self):
+        ekans = Pokemon.objects.create(name="Ekans", type_one="POI", profile=self.profile)
+        self.assertNotIn("BUG", dashboard.rows(self.profile, self.pairs(ekans))[0]["weaknesses"])
+        self.profile.type_chart = Chart.GEN_1
+        self.profile.save()
+        self.assertIn("BUG", dashboard.rows(self.profile, self.pairs(ekans))[0]["weaknesses"])
+
+    def test_deleted_pokemon_are_left_out(self):
+        # Read for a page, then deleted before its rows are made.
+        pairs = self.pairs(self.pikachu, self.zubat)
+        self.pikachu.delete()
+        self.assertEqual(len(dashboard.rows(self.profile, pairs)), 1)
+
+
+class ConditionalGetTestCase(TestCase):
+    """
+    Set of test cases that test the dashboard and detailed view answer
+    "304 Not Modified" until something in their profile changes
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(USERNAME, EMAIL, PASSWORD)
+        self.client.login(username=USERNAME, password=PASSWORD)
+        self.profile = Profile.objects.create(name="test_profile", user=self.user)
+        self.pikachu = Pokemon.objects.create(name="Pikachu", type_one="ELE", profile=self.profile)
+        self.route = Location.objects.create(name="Route 1", profile=self.profile)
+        self.urls = ["/dashboard/%d" % self.profile.id, "/dashboard/%d?all" % self.profile.id,
+                     "/detailed_view/%d/" % self.pikachu.id]
+
+    def etags(self):
+        return [self.client.get(url)["ETag"] for url in self.urls]
+
+    def assertChanges(self, change):
+        before = self.etags()
+        change()
+        after = self.etags()
+        for (old, new) in zip(before, after):
+            self.assertNotEqual(old, new)
+
+    def test_unchanged_pages_are_not_made_again(self):
+        for (url, etag) in zip(self.urls, self.etags()):
+            # The session, the user and the profile (or Pokemon).
+            with self.assertNumQueries(3):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response["ETag"], etag)
+
+    def test_pages_can_be_revalidated_by_date(self):
+        response = self.client.get(self.urls[2])
+        self.assertIn("no-cache", response["Cache-Control"])
+        response = self.client.get(self.urls[2], HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_changed_pages_are_made_again(self):
+        etag = self.etags()[2]
+        self.pikachu.description = "Electric mouse."
+        self.pikachu.save()
+        response = self.client.get(self.urls[2], HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Electric mouse.")
+
+    def test_writes_to_the_profile_change_its_pages(self):
+        def rename_pokemon():
+            self.pikachu.name = "Raichu"
+            self.pikachu.save()
+        self.assertChanges(rename_pokemon)
+        self.assertChanges(lambda: self.pikachu.can_find_in.add(self.route))
+
+        def rename_location():
+            self.route.name = "Route 2"
+            self.route.save()
+        self.assertChanges(rename_location)
+        self.assertChanges(lambda: Move.objects.create(name="Thunder", type="ELE", profile=self.profile))
+        self.assertChanges(lambda: Pokemon.objects.create(name="Zubat", type_one="POI", profile=self.profile))
+
+        def change_type_chart():
+            self.profile.type_chart = Chart.GEN_1
+            self.profile.save()
+        self.assertChanges(change_type_chart)
+
+    def test_related_changes_update_the_pokemon(self):
+        updated_at = Pokemon.objects.get(id=self.pikachu.id).updated_at
+        self.pikachu.can_find_in.add(self.route)
+        self.assertGreater(Pokemon.objects.get(id=self.pikachu.id).updated_at, updated_at)
+
+    def test_other_profiles_are_unchanged(self):
+        other = Profile.objects.create(name="other_profile", user=self.user)
+        version = Profile.objects.get(id=other.id).version
+        self.pikachu.can_find_in.add(self.route)
+        self.assertEqual(Profile.objects.get(id=other.id).version, version)
+
+
+class PokemonDetailTestCase(TestCase):
+    """
+    Set of test cases that test the detailed view reads precomputed
+    details, which are made again whenever a Pokemon or its relations change
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(USERNAME, EMAIL, PASSWORD)
+        self.client.force_login(self.user)
+        self.profile = Profile.objects.create(name="test_profile", user=self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pichu = Pokemon.objects.create(name="Pichu", type_one="ELE", profile=self.profile)
+            self.pikachu = Pokemon.objects.create(name="Pikachu", type_one="ELE", evolves_from=self.pichu, profile=self.profile)
+            self.route = Location.objects.create(name="Route 1", profile=self.profile)
+            self.thunder = Move.objects.create(name="Thunder", type="ELE", profile=self.profile)
+            self.static = Ability.objects.create(name="Static", profile=self.profile)
+            self.pikachu.can_find_in.add(self.route)
+            self.pikachu.can_learn.add(self.thunder)
+            self.pikachu.abilities.add(self.static)
+
+    def detail(self, pokemon):
+        return details.document(Pokemon.objects.select_related("profile", "detail").get(id=pokemon.id))
+
+    def test_details_hold_the_whole_page(self):
+        detail = self.detail(self.pikachu)
+        self.assertEqual(detail.evolves_from.name, "Pichu")
+        self.assertEqual(detail.locations, ["Route 1"])
+        self.assertEqual(detail.abilities, ["Static"])
+        self.assertEqual(detail.moves, [("Thunder", "ELE")])
+        self.assertEqual(detail.offensive_2, ["GRO"])
+        self.assertEqual([pokemon.name for pokemon in self.detail(self.pichu).evolves_into], ["Pikachu"])
+
+    def test_detailed_view_reads_one_row(self):
+        self.client.get("/detailed_view/%d/" % self.pikachu.id)
+        # The session, the user, and the Pokemon with its details, then the
+        # Pokemon similar to it (see similarity.most_similar).
+        with self.assertNumQueries(3 + 6):
+            response = self.client.get("/detailed_view/%d/" % self.pikachu.id)
+        for text in ("Pikachu", "Route 1", "Thunder", "Static"):
+            self.assertContains(response, text)
+
+    def test_details_are_written_through(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.thunder.name = "Thunderbolt"
+            self.thunder.save()
+        self.assertEqual(PokemonDetail.objects.get(pokemon=self.pikachu).document["moves"], [["Thunderbolt", "ELE"]])
+
+    def test_rebuilding_overwrites_details(self):
+        details.rebuild([self.pikachu.id])
+        Pokemon.objects.filter(id=self.pikachu.id).update(description="Mouse")
+        details.rebuild([self.pikachu.id, self.pikachu.id])
+        self.assertEqual(PokemonDetail.objects.get(pokemon=self.pikachu).document["description"], "Mouse")
+
+    def test_stale_details_are_not_written(self):
+        # The profile changes while the details are being made.
+        build = details.build
+        def build_then_change(pokemon_ids):
+            documents = build(pokemon_ids)
+            Profile.objects.filter(id=self.profile.id).bump_version()
+            return documents
+        details.build = build_then_change
+        self.addCleanup(setattr, details, "build", build)
+        PokemonDetail.objects.all().delete()
+        self.assertEqual(self.detail(self.pikachu).name, "Pikachu")
+        self.assertFalse(PokemonDetail.objects.exists())
+
+    def test_evolutions_are_told_of_changes(self):
+        self.detail(self.pichu)
+        self.pichu.name = "Pichu Jr."
+        self.pichu.save()
+        self.assertEqual(self.detail(self.pikachu).evolves_from.name, "Pichu Jr.")
+
+        # Pichu no longer shows Pikachu once it evolves from something else.
+        raichu = Pokemon.objects.create(name="Raichu", type_one="ELE", profile=self.profile)
+        self.pikachu.evolves_from = raichu
+        self.pikachu.save()
+        self.assertEqual(self.detail(self.pichu).evolves_into, [])
+        self.pikachu.delete()
+        self.assertEqual(self.detail(raichu).evolves_into, [])
+
+    def test_relations_change_details(self):
+        self.detail(self.pikachu)
+        self.pikachu.can_find_in.remove(self.route)
+        self.route.can_find.add(self.pikachu)
+        self.route.name = "Route 2"
+        self.route.save()
+        self.static.delete()
+        detail = self.detail(self.pikachu)
+        self.assertEqual(detail.locations, ["Route 2"])
+        self.assertEqual(detail.abilities, [])
+
+    def test_changing_the_type_chart_changes_details(self):
+        ekans = Pokemon.objects.create(name="Ekans", type_one="POI", profile=self.profile)
+        self.assertNotIn("BUG", self.detail(ekans).offensive_2)
+        self.profile.type_chart = Chart.GEN_1
+        self.profile.save()
+        self.assertIn("BUG", self.detail(ekans).offensive_2)
+
+    def test_rebuild_details_command(self):
+        PokemonDetail.objects.all().delete()
+        out = StringIO()
+        call_command("rebuild_details", "--batch-size", "1", stdout=out)
+        self.assertIn("Rebuilt the details of 2 Pokemon.", out.getvalue())
+        self.assertEqual(PokemonDetail.objects.get(pokemon=self.pikachu).document["locations"], ["Route 1"])
+
+
+class DefensiveMaskTestCase(TestCase):
+    """
+    Set of test cases that test Pokemon store their weaknesses and
+    resistances as bitmasks, which can be searched in SQL
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(USERNAME, EMAIL, PASSWORD)
+        self.profile = Profile.objects.create(name="test_profile", user=self.user)
+        self.charmander = Pokemon.objects.create(name="Charmander", type_one="FIR", profile=self.profile)
+        self.zubat = Pokemon.objects.create(name="Zubat", type_one="POI", type_two="FLY", profile=self.profile)
+        self.skarmory = Pokemon.objects.create(name="Skarmory", type_one="STE", type_two="FLY", profile=self.profile)
+
+    def names(self, condition):
+        return sorted(Pokemon.objects.filter(profile=self.profile).filter(condition).values_list("name", flat=True))
+
+    def test_masks_match_the_type_chart(self):
+        for pokemon in Pokemon.objects.all():
+            expected = Pokemon.objects.get(id=pokemon.id)
+            effectiveness.chart_for(self.profile).apply([expected])
+            for (name, field) in effectiveness.MASK_FIELDS.items():
+                self.assertEqual(getattr(pokemon, field),
+                                 sum(effectiveness.type_bit(type) for type in getattr(expected, name)), field)
+
+    def test_bucket_filters(self):
+        self.assertEqual(self.names(dashboard.bucket_filter("WAT", effectiveness.WEAK)), ["Charmander"])
+        self.assertEqual(self.names(dashboard.bucket_filter("GRO", effectiveness.IMMUNE)), ["Skarmory", "Zubat"])
+        self.assertEqual(self.names(dashboard.bucket_filter("DRA", effectiveness.RESISTS)), ["Skarmory"])
+        self.assertEqual(self.names(dashboard.bucket_filter("FIR", effectiveness.WEAK) & dashboard.bucket_filter("ELE", effectiveness.WEAK)),
+                         ["Skarmory"])
+
+    def test_changing_types_changes_masks(self):
+        self.charmander.type_one = "WAT"
+        self.charmander.save()
+        self.assertEqual(self.names(dashboard.bucket_filter("ELE", effectiveness.WEAK)), ["Charmander", "Skarmory", "Zubat"])
+
+    def test_saving_only_the_types_saves_masks(self):
+        # As mirror.autofill() does.
+        self.charmander.type_one = "WAT"
+        self.charmander.save(update_fields=["type_one"])
+        self.assertEqual(self.names(dashboard.bucket_filter("WAT", effectiveness.WEAK)), [])
+        self.assertEqual(self.names(dashboard.bucket_filter("GRA", effectiveness.WEAK)), ["Charmander"])
+
+    def test_changing_the_type_chart_changes_masks(self):
+        Pokemon.objects.create(name="Ekans", type_one="POI", profile=self.profile)
+        self.assertEqual(self.names(dashboard.bucket_filter("BUG", effectiveness.WEAK)), [])
+        self.profile.type_chart = Chart.GEN_1
+        self.profile.save()
+        self.assertEqual(self.names(dashboard.bucket_filter("BUG", effectiveness.WEAK)), ["Ekans"])
+
+    def test_masks_can_be_filled_in(self):
+        Pokemon.objects.update(offensive_2_mask=0, offensive_4_mask=0)
+        effectiveness.update_masks(self.profile)
+        self.assertEqual(self.names(dashboard.bucket_filter("WAT", effectiveness.WEAK)), ["Charmander"])
+
+    def test_dashboard_searches_weaknesses(self):
+        self.client.force_login(self.user)
+        response = self.client.get("/dashboard/%d/data" % self.profile.id, {
+            "draw": "1", "start": "0", "length": "10", "columns[3][search][value]": "water"})
+        self.assertEqual(response.json()["recordsFiltered"], 1)
+        self.assertIn("Charmander", response.json()["data"][0]["name"])
+        response = self.client.get("/dashboard/%d/data" % self.profile.id, {"columns[3][search][value]": "nothing"})
+        self.assertEqual(response.json()["recordsFiltered"], 0)
+
+
+class QueryLanguageTestCase(TestCase):
+    """
+    Set of test cases that test the dashboard's search language is parsed,
+    and compiled into a single query
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(USERNAME, EMAIL, PASSWORD)
+        self.profile = Profile.objects.create(name="test_profile", user=self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            route = Location.objects.create(name="Route 1", profile=self.profile)
+            cave = Location.objects.create(name="Rock Tunnel", profile=self.profile)
+            surf = Move.objects.create(name="Surf", type="WAT", profile=self.profile)
+            levitate = Ability.objects.create(name="Levitate", profile=self.profile)
+            self.pokemon = {}
+            for (name, type_one, type_two, locations, moves, abilities) in (
+                    ("Charmander", "FIR", "", [route], [], []),
+                    ("Gastly", "GHO", "POI", [cave], [], [levitate]),
+                    ("Lapras", "WAT", "ICE", [route], [surf], []),
+                    ("Volcarona", "BUG", "FIR", [route, cave], [], []),
+                    ("Zubat", "POI", "FLY", [cave], [], [])):
+                pokemon = Pokemon.objects.create(name=name, type_one=type_one, type_two=type_two, profile=self.profile)
+                pokemon.can_find_in.set(locations)
+                pokemon.can_learn.set(moves)
+                pokemon.abilities.set(abilities)
+                self.pokemon[name] = pokemon
+
+    def names(self, text):
+        pokemon = Pokemon.objects.filter(profile=self.profile).filter(query.compile_search(text))
+        return sorted(pokemon.values_list("name", flat=True))
+
+    def test_parse(self):
+        terms = query.parse('type:FIR,wat -LOC:"route 1" location:rock* pika')
+        self.assertEqual([(term.key, term.values, term.negated) for term in terms], [
+            ("type", ["FIR", "wat"], False), ("loc", ["route 1"], True), ("loc", ["rock*"], False), (None, ["pika"], False)])
+
+    def test_searches(self):
+        self.assertEqual(self.names(""), ["Charmander", "Gastly", "Lapras", "Volcarona", "Zubat"])
+        self.assertEqual(self.names("type:FIR"), ["Charmander", "Volcarona"])
+        self.assertEqual(self.names("type:FIR -type:BUG"), ["Charmander"])
+        self.assertEqual(self.names("type:fire,water"), ["Charmander", "Lapras", "Volcarona"])
+        self.assertEqual(self.names("loc:route*"), ["Charmander", "Lapras", "Volcarona"])
+        self.assertEqual(self.names("loc:route"), [])
+        self.assertEqual(self.names('loc:"rock tunnel" -loc:"Route 1"'), ["Gastly", "Zubat"])
+        self.assertEqual(self.names("learns:surf"), ["Lapras"])
+        self.assertEqual(self.names("ability:levitate"), ["Gastly"])
+        self.assertEqual(self.names("weak:WAT"), ["Charmander", "Volcarona"])
+        self.assertEqual(self.names("immune:normal"), ["Gastly"])
+        self.assertEqual(self.names("resists:GRA -weak:ROC"), ["Gastly"])
+        self.assertEqual(self.names("name:zu*"), ["Zubat"])
+        self.assertEqual(self.names("ro"), ["Charmander", "Gastly", "Lapras", "Volcarona", "Zubat"])
+
+    def test_searches_take_one_query(self):
+        condition = query.compile_search("type:FIR loc:route* learns:surf ability:levitate weak:WAT -type:BUG")
+        with self.assertNumQueries(1):
+            list(Pokemon.objects.filter(profile=self.profile).filter(condition))
+
+    def test_errors(self):
+        for text in ('loc:"route', "colour:red", "type:XYZ", "type:", "weak:,"):
+            with self.assertRaises(query.QueryError, msg=text):
+                query.compile_search(text)
+
+    def test_dashboard_searches(self):
+        self.client.force_login(self.user)
+        url = "/dashboard/%d/data" % self.profile.id
+        page = self.client.get(url, {"draw": "3", "search[value]": "loc:route* weak:WAT"}).json()
+        self.assertEqual(page["recordsFiltered"], 2)
+        page = self.client.get(url, {"draw": "4", "search[value]": "colour:red"}).json()
+        self.assertEqual(page, {"draw": 4, "error": "Unknown search: colour:"})
+
+
+class SearchIndexTestCase(TestCase):
+    """
+    Set of test cases that test Pokemon can be found by any word of their
+    name, types, locations, moves and abilities, as they change
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(USERNAME, EMAIL, PASSWORD)
+        self.profile = Profile.objects.create(name="test_profile", user=self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.gastly = Pokemon.objects.create(name="Gastly", type_one="GHO", type_two="POI", profile=self.profile)
+            self.tunnel = Location.objects.create(name="Rock Tunnel", profile=self.profile)
+            self.lick = Move.objects.create(name="Lick", type="GHO", profile=self.profile)
+            self.levitate = Ability.objects.create(name="Levitate", profile=self.profile)
+            self.gastly.can_find_in.add(self.tunnel)
+            self.gastly.can_learn.add(self.lick)
+            self.gastly.abilities.add(self.levitate)
+
+    def found(self, text, profile=None):
+        return list(Pokemon.objects.filter(searchindex.word_filter(text, profile or self.profile)).values_list("name", flat=True))
+
+    def test_terms(self):
+        self.assertEqual(set(self.gastly.search_terms.values_list("term", flat=True)),
+                         {"gastly", "gho", "ghost", "poi", "poison", "rock", "tunnel", "lick", "levitate"})
+
+    def test_words_are_found_by_prefix(self):
+        self.assertEqual(self.found("GAS"), ["Gastly"])
+        self.assertEqual(self.found("rock tun"), ["Gastly"])
+        self.assertEqual(self.found("rock fire"), [])
+        self.assertEqual(self.found("!!!"), [])
+        other = Profile.objects.create(name="other_profile", user=self.user)
+        self.assertEqual(self.found("gas", other), [])
+
+    def test_searching_takes_one_query(self):
+        with self.assertNumQueries(1):
+            self.found("rock tun lev")
+
+    def test_terms_follow_changes(self):
+        # Terms are made again once the change commits.
+        with self.captureOnCommitCallbacks(execute=True):
+            self.lick.name = "Shadow Ball"
+            self.lick.save()
+        self.assertEqual(self.found("lick"), [])
+        self.assertEqual(self.found("shadow"), ["Gastly"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.gastly.abilities.remove(self.levitate)
+        self.assertEqual(self.found("levitate"), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            Findable.objects.filter(pokemon=self.gastly).delete()
+        self.assertEqual(self.found("tunnel"), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.gastly.name = "Haunter"
+            self.gastly.save()
+        self.assertEqual(self.found("haunt"), ["Haunter"])
+        self.gastly.delete()
+        self.assertFalse(SearchTerm.objects.exists())
+
+    def test_terms_are_made_once_per_transaction(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.gastly.description = "A ghost"
+            self.gastly.save()
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.found("gas"), ["Gastly"])
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.gastly.name = "Haunter"
+            self.gastly.save()
+            self.gastly.can_learn.remove(self.lick)
+            self.tunnel.name = "Lavender Tower"
+            self.tunnel.save()
+        self.assertEqual(self.found("haunt"), [])
+        with CaptureQueriesContext(connection) as queries:
+            for callback in callbacks:
+                callback()
+        self.assertEqual(len([query for query in queries if query["sql"].startswith('DELETE FROM "pokedex_searchterm"')]), 1)
+        self.assertEqual(self.found("haunter lavender"), ["Haunter"])
+        self.assertEqual(self.found("lick"), [])
+
+    def test_rolled_back_changes_are_forgotten(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            with self.assertRaises(ValueError):
+                with transaction.atomic():
+                    Pokemon.objects.create(name="Haunter", type_one="GHO", type_two="POI", profile=self.profile)
+                    raise ValueError
+            self.gastly.name = "Gengar"
+            self.gastly.save()
+            self.gastly.can_learn.remove(self.lick)
+        # One batch, of what was committed only (the rest are fuzzy.py's).
+        batches = [callback.__self__ for callback in callbacks if isinstance(getattr(callback, "__self__", None), versions._Pending)]
+        self.assertEqual([batch.reindex for batch in batches], [{self.gastly.id}])
+
+    def test_reindexing_twice_keeps_one_of_each_term(self):
+        searchindex.reindex([self.gastly.id])
+        similarity.reindex([self.gastly.id])
+        searchindex.reindex([self.gastly.id])
+        similarity.reindex([self.gastly.id])
+        self.assertEqual(SearchTerm.objects.filter(pokemon=self.gastly, term="gastly").count(), 1)
+        self.assertEqual(self.found("gas"), ["Gastly"])
+        buckets = list(SimilarityBucket.objects.filter(pokemon=self.gastly).values_list("bucket", flat=True))
+        self.assertEqual(len(buckets), len(set(buckets)))
+
+    def test_deleting_a_location_is_bulk(self):
+        def delete_found_by(count):
+            route = Location.objects.create(name="Route %d" % count, profile=self.profile)
+            for number in range(count):
+                pokemon = Pokemon.objects.create(name="Pidgey %d-%d" % (count, number), type_one="NOR", profile=self.profile)
+                pokemon.can_find_in.add(route)
+            with CaptureQueriesContext(connection) as queries:
+                with self.captureOnCommitCallbacks(execute=True):
+                    route.delete()
+            return len(queries)
+        self.assertEqual(delete_found_by(2), delete_found_by(8))
+
+    def test_describing_a_pokemon_keeps_its_terms(self):
+        with CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.gastly.description = "A ghost"
+                self.gastly.save()
+        self.assertFalse([query for query in queries if "pokedex_searchterm" in query["sql"]])
+
+    def test_deleting_a_location_changes_terms(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tunnel.delete()
+        self.assertEqual(self.found("tunnel"), [])
+        self.assertEqual(self.found("lick"), ["Gastly"])
+
+    def test_dashboard_searches_the_index(self):
+        self.client.force_login(self.user)
+        page = self.client.get("/dashboard/%d/data" % self.profile.id, {"search[value]": "levit -type:FIR"}).json()
+        self.assertEqual(page["recordsFiltered"], 1)
+
+
+class FuzzySearchTestCase(TestCase):
+    """
+    Set of test cases that test names in a profile can be found misspelt,
+    from an index kept up to date as they change
+    """
+
+    def setUp(self):
+        fuzzy._reset()
+        self.user = User.objects.create_user(USERNAME, EMAIL, PASSWORD)
+        self.profile = Profile.objects.create(name="test_profile", user=self.user)
+        self.zubat = Pokemon.objects.create(name="Zubat", type_one="POI", type_two="FLY", profile=self.profile)
+        self.golbat = Pokemon.objects.create(name="Golbat", type_one="POI", type_two="FLY", profile=self.profile)
+        self.tunnel = Location.objects.create(name="Rock Tunnel", profile=self.profile)
+        self.surf = Move.objects.create(name="Surf", type="WAT", profile=self.profile)
+
+    def search(self, text, **kwargs):
+        profile = Profile.objects.get(id=self.profile.id)
+        return [(kind, name) for (score, kind, object_id, name) in fuzzy.index_for(profile).search(text, **kwargs)]
+
+    def test_trigrams(self):
+        self.assertEqual(fuzzy.trigrams("Zubat"), {"  z", " zu", "zub", "uba", "bat", "at "})
+        self.assertEqual(fuzzy.trigrams("!!"), set())
+
+    def test_misspelt_names_are_found(self):
+        self.assertEqual(self.search("Zubta")[0], ("pokemon", "Zubat"))
+        self.assertEqual(self.search("rok tunel"), [("location", "Rock Tunnel")])
+        self.assertEqual(self.search("surf", kinds=["pokemon"]), [])
+        self.assertEqual(self.search("xyz"), [])
+
+    def test_closer_names_rank_first(self):
+        self.assertEqual(self.search("bat", threshold=0), [("pokemon", "Zubat"), ("pokemon", "Golbat")])
+        self.assertEqual(self.search("bat", limit=1, threshold=0), [("pokemon", "Zubat")])
+
+    def test_index_follows_changes(self):
+        self.search("zubat")
+        index = fuzzy.index_for(Profile.objects.get(id=self.profile.id))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.zubat.name = "Crobat"
+            self.zubat.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            Ability.objects.create(name="Inner Focus", profile=self.profile)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.surf.delete()
+        # Changed where it was, rather than made again.
+        with self.assertNumQueries(1):
+            self.assertIs(fuzzy.index_for(Profile.objects.get(id=self.profile.id)), index)
+        self.assertEqual(self.search("Zubat"), [])
+        self.assertEqual(self.search("crobat")[0], ("pokemon", "Crobat"))
+        self.assertEqual(self.search("inner focus"), [("ability", "Inner Focus")])
+        self.assertEqual(self.search("surf"), [])
+
+    def test_index_is_made_again_after_other_changes(self):
+        self.search("zubat")
+        # As another process would: the names changed, but not in this
+        # process's index.
+        Pokemon.objects.filter(id=self.zubat.id).update(name="Crobat")
+        Profile.objects.filter(id=self.profile.id).bump_version(names=True)
+        self.assertEqual(self.search("crobat")[0], ("pokemon", "Crobat"))
+
+    def test_relations_keep_the_index(self):
+        self.search("zubat")
+        version = Profile.objects.get(id=self.profile.id).names_version
+        self.zubat.can_find_in.add(self.tunnel)
+        self.assertEqual(Profile.objects.get(id=self.profile.id).names_version, version)
+
+    def test_search_view(self):
+        self.client.login(username=USERNAME, password=PASSWORD)
+        response = self.client.get("/fuzzy/%d" % self.profile.id, {"q": "golbta"})
+        self.assertEqual(response.status_code, 200)
+        first = response.json()["results"][0]
+        self.assertEqual((first["kind"], first["name"], first["url"]), ("pokemon", "Golbat", "/detailed_view/%d/" % self.golbat.id))
+
+        User.objects.create_user("other", "other@example.com", PASSWORD)
+        self.client.login(username="other", password=PASSWORD)
+        self.assertEqual(self.client.get("/fuzzy/%d" % self.profile.id, {"q": "golbat"}).status_code, 404)
+
+
+class ProfileSearchTestCase(TestCase):
+    """
+    Set of test cases that test Pokemon can be found in all of a user's
+    profiles at once, grouped by profile
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(USERNAME, EMAIL, PASSWORD)
+        self.red = Profile.objects.create(name="Red", user=self.user)
+        self.blue = Profile.objects.create(name="Blue", user=self.user)
+        self.empty = Profile.objects.create(name="Empty", user=self.user)
+        for (profile, names) in ((self.red, ["Pidgey", "Pidgeotto", "Rattata"]), (self.blue, ["Pidgey", "Zubat"])):
+            for name in names:
+                Pokemon.objects.create(name=name, type_one="NOR", profile=profile)
+        other = User.objects.create_user("other", "other@example.com", PASSWORD)
+        Pokemon.objects.create(name="Pidgey", type_one="NOR", profile=Profile.objects.create(name="Red", user=other))
+
+    def found(self, text, limit=readmodel.SEARCH_LIMIT):
+        (groups, truncated) = readmodel.search_profiles(self.user, text, limit)
+        return ([(profile.name, [pokemon.name for pokemon in pokemon]) for (profile, pokemon) in groups], truncated)
+
+    def test_pokemon_are_grouped_by_profile(self):
+        self.assertEqual(self.found("pidg"), ([("Blue", ["Pidgey"]), ("Red", ["Pidgeotto", "Pidgey"])], False))
+        self.assertEqual(self.found("zubat"), ([("Blue", ["Zubat"])], False))
+        self.assertEqual(self.found("mew"), ([], False))
+        self.assertEqual(self.found(""), ([], False))
+
+    def test_results_are_bounded(self):
+        self.assertEqual(self.found("pidg", limit=2), ([("Blue", ["Pidgey"]), ("Red", ["Pidgeotto"])], True))
+
+    def test_searching_takes_one_query(self):
+        for number in range(20):
+            profile = Profile.objects.create(name="Seed %d" % number, user=self.user)
+            Pokemon.objects.create(name="Pidgey", type_one="NOR", profile=profile)
+        with self.assertNumQueries(1):
+            (groups, truncated) = readmodel.search_profiles(self.user, "pidgey")
+        self.assertEqual(len(groups), 22)
+
+    def test_search_view(self):
+        self.client.login(username=USERNAME, password=PASSWORD)
+        data = self.client.get("/profiles/search", {"q": "zub"}).json()
+        self.assertFalse(data["truncated"])
+        [profile] = data["profiles"]
+        self.assertEqual((profile["name"], profile["url"]), ("Blue", "/dashboard/%d" % self.blue.id))
+        self.assertEqual([pokemon["name"] for pokemon in profile["pokemon"]], ["Zubat"])
+
+
+class SimilarPokemonTestCase(TestCase):
+    """
+    Set of test cases that test the Pokemon most like another are found
+    through their MinHash buckets, as their moves, abilities and locations
+    change
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(USERNAME, EMAIL, PASSWORD)
+        self.profile = Profile.objects.create(name="test_profile", user=self.user)
+        self.moves = [Move.objects.create(name="Move %d" % number, type="NOR", profile=self.profile) for number in range(6)]
+        self.cave = Location.objects.create(name="Cave", profile=self.profile)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.zubat = self.pokemon("Zubat", "POI", "FLY", self.moves[:4])
+            self.golbat = self.pokemon("Golbat", "POI", "FLY", self.moves[:4])
+            self.crobat = self.pokemon("Crobat", "POI", "FLY", self.moves[:2])
+            self.onix = self.pokemon("Onix", "ROC", "GRO", self.moves[4:])
+
+    def pokemon(self, name, type_one, type_two, moves):
+        pokemon = Pokemon.objects.create(name=name, type_one=type_one, type_two=type_two, profile=self.profile)
+        pokemon.can_learn.set(moves)
+        return pokemon
+
+    def similar(self, pokemon):
+        return [(each.name, round(each.similarity, 2)) for each in similarity.most_similar(pokemon)]
+
+    def test_signatures_estimate_similarity(self):
+        first = similarity.signature({"type:POI", "move:1", "move:2", "move:3"})
+        self.assertEqual(len(first), similarity.BANDS * similarity.ROWS)
+        self.assertEqual(first, similarity.signature({"move:3", "move:2", "move:1", "type:POI"}))
+        self.assertEqual(len(similarity.buckets(first)), similarity.BANDS)
+        self.assertEqual(similarity.buckets(similarity.signature(set())), [])
+
+    def test_most_similar_first(self):
+        self.assertEqual(self.similar(self.zubat), [("Golbat", 1.0), ("Crobat", 0.67)])
+        self.assertEqual(self.similar(self.onix), [])
+
+    def test_buckets_follow_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.onix.can_learn.set(self.moves[:4])
+            self.onix.type_one = "POI"
+            self.onix.type_two = "FLY"
+            self.onix.save()
+        self.assertIn(("Onix", 1.0), self.similar(self.zubat))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.golbat.can_find_in.add(self.cave)
+        self.assertEqual(self.similar(self.zubat)[1], ("Golbat", 0.86))
+        with self.captureOnCommitCallbacks(execute=True):
+            Learnable.objects.filter(pokemon=self.onix).delete()
+        self.assertNotIn(("Onix", 1.0), self.similar(self.zubat))
+
+        self.golbat.delete()
+        self.assertFalse(SimilarityBucket.objects.filter(pokemon=self.golbat.id).exists())
+
+    def test_similar_pokemon_take_six_queries(self):
+        with self.assertNumQueries(6):
+            similarity.most_similar(self.zubat)
+
+    def test_detailed_view_shows_similar_pokemon(self):
+        self.client.login(username=USERNAME, password=PASSWORD)
+        response = self.client.get("/detailed_view/%d/" % self.zubat.id)
+        self.assertEqual([each.name for each in response.context["similar"]], ["Golbat", "Crobat"])
+        self.assertContains(response, "Golbat (100%)")
+
+
 class AccessViewTestCaseWithSelenium(StaticLiveServerTestCase):
     """
     Set of test cases that test access to the webpages from other
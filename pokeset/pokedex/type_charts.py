@@ -0,0 +1,127 @@
+# type_charts.py
+# The built-in type charts, one per generation of the games. A chart only
+# lists the matchups that aren't neutral, as
+#   {attacking type: {defending type: multiplier}}
+# which is also the format a Profile's custom chart is stored in.
+
+import hashlib
+import json
+
+from django.core.exceptions import ValidationError
+
+# Constants for type effectiveness. Moves, based on the type of that move
+# and the type(s) of the Pokemon that the move is being used against, will
+# have one of these 4 multipliers to damage applied.
+SUPER_EFFECTIVE    = 2.0
+NORMAL_EFFECTIVE   = 1.0
+NOT_VERY_EFFECTIVE = 0.5
+NO_EFFECT          = 0
+
+# All multipliers a single chart entry may have.
+MULTIPLIERS = (SUPER_EFFECTIVE, NORMAL_EFFECTIVE, NOT_VERY_EFFECTIVE, NO_EFFECT)
+
+
+# Builds a chart from {attacking type: {multiplier: [defending types]}},
+# which is much easier to read and check against the games.
+def _chart(rows):
+    chart = {}
+    for (attacking, matchups) in rows.items():
+        for (multiplier, defending) in matchups.items():
+            for type in defending:
+                chart.setdefault(attacking, {})[type] = multiplier
+    return chart
+
+
+# A copy of "base" with some entries changed. A multiplier of
+# NORMAL_EFFECTIVE removes the entry.
+def _derive(base, changes):
+    chart = {attacking: dict(matchups) for (attacking, matchups) in base.items()}
+    for (attacking, matchups) in _chart(changes).items():
+        for (type, multiplier) in matchups.items():
+            if multiplier == NORMAL_EFFECTIVE:
+                chart.get(attacking, {}).pop(type, None)
+            else:
+                chart.setdefault(attacking, {})[type] = multiplier
+    return {attacking: matchups for (attacking, matchups) in chart.items() if matchups}
+
+
+# Adapted from https://github.com/filipekiss/pokemon-type-chart/blob/master/types.json
+# Using data fromm https://img.pokemondb.net/images/typechart-gen2345.png
+# (plus the Fairy type, which Pokeset has always included).
+GEN_2_TO_5 = _chart({
+    "NOR": {NO_EFFECT: ["GHO"], NOT_VERY_EFFECTIVE: ["ROC", "STE"]},
+    "FIR": {NOT_VERY_EFFECTIVE: ["FIR", "WAT", "ROC", "DRA"], SUPER_EFFECTIVE: ["GRA", "ICE", "BUG", "STE"]},
+    "WAT": {NOT_VERY_EFFECTIVE: ["WAT", "GRA", "DRA"], SUPER_EFFECTIVE: ["FIR", "GRO", "ROC"]},
+    "ELE": {NO_EFFECT: ["GRO"], NOT_VERY_EFFECTIVE: ["ELE", "GRA", "DRA"], SUPER_EFFECTIVE: ["WAT", "FLY"]},
+    "GRA": {NOT_VERY_EFFECTIVE: ["FIR", "GRA", "POI", "FLY", "BUG", "DRA", "STE"], SUPER_EFFECTIVE: ["WAT", "GRO", "ROC"]},
+    "ICE": {NOT_VERY_EFFECTIVE: ["FIR", "WAT", "ICE", "STE"], SUPER_EFFECTIVE: ["GRA", "GRO", "FLY", "DRA"]},
+    "FIG": {NO_EFFECT: ["GHO"], NOT_VERY_EFFECTIVE: ["POI", "FLY", "PSY", "BUG", "FAI"], SUPER_EFFECTIVE: ["NOR", "ICE", "ROC", "DAR", "STE"]},
+    "POI": {NO_EFFECT: ["STE"], NOT_VERY_EFFECTIVE: ["POI", "GRO", "ROC", "GHO"], SUPER_EFFECTIVE: ["GRA", "FAI"]},
+    "GRO": {NO_EFFECT: ["FLY"], NOT_VERY_EFFECTIVE: ["GRA", "BUG"], SUPER_EFFECTIVE: ["FIR", "ELE", "POI", "ROC", "STE"]},
+    "FLY": {NOT_VERY_EFFECTIVE: ["ELE", "ROC", "STE"], SUPER_EFFECTIVE: ["GRA", "FIG", "BUG"]},
+    "PSY": {NO_EFFECT: ["DAR"], NOT_VERY_EFFECTIVE: ["PSY", "STE"], SUPER_EFFECTIVE: ["FIG", "POI"]},
+    "BUG": {NOT_VERY_EFFECTIVE: ["FIR", "FIG", "POI", "FLY", "GHO", "STE", "FAI"], SUPER_EFFECTIVE: ["GRA", "PSY", "DAR"]},
+    "ROC": {NOT_VERY_EFFECTIVE: ["FIG", "GRO", "STE"], SUPER_EFFECTIVE: ["FIR", "ICE", "FLY", "BUG"]},
+    "GHO": {NO_EFFECT: ["NOR"], NOT_VERY_EFFECTIVE: ["DAR", "STE"], SUPER_EFFECTIVE: ["PSY", "GHO"]},
+    "DRA": {NO_EFFECT: ["FAI"], NOT_VERY_EFFECTIVE: ["STE"], SUPER_EFFECTIVE: ["DRA"]},
+    "DAR": {NOT_VERY_EFFECTIVE: ["FIG", "DAR", "STE", "FAI"], SUPER_EFFECTIVE: ["PSY", "GHO"]},
+    "STE": {NOT_VERY_EFFECTIVE: ["FIR", "WAT", "ELE", "STE"], SUPER_EFFECTIVE: ["ICE", "ROC", "FAI"]},
+    "FAI": {NOT_VERY_EFFECTIVE: ["WAT", "POI", "STE"], SUPER_EFFECTIVE: ["FIG", "DRA", "DAR"]},
+})
+
+# Generation 1 had no Dark, Steel or Fairy types, and a few famous bugs.
+GEN_1 = _derive(
+    {attacking: {type: multiplier for (type, multiplier) in matchups.items() if type not in ("DAR", "STE", "FAI")}
+     for (attacking, matchups) in GEN_2_TO_5.items() if attacking not in ("DAR", "STE", "FAI")},
+    {
+        "BUG": {SUPER_EFFECTIVE: ["POI"]},
+        "POI": {SUPER_EFFECTIVE: ["BUG"]},
+        "GHO": {NO_EFFECT: ["PSY"]},
+        "ICE": {NORMAL_EFFECTIVE: ["FIR"]},
+    },
+)
+
+# From generation 6 on, Steel no longer resists Ghost and Dark.
+GEN_6_ON = _derive(GEN_2_TO_5, {
+    "GHO": {NORMAL_EFFECTIVE: ["STE"]},
+    "DAR": {NORMAL_EFFECTIVE: ["STE"]},
+})
+
+
+# Raises a ValidationError if "chart" isn't a well-formed chart over the
+# given type codes.
+def validate_chart(chart, codes):
+    if not isinstance(chart, dict):
+        raise ValidationError('A type chart must map attacking types to their matchups.')
+    errors = []
+    for (attacking, matchups) in chart.items():
+        if attacking not in codes:
+            errors.append(ValidationError('"%s" is not a type.' % attacking))
+            continue
+        if not isinstance(matchups, dict):
+            errors.append(ValidationError('The matchups of "%s" must map defending types to multipliers.' % attacking))
+            continue
+        for (type, multiplier) in matchups.items():
+            if type not in codes:
+                errors.append(ValidationError('"%s" is not a type.' % type))
+            elif isinstance(multiplier, bool) or multiplier not in MULTIPLIERS:
+                errors.append(ValidationError('%s against %s must be one of 0, 0.5, 1 or 2.' % (attacking, type)))
+    if len(errors) > 0:
+        raise ValidationError(errors)
+
+
+# Identifies a chart by its contents: the code of a built-in chart, or a
+# digest of a custom one. Equal charts get equal versions.
+def chart_version(code, custom_chart=None):
+    if custom_chart is None or code in BUILTIN_CHARTS:
+        return code
+    canonical = json.dumps(custom_chart, sort_keys=True, separators=(",", ":"))
+    return code + "-" + hashlib.blake2b(canonical.encode(), digest_size=13).hexdigest()
+
+
+# Built-in charts by their code in models.Chart.
+BUILTIN_CHARTS = {
+    "GEN1": GEN_1,
+    "GEN2": GEN_2_TO_5,
+    "GEN6": GEN_6_ON,
+}
@@ -6,7 +6,10 @@ urlpatterns = [
     path("", views.index, name="index"),
     path("register/", views.get_register, name="register"),
     path("profiles/", views.get_profiles, name="profiles"),
+    path("profiles/search", views.get_profile_search, name="profile_search"),
     path("dashboard/<int:profile_id>", views.get_dashboard, name="dashboard"),
+    path("dashboard/<int:profile_id>/data", views.get_dashboard_data, name="dashboard_data"),
+    path("fuzzy/<int:profile_id>", views.get_fuzzy_search, name="fuzzy_search"),
     path("detailed_view/<int:pokemon_id>/", views.get_detailed_view, name="detailed"),
     path("edit_pokemon/<int:pokemon_id>/", views.get_edit_pokemon, name="edit_pokemon"),
     path("create_pokemon/<int:profile_id>", views.get_create_pokemon, name="create_pokemon" ),
@@ -18,4 +21,6 @@ urlpatterns = [
     path("delete_moves/<int:pokemon_id>/", views.delete_moves, name="delete_moves"),
     path("delete_abilities/<int:pokemon_id>/", views.delete_moves, name="delete_abilities"),
     path("delete_profile/<int:profile_id>/", views.delete_profile, name = "delete_profile"),
+    path("sprite/<int:pokemon_id>/<slug:digest>/<int:size>.png", views.get_sprite, name="sprite"),
+    path("sprite_atlas/<slug:digest>.png", views.get_sprite_atlas, name="sprite_atlas"),
 ]
\ No newline at end of file
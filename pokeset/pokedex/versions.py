@@ -0,0 +1,226 @@
+# versions.py
+# Keeps track of what changed, for things cached under a version:
+#  - every Pokemon has an updated_at, which goes up whenever it, or
+#    anything shown with it, changes. Its dashboard row is cached under it
+#    (see dashboard.rows()),
+#  - every profile has a version (and updated_at), which goes up whenever
+#    anything in it changes. Pages showing a profile are cached by
+#    browsers under it (see views.py),
+#  - every Pokemon has a precomputed detail document, see details.py,
+#  - and the words it is found by in a search, see searchindex.py,
+#  - and the buckets it is found by among similar Pokemon, see
+#    similarity.py,
+#  - every profile also has a names_version, which goes up whenever a name
+#    in it is added, changed or deleted, and a fuzzy search index per
+#    process, see fuzzy.py.
+# Signals call these whenever a Pokemon, or one of its locations, moves or
+# abilities, is saved or deleted.
+#
+# Bulk writes (bulk_create(), bulk_update(), update()) don't send signals,
+# so code writing in bulk has to call pokemon_changed() (or
+# sprites_changed(), or names_changed()) itself.
+
+import threading
+
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import details, fuzzy, models, searchindex, similarity
+
+
+# Records that these Pokemon (or their locations, moves or abilities)
+# changed. A few queries, however many Pokemon; their search terms,
+# similarity buckets and details are made again once, when the transaction
+# commits (see _Pending).
+def pokemon_changed(pokemon_ids):
+    pokemon_ids = set(pokemon_ids)
+    if pokemon_ids:
+        _changed(pokemon_ids, pokemon_ids)
+        _pending(reindex=pokemon_ids)
+
+
+# Records that names in a profile were added, changed or deleted in bulk.
+# Every process makes its fuzzy search index of the profile again, on its
+# next search (see fuzzy.py).
+def names_changed(profile_id):
+    models.Profile.objects.filter(id=profile_id).bump_version(names=True)
+
+
+# Records that the sprites of these Pokemon changed. Their evolutions show
+# them too, but searches don't.
+def sprites_changed(pokemon_ids):
+    pokemon_ids = set(pokemon_ids)
+    if pokemon_ids:
+        _changed(pokemon_ids, details.with_evolutions(pokemon_ids))
+
+
+# What has to change along with the data, in the same transaction, so that
+# nothing is cached under an old version: the Pokemon's updated_at, their
+# profiles' versions, and the details showing them, which are rebuilt
+# later on.
+def _changed(pokemon_ids, shown_by):
+    details.forget(shown_by)
+    _pending(rebuild=shown_by)
+    pokemon = models.Pokemon.objects.filter(id__in=pokemon_ids)
+    pokemon.update(updated_at=timezone.now())
+    models.Profile.objects.filter(id__in=pokemon.values("profile_id")).bump_version()
+
+
+# Work left for when the current transaction commits: the Pokemon whose
+# search terms and similarity buckets are made again, and those whose
+# details are rebuilt. However many changes a transaction makes, this is
+# done once, for all of them (outside a transaction, right away).
+class _Pending:
+
+    def __init__(self):
+        self.reindex = set()
+        self.rebuild = set()
+
+    def run(self):
+        if getattr(_local, "pending", None) is self:
+            del _local.pending
+        if self.reindex:
+            searchindex.reindex(self.reindex)
+            similarity.reindex(self.reindex)
+        if self.rebuild:
+            details.rebuild(self.rebuild)
+
+    # Whether this is still waiting for its transaction to commit. Django
+    # drops the on_commit callbacks of a transaction (or savepoint) that
+    # rolls back, and with them, what was pending in it.
+    def waiting(self):
+        return any(callback[1] == self.run for callback in transaction.get_connection().run_on_commit)
+
+
+_local = threading.local()
+
+
+def _pending(reindex=(), rebuild=()):
+    pending = getattr(_local, "pending", None)
+    if pending is not None and pending.waiting():
+        pending.reindex.update(reindex)
+        pending.rebuild.update(rebuild)
+        return
+    pending = _local.pending = _Pending()
+    pending.reindex.update(reindex)
+    pending.rebuild.update(rebuild)
+    transaction.on_commit(pending.run)
+
+
+# The Pokemon whose details show a Pokemon about to be saved or deleted.
+# Looked up beforehand, as a Pokemon no longer shows up in the details of
+# what it used to evolve from (or of what evolved from it, once deleted).
+# So is what a Pokemon about to be saved is searched by, to tell whether
+# that changes.
+@receiver(pre_save, sender=models.Pokemon)
+@receiver(pre_delete, sender=models.Pokemon)
+def _pokemon_changing(instance, origin=None, **kwargs):
+    if _deleting(origin) is models.Profile:
+        return
+    instance._shown_by = details.with_evolutions([instance.id]) if instance.id is not None else set()
+    if kwargs["signal"] is pre_save and instance.id is not None:
+        instance._searched_by = models.Pokemon.objects.filter(id=instance.id).values_list(
+            "name", "type_one", "type_two").first()
+
+
+@receiver(post_save, sender=models.Pokemon)
+def _pokemon_saved(instance, **kwargs):
+    # Saving already set updated_at.
+    shown_by = details.with_evolutions([instance.id]) | getattr(instance, "_shown_by", set())
+    details.forget(shown_by)
+    searched_by = getattr(instance, "_searched_by", None)
+    renamed = searched_by is None or searched_by[0] != instance.name
+    if searched_by != (instance.name, instance.type_one, instance.type_two):
+        _pending(reindex=[instance.id], rebuild=shown_by)
+    else:
+        _pending(rebuild=shown_by)
+    models.Profile.objects.filter(id=instance.profile_id).bump_version(names=renamed)
+    if renamed:
+        fuzzy.name_changed(instance.profile_id, "pokemon", instance.id, instance.name)
+
+
+@receiver(post_delete, sender=models.Pokemon)
+def _pokemon_deleted(instance, origin=None, **kwargs):
+    # Nothing to record for profiles being deleted.
+    if _deleting(origin) is models.Profile:
+        return
+    shown_by = getattr(instance, "_shown_by", set()) - {instance.id}
+    details.forget(shown_by)
+    _pending(rebuild=shown_by)
+    models.Profile.objects.filter(id=instance.profile_id).bump_version(names=True)
+    fuzzy.name_changed(instance.profile_id, "pokemon", instance.id, None)
+
+
+# What is being deleted, when a deletion cascades (None otherwise).
+def _deleting(origin):
+    return origin.model if isinstance(origin, QuerySet) else type(origin) if origin is not None else None
+
+
+@receiver(post_save, sender=models.Findable)
+@receiver(post_delete, sender=models.Findable)
+@receiver(post_save, sender=models.Learnable)
+@receiver(post_delete, sender=models.Learnable)
+@receiver(post_save, sender=models.Capable)
+@receiver(post_delete, sender=models.Capable)
+def _relation_saved(instance, origin=None, **kwargs):
+    # Nothing to record for Pokemon (or profiles) being deleted, and
+    # deleted locations, moves and abilities record all their Pokemon at
+    # once (see _option_deleting).
+    if _deleting(origin) not in (models.Pokemon, models.Profile, models.Location, models.Move, models.Ability):
+        pokemon_changed([instance.pokemon_id])
+
+
+# Adding or removing locations, moves or abilities through the many-to-many
+# managers (e.g. pokemon.can_find_in.set(), as forms do).
+@receiver(m2m_changed, sender=models.Findable)
+@receiver(m2m_changed, sender=models.Learnable)
+@receiver(m2m_changed, sender=models.Capable)
+def _relations_changed(instance, action, reverse, model, pk_set, **kwargs):
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            pokemon_changed([instance.id])
+    elif action in ("post_add", "post_remove"):
+        pokemon_changed(pk_set)
+    elif action == "pre_clear":
+        # The other side (e.g. a Location) is being cleared of its Pokemon;
+        # they can only be found before it happens.
+        pokemon_changed(getattr(instance, HAD_BY[type(instance)]).values_list("id", flat=True))
+
+
+# The Pokemon that have a location, move or ability, by its model.
+HAD_BY = {models.Location: "can_find", models.Move: "can_be_learned_by", models.Ability: "can_be_possessed_by"}
+
+
+# The Pokemon that have a location, move or ability about to be deleted.
+# They are recorded all at once after it is, rather than one at a time as
+# their Findable, Learnable or Capable rows are deleted.
+@receiver(pre_delete, sender=models.Location)
+@receiver(pre_delete, sender=models.Move)
+@receiver(pre_delete, sender=models.Ability)
+def _option_deleting(sender, instance, origin=None, **kwargs):
+    if _deleting(origin) is not models.Profile:
+        instance._had_by = list(getattr(instance, HAD_BY[sender]).values_list("id", flat=True))
+
+
+# New, renamed or deleted locations, moves and abilities show up in the
+# profile's forms. Changing one also changes every Pokemon that has it.
+@receiver(post_save, sender=models.Location)
+@receiver(post_save, sender=models.Move)
+@receiver(post_save, sender=models.Ability)
+@receiver(post_delete, sender=models.Location)
+@receiver(post_delete, sender=models.Move)
+@receiver(post_delete, sender=models.Ability)
+def _option_saved(sender, instance, signal, created=True, origin=None, **kwargs):
+    if signal is post_delete:
+        # Nothing to record for profiles being deleted.
+        if _deleting(origin) is models.Profile:
+            return
+        pokemon_changed(getattr(instance, "_had_by", ()))
+    elif not created:
+        pokemon_changed(getattr(instance, HAD_BY[sender]).values_list("id", flat=True))
+    models.Profile.objects.filter(id=instance.profile_id).bump_version(names=True)
+    kind = {models.Location: "location", models.Move: "move", models.Ability: "ability"}[sender]
+    fuzzy.name_changed(instance.profile_id, kind, instance.id, None if signal is post_delete else instance.name)
@@ -1,20 +1,19 @@
-from xml.dom import ValidationErr
-from django.forms import ValidationError
+from django.conf import settings
 from django.shortcuts import get_object_or_404, render, redirect
-import requests
+from django.urls import reverse
+from django.template.loader import render_to_string
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
 from . import forms
 from django.contrib.auth.decorators import login_required
 from . import models
-from django.http import JsonResponse
-import pandas as pd
-
-# Constants for type effectiveness. Moves, based on the type of that move
-# and the type(s) of the Pokemon that the move is being used against, will
-# have one of these 4 multipliers to damage applied.
-SUPER_EFFECTIVE    = 2.0
-NORMAL_EFFECTIVE   = 1.0
-NOT_VERY_EFFECTIVE = 0.5
-NO_EFFECT          = 0
+from django.http import FileResponse, Http404, JsonResponse, StreamingHttpResponse
+from . import dashboard
+from . import details
+from . import fuzzy
+from . import readmodel
+from . import similarity
+from . import spritecache
 
 # Landing page with basic info about website and links to other parts
 # of website - if not sure where to redirect, should generally go here.
@@ -57,11 +56,10 @@ def get_profiles(req):
         form = forms.NewProfileForm(user=req.user)
     
     # Colour in profile bubbles randomly.
-    profiles = models.Profile.objects.filter(user=req.user).values()
+    profiles = readmodel.profile_rows(models.Profile.objects.for_user(req.user))
     colour_options = ["#94bc4a", "#6a7baf", "#e5c531", "#736c75", "#e397d1", "#cb5f48", "#ea7a3c", "#7da6de", "#846ab6", "#71c558"," 	#cc9f4f", "#70cbd4", "#539ae2"]
     for profile in profiles:
-        id = profile['id']
-        profile['colour'] = colour_options[id % len(colour_options)]
+        profile.colour = colour_options[profile.id % len(colour_options)]
 
     print(profiles)
 
@@ -71,50 +69,140 @@ def get_profiles(req):
     
     return render(req, "profiles.html", context)
 
-# Get all the Pokemon of a profile/save.
+# Find Pokemon by name in all of a user's profiles at once, grouped by
+# profile (see readmodel.search_profiles).
+@login_required
+def get_profile_search(req):
+
+    (groups, truncated) = readmodel.search_profiles(req.user, req.GET.get("q", "").strip())
+    profiles = []
+    for (profile, pokemon) in groups:
+        profiles.append({
+            "id": profile.id,
+            "name": profile.name,
+            "url": reverse("dashboard", args=[profile.id]),
+            "pokemon": [{"id": each.id, "name": each.name, "type_one": each.type_one, "type_two": each.type_two,
+                         "url": reverse("detailed", args=[each.id])} for each in pokemon],
+        })
+    return JsonResponse({"profiles": profiles, "truncated": truncated})
+
+# Get all the Pokemon of a profile/save. The table of Pokemon is filled in
+# a page at a time, from get_dashboard_data. With "?all", the whole table
+# is rendered instead, and sent as it is rendered.
 @login_required
 def get_dashboard(req, profile_id):
 
     # Get the profile of this ID, and must belong to this user.
-    profile_obj = get_object_or_404(models.Profile, id=profile_id, user=req.user)
-    all_pokemon = models.Pokemon.objects.filter(profile=profile_obj)
-
-    for pokemon in all_pokemon:
-        get_type_info(pokemon)
-        update_pokemon_image(pokemon)
-
+    profile_obj = get_object_or_404(models.Profile.objects.for_user(req.user), id=profile_id)
+
+    # The page's rows take their sprites from the atlas it was made with.
+    current = spritecache.current_atlas(profile_obj.id)
+    validators = _profile_validators(profile_obj, current.digest if current else "", "all" in req.GET)
+    not_modified = _not_modified(req, *validators)
+    if not_modified is not None:
+        return not_modified
+
+    # Show the sprites from one atlas image, rather than one image each. The
+    # resolve_sprites worker makes it as sprites are downloaded (see
+    # sprites.update_atlases).
     context = {}
-    context["pokemon_data"] = all_pokemon
     context["profile_id"] = profile_id
+    context["atlas"] = current
+
+    if "all" in req.GET:
+        context["rows"] = ROWS_MARKER
+        response = StreamingHttpResponse(_stream_page(render_to_string("dashboard.html", context, req),
+                                                      dashboard.stream_rows(profile_obj, current)))
+    else:
+        response = render(req, "dashboard.html", context)
+
+    return _with_validators(response, *validators)
+
+# Where the rows of a streamed dashboard go in the rendered page.
+ROWS_MARKER = "<!-- rows -->"
+
+def _stream_page(page, rows):
+    (head, tail) = page.split(ROWS_MARKER, 1)
+    yield head
+    yield from rows
+    yield tail
+
+# One page of the dashboard's table, as JSON (see dashboard.py).
+@login_required
+def get_dashboard_data(req, profile_id):
 
-    return render(req, "dashboard.html", context)
+    profile_obj = get_object_or_404(models.Profile.objects.for_user(req.user), id=profile_id)
+    return JsonResponse(dashboard.table_page(profile_obj, req.GET))
+
+# Names in a profile most like "q", misspelt or not, best first (see fuzzy.py).
+@login_required
+def get_fuzzy_search(req, profile_id):
+
+    profile_obj = get_object_or_404(models.Profile.objects.for_user(req.user), id=profile_id)
+    try:
+        limit = min(max(int(req.GET.get("limit", 10)), 1), fuzzy.MAX_RESULTS)
+    except ValueError:
+        limit = 10
+    kinds = req.GET.getlist("kind") or None
+
+    results = []
+    for (score, kind, object_id, name) in fuzzy.index_for(profile_obj).search(req.GET.get("q", ""), limit, kinds):
+        result = {"kind": kind, "id": object_id, "name": name, "score": round(score, 3)}
+        if kind == "pokemon":
+            result["url"] = reverse("detailed", args=[object_id])
+        results.append(result)
+    return JsonResponse({"results": results})
 
 # Show a Pokemon in detail.
 @login_required
 def get_detailed_view(req, pokemon_id):
 
-    pokemon = get_object_or_404(models.Pokemon, id=pokemon_id)
-    if pokemon.profile.user != req.user:
-        # TO-DO: Create a "permission denied" page
-        return redirect("index")
+    # Only the user's own Pokemon are found, so others' are "not found".
+    pokemon = get_object_or_404(models.Pokemon.objects.for_user(req.user).select_related("detail"), id=pokemon_id)
 
-    get_type_info(pokemon)
-    update_pokemon_image(pokemon)
+    # The page shows other Pokemon (its evolutions, and similar ones) too, so it changes
+    # whenever anything in the profile does.
+    validators = _profile_validators(pokemon.profile, pokemon.id)
+    not_modified = _not_modified(req, *validators)
+    if not_modified is not None:
+        return not_modified
 
+    # Everything shown, but similar Pokemon (see similarity.py), is in the
+    # Pokemon's precomputed details.
     context = {}
-    context["pokemon_data"] = pokemon
+    context["pokemon_data"] = details.document(pokemon)
+    context["similar"] = similarity.most_similar(pokemon)
     context["profile_id"] = pokemon.profile.id
 
-    return render(req, "detailed_view.html", context)
+    return _with_validators(render(req, "detailed_view.html", context), *validators)
+
+# A profile's pages only change when its version does (see versions.py).
+# Browsers keep them, and ask again with the ETag (or Last-Modified) they
+# were sent; while the version is the same, the answer is "304 Not
+# Modified", before any of the page is made. "parts" are anything else the
+# page depends on.
+def _profile_validators(profile, *parts):
+    etag = 'W/"%s"' % "-".join(str(part) for part in (profile.id, profile.version) + parts)
+    return (etag, int(profile.updated_at.timestamp()))
+
+def _not_modified(req, etag, last_modified):
+    response = get_conditional_response(req, etag=etag, last_modified=last_modified)
+    if response is not None:
+        _with_validators(response, etag, last_modified)
+    return response
+
+def _with_validators(response, etag, last_modified):
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    # Check back every time, as a page can change at any moment.
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
 
 # Edit an existing Pokemon.
 @login_required
 def get_edit_pokemon(req, pokemon_id):  
 
-    pokemon = get_object_or_404(models.Pokemon, id=pokemon_id)
-    if pokemon.profile.user != req.user:
-        # TO-DO: Create a "permission denied" page
-        return redirect("index")
+    pokemon = get_object_or_404(models.Pokemon.objects.for_user(req.user), id=pokemon_id)
     
     types = models.Type.choices
 
@@ -124,7 +212,6 @@ def get_edit_pokemon(req, pokemon_id):
             form.save()
             return redirect("detailed", pokemon_id=pokemon.id)
     else:
-        update_pokemon_image(pokemon)
         form = forms.EditPokemonForm(instance=pokemon)
 
     context = {}
@@ -141,7 +228,7 @@ def get_edit_pokemon(req, pokemon_id):
 @login_required
 def get_create_pokemon(req, profile_id):
 
-    profile_obj = get_object_or_404(models.Profile, id=profile_id, user=req.user)
+    profile_obj = get_object_or_404(models.Profile.objects.for_user(req.user), id=profile_id)
     
     if req.method == "POST":
         form = forms.NewPokemonForm(req.POST, profile=profile_obj)
@@ -166,7 +253,7 @@ def new_location(req, profile_id):
 
     if req.method == "POST":
         data = req.POST
-        profile = get_object_or_404(models.Profile, id=profile_id, user=req.user)
+        profile = get_object_or_404(models.Profile.objects.for_user(req.user), id=profile_id)
         new_location = models.Location.objects.create(name=data["location_name"], profile=profile)
         new_location.full_clean()
         new_location.save()
@@ -178,7 +265,7 @@ def new_move(req, profile_id):
 
     if req.method == "POST":
         data = req.POST
-        profile = get_object_or_404(models.Profile, id=profile_id, user=req.user)
+        profile = get_object_or_404(models.Profile.objects.for_user(req.user), id=profile_id)
         new_move = models.Move.objects.create(name=data["move_name"], type=data["move_type"], profile=profile)
         new_move.full_clean()
         new_move.save()
@@ -190,185 +277,96 @@ def new_ability(req, profile_id):
 
     if req.method == "POST":
         data = req.POST
-        profile = get_object_or_404(models.Profile, id=profile_id, user=req.user)
+        profile = get_object_or_404(models.Profile.objects.for_user(req.user), id=profile_id)
         new_ability = models.Ability.objects.create(name=data["ability_name"], profile=profile)
         new_ability.full_clean()
         new_ability.save()
         ability_dict = {"name": new_ability.name, "pk": new_ability.id}
         return JsonResponse(ability_dict, status=200)
 
-# Fetches "image_url" field of a Pokemon instance from PokeAPI based on its name.
-def update_pokemon_image(pokemon):
-    if not pokemon.image_url:
-        try: 
-            response = requests.get("https://pokeapi.co/api/v2/pokemon/" + pokemon.name.lower(), params={"format": "json"})
-            pokemon.image_url = response.json()["sprites"]["front_default"]
-            try:
-                pokemon.full_clean()
-                pokemon.save()
-            except ValidationError as e:
-                pass
-        except requests.exceptions.RequestException as e:
-            pass
-
-# Adds effective and ineffective attributes to a Pokemon instance for all
-# possible types.
-def get_type_info(pokemon):
-    # TO-DO: Add "super effective against" and "no effect against" attributes.
-    pokemon.offensive_4 = []
-    pokemon.offensive_2 = []
-    pokemon.offensive_05 = []
-    pokemon.offensive_025 = []
-    pokemon.offensive_0 = []
-    for (type, label) in models.Type.choices:
-        # Really inelegant way of dropping the second type if there is none.
-        if pokemon.type_two:
-            if abs(type_chart.loc[type, [pokemon.type_one, pokemon.type_two]].product() - SUPER_EFFECTIVE) < 0.01:
-                pokemon.offensive_2.append(type)
-            elif abs(type_chart.loc[type, [pokemon.type_one, pokemon.type_two]].product() - SUPER_EFFECTIVE*SUPER_EFFECTIVE) < 0.01:
-                pokemon.offensive_4.append(type)
-            elif abs(type_chart.loc[type, [pokemon.type_one, pokemon.type_two]].product() - NOT_VERY_EFFECTIVE) < 0.01:
-                pokemon.offensive_05.append(type)
-            elif abs(type_chart.loc[type, [pokemon.type_one, pokemon.type_two]].product() - NOT_VERY_EFFECTIVE*NOT_VERY_EFFECTIVE) < 0.01:
-                pokemon.offensive_025.append(type)
-            elif abs(type_chart.loc[type, [pokemon.type_one, pokemon.type_two]].product() - NO_EFFECT) < 0.01:
-                pokemon.offensive_0.append(type)
-        else:
-            if abs(type_chart.loc[type, [pokemon.type_one]].product() - SUPER_EFFECTIVE) < 0.01:
-                pokemon.offensive_2.append(type)
-            elif abs(type_chart.loc[type, [pokemon.type_one]].product() - SUPER_EFFECTIVE*SUPER_EFFECTIVE) < 0.01:
-                pokemon.offensive_4.append(type)
-            elif abs(type_chart.loc[type, [pokemon.type_one]].product() - NOT_VERY_EFFECTIVE) < 0.01:
-                pokemon.offensive_05.append(type)
-            elif abs(type_chart.loc[type, [pokemon.type_one]].product() - NOT_VERY_EFFECTIVE*NOT_VERY_EFFECTIVE) < 0.01:
-                pokemon.offensive_025.append(type)
-            elif abs(type_chart.loc[type, [pokemon.type_one]].product() - NO_EFFECT) < 0.01:
-                pokemon.offensive_0.append(type)
+# Serve a Pokemon's sprite from the sprite cache. The URL holds a digest of
+# the sprite's source URL, so a new sprite gets a new URL, and the response
+# can be cached by browsers forever. Sprites are only ever downloaded by the
+# resolve_sprites worker; until it has, this redirects to the original.
+@login_required
+def get_sprite(req, pokemon_id, digest, size):
+
+    if size not in settings.SPRITE_THUMBNAIL_SIZES:
+        raise Http404("No such sprite size.")
+
+    image_url = models.Pokemon.objects.for_user(req.user).filter(id=pokemon_id).values_list("image_url", flat=True).first()
+    if not image_url or spritecache.url_digest(image_url) != digest:
+        raise Http404("No such sprite.")
+    try:
+        cached = spritecache.cached_thumbnail(digest, size)
+    except spritecache.SpriteUnavailable:
+        cached = None
+    if cached is None:
+        # Not downloaded yet (or it can't be): don't let this be cached.
+        return redirect(image_url)
+
+    (path, content_digest) = cached
+    return _immutable_png(req, path, content_digest)
+
+# Serve a sprite atlas (see spritecache.atlas_for), only to the owner of
+# its profile. Atlases never change, so browsers can cache them forever.
+@login_required
+def get_sprite_atlas(req, digest):
+
+    profile_ids = models.Profile.objects.for_user(req.user).values_list("id", flat=True)
+    if not any(digest in spritecache.atlas_digests(profile_id) for profile_id in profile_ids):
+        raise Http404("No such sprite atlas.")
+    path = spritecache.atlas_path(digest)
+    if not path.exists():
+        raise Http404("No such sprite atlas.")
+    return _immutable_png(req, path, digest)
+
+def _immutable_png(req, path, digest):
+    etag = '"%s"' % digest
+    response = get_conditional_response(req, etag=etag)
+    if response is None:
+        response = FileResponse(open(path, "rb"), content_type="image/png")
+    # Private, as only their owners may see them.
+    response["Cache-Control"] = "private, max-age=31536000, immutable"
+    response["ETag"] = etag
+    return response
 
 @login_required
 def delete_profile(req, profile_id):
 
-    profile = get_object_or_404(models.Profile, id = profile_id)
-    if req.user == profile.user:
-        profile.delete()
-        return redirect("profiles")
-    else:
-        redirect("index")
+    profile = get_object_or_404(models.Profile.objects.for_user(req.user), id = profile_id)
+    profile.delete()
+    return redirect("profiles")
 
 
 @login_required
 def delete_pokemon(req, pokemon_id):
     
-    pokemon = get_object_or_404(models.Pokemon, id=pokemon_id)
-    profile = pokemon.profile
-    if req.user == profile.user:
-        pokemon.delete()
-        return redirect('dashboard', profile_id=profile.id)
-    else:
-        redirect('index')
+    pokemon = get_object_or_404(models.Pokemon.objects.for_user(req.user), id=pokemon_id)
+    pokemon.delete()
+    return redirect('dashboard', profile_id=pokemon.profile_id)
 
 @login_required
 def delete_moves(req, pokemon_id):
     
-    pokemon = get_object_or_404(models.Pokemon, id=pokemon_id)
-    profile = pokemon.profile
-    if req.user == profile.user:
-        for move in pokemon.can_learn.all():
-            move.delete()
-        return redirect("edit_pokemon", pokemon_id=pokemon_id)
-    else:
-        redirect('index')
+    pokemon = get_object_or_404(models.Pokemon.objects.for_user(req.user), id=pokemon_id)
+    for move in pokemon.can_learn.all():
+        move.delete()
+    return redirect("edit_pokemon", pokemon_id=pokemon_id)
 
 @login_required
 def delete_abilities(req, pokemon_id):
     
-    pokemon = get_object_or_404(models.Pokemon, id=pokemon_id)
-    profile = pokemon.profile
-    if req.user == profile.user:
-        for ability in pokemon.abilities.all():
-            ability.delete()
-        return redirect("edit_pokemon", pokemon_id=pokemon_id)
-    else:
-        redirect('index')
+    pokemon = get_object_or_404(models.Pokemon.objects.for_user(req.user), id=pokemon_id)
+    for ability in pokemon.abilities.all():
+        ability.delete()
+    return redirect("edit_pokemon", pokemon_id=pokemon_id)
 
 @login_required
 def delete_locations(req, pokemon_id):
     
-    pokemon = get_object_or_404(models.Pokemon, id=pokemon_id)
-    profile = pokemon.profile
-    if req.user == profile.user:
-        for location in pokemon.can_find_in.all():
-            print(location)
-            location.delete()
-        return redirect("edit_pokemon", pokemon_id=pokemon_id)
-    else:
-        redirect('index')
-
-# For type weakness and strength
-# Adapted from https://github.com/filipekiss/pokemon-type-chart/blob/master/types.json
-# Using data fromm https://img.pokemondb.net/images/typechart-gen2345.png
-
-type_chart = pd.DataFrame(NORMAL_EFFECTIVE, 
-              index=map(lambda x: x[0], models.Type.choices), 
-              columns=map(lambda x: x[0], models.Type.choices))
-
-type_chart.loc["NOR", ["GHO"]]                                           = NO_EFFECT
-type_chart.loc["NOR", ["ROC", "STE"]]                                    = NOT_VERY_EFFECTIVE
-
-type_chart.loc["FIR", ["FIR", "WAT", "ROC", "DRA"]]                      = NOT_VERY_EFFECTIVE
-type_chart.loc["FIR", ["GRA", "ICE", "BUG", "STE"]]                      = SUPER_EFFECTIVE
-
-type_chart.loc["WAT", ["WAT", "GRA", "DRA"]]                             = NOT_VERY_EFFECTIVE
-type_chart.loc["WAT", ["FIR", "GRO", "ROC"]]                             = SUPER_EFFECTIVE
-
-type_chart.loc["ELE", ["GRO"]]                                           = NO_EFFECT
-type_chart.loc["ELE", ["ELE", "GRA", "DRA"]]                             = NOT_VERY_EFFECTIVE
-type_chart.loc["ELE", ["WAT", "FLY"]]                                    = SUPER_EFFECTIVE
-
-type_chart.loc["GRA", ["FIR", "GRA", "POI", "FLY", "BUG", "DRA", "STE"]] = NOT_VERY_EFFECTIVE
-type_chart.loc["GRA", ["WAT", "GRO", "ROC"]]                             = SUPER_EFFECTIVE
-
-type_chart.loc["ICE", ["FIR", "WAT", "ICE", "STE"]]                      = NOT_VERY_EFFECTIVE
-type_chart.loc["ICE", ["GRA", "GRO", "FLY", "DRA"]]                      = SUPER_EFFECTIVE
-
-type_chart.loc["FIG", ["GHO"]]                                           = NO_EFFECT
-type_chart.loc["FIG", ["POI", "FLY", "PSY", "BUG", "FAI"]]               = NOT_VERY_EFFECTIVE
-type_chart.loc["FIG", ["NOR", "ICE", "ROC", "DAR", "STE"]]               = SUPER_EFFECTIVE
-
-type_chart.loc["POI", ["STE"]]                                           = NO_EFFECT
-type_chart.loc["POI", ["POI", "GRO", "ROC", "GHO"]]                      = NOT_VERY_EFFECTIVE
-type_chart.loc["POI", ["GRA", "FAI"]]                                    = SUPER_EFFECTIVE
-
-type_chart.loc["GRO", ["FLY"]]                                           = NO_EFFECT
-type_chart.loc["GRO", ["GRA", "BUG"]]                                    = NOT_VERY_EFFECTIVE
-type_chart.loc["GRO", ["FIR", "ELE", "POI", "ROC", "STE"]]               = SUPER_EFFECTIVE
-
-type_chart.loc["FLY", ["ELE", "ROC", "STE"]]                             = NOT_VERY_EFFECTIVE
-type_chart.loc["FLY", ["GRA", "FIG", "BUG"]]                             = SUPER_EFFECTIVE
-
-type_chart.loc["PSY", ["DAR"]]                                           = NO_EFFECT
-type_chart.loc["PSY", ["PSY", "STE"]]                                    = NOT_VERY_EFFECTIVE
-type_chart.loc["PSY", ["FIG", "POI"]]                                    = SUPER_EFFECTIVE
-
-type_chart.loc["BUG", ["FIR", "FIG", "POI", "FLY", "GHO", "STE", "FAI"]] = NOT_VERY_EFFECTIVE
-type_chart.loc["BUG", ["GRA", "PSY", "DAR"]]                             = SUPER_EFFECTIVE
-
-type_chart.loc["ROC", ["FIG", "GRO", "STE"]]                             = NOT_VERY_EFFECTIVE
-type_chart.loc["ROC", ["FIR", "ICE", "FLY", "BUG"]]                      = SUPER_EFFECTIVE
-
-type_chart.loc["GHO", ["NOR"]]                                           = NO_EFFECT
-type_chart.loc["GHO", ["DAR", "STE"]]                                    = NOT_VERY_EFFECTIVE
-type_chart.loc["GHO", ["PSY", "GHO"]]                                    = SUPER_EFFECTIVE
-
-type_chart.loc["DRA", ["FAI"]]                                           = NO_EFFECT
-type_chart.loc["DRA", ["STE"]]                                           = NOT_VERY_EFFECTIVE
-type_chart.loc["DRA", ["DRA"]]                                           = SUPER_EFFECTIVE
-
-type_chart.loc["DAR", ["FIG", "DAR", "STE", "FAI"]]                      = NOT_VERY_EFFECTIVE
-type_chart.loc["DAR", ["PSY", "GHO"]]                                    = SUPER_EFFECTIVE
-
-type_chart.loc["STE", ["FIR", "WAT", "ELE", "STE"]]                      = NOT_VERY_EFFECTIVE
-type_chart.loc["STE", ["ICE", "ROC", "FAI"]]                             = SUPER_EFFECTIVE
-
-type_chart.loc["FAI", ["WAT", "POI", "STE"]]                             = NOT_VERY_EFFECTIVE
-type_chart.loc["FAI", ["FIG", "DRA", "DAR"]]                             = SUPER_EFFECTIVE
\ No newline at end of file
+    pokemon = get_object_or_404(models.Pokemon.objects.for_user(req.user), id=pokemon_id)
+    for location in pokemon.can_find_in.all():
+        print(location)
+        location.delete()
+    return redirect("edit_pokemon", pokemon_id=pokemon_id)
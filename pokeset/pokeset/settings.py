@@ -132,6 +132,42 @@ CRISPY_TEMPLATE_PACK = 'bootstrap4'
 LOGIN_REDIRECT_URL = 'profiles'
 LOGOUT_REDIRECT_URL = 'index'
 
+# PokeAPI, which Pokemon sprites are looked up on (see pokedex/sprites.py).
+# Point this at a local server to run without internet access.
+POKEAPI_URL = 'https://pokeapi.co/api/v2/'
+
+# Set to True to never call PokeAPI, and only use the local mirror of its
+# data (see the import_pokeapi_dump command).
+POKEAPI_OFFLINE = False
+
+# How many sprite lookups may be in flight at once.
+POKEAPI_WORKERS = 8
+
+# Seconds to wait for PokeAPI to accept a connection, and to send data.
+POKEAPI_CONNECT_TIMEOUT = 3.05
+POKEAPI_READ_TIMEOUT = 10
+
+# How often a failed request is retried, and the seconds to wait before
+# the first retry (doubled for every retry after that).
+POKEAPI_RETRIES = 2
+POKEAPI_RETRY_BACKOFF = 0.5
+
+# After this many requests in a row fail, stop calling PokeAPI for
+# POKEAPI_COOL_DOWN seconds.
+POKEAPI_FAILURE_THRESHOLD = 5
+POKEAPI_COOL_DOWN = 60
+
+# Seconds to remember that PokeAPI doesn't know a species name, before
+# looking it up again.
+POKEAPI_NEGATIVE_TTL = 60 * 60 * 24 * 7
+
+# Sprites are downloaded once into this folder and served from here, as
+# thumbnails of these sizes (in pixels). Only images on these hosts are
+# downloaded.
+SPRITE_CACHE_DIR = BASE_DIR / 'sprite_cache'
+SPRITE_THUMBNAIL_SIZES = (64, 160)
+SPRITE_HOSTS = ['raw.githubusercontent.com']
+
 
 
 default_app_config = 'full.python.path.to.your.app.foo.apps.FooConfig'